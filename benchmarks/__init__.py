@@ -0,0 +1,4 @@
+import os
+
+# src.ms_apis reads the upstream host at import, benchmarks never connect to it
+os.environ.setdefault("MAJSOUL_HOST", "https://game.maj-soul.com")
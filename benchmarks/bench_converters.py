@@ -0,0 +1,48 @@
+"""Compare message_to_dict with the json round trip it replaces
+
+Usage:
+    python -m benchmarks.bench_converters
+"""
+import json
+import timeit
+import typing as t
+
+from google.protobuf.json_format import MessageToJson
+import ms.protocol_pb2 as pb
+
+from benchmarks.samples import make_game_record
+from src.converters import message_to_dict
+from src.ms_apis import process_game_record
+
+
+def convert_with_json(messages: t.List[t.Any]) -> t.List[t.Dict]:
+    return [json.loads(MessageToJson(message)) for message in messages]
+
+
+def convert_directly(messages: t.List[t.Any]) -> t.List[t.Dict]:
+    return [message_to_dict(message) for message in messages]
+
+
+def main() -> None:
+    res = make_game_record(rounds=16, turns=70)
+    # decode once so only the dict conversion is measured
+    messages = [res]
+    details = pb.GameDetailRecords.FromString(pb.Wrapper.FromString(res.data).data)
+    for item in details.records:
+        wrapper = pb.Wrapper.FromString(item)
+        messages.append(getattr(pb, wrapper.name[4:]).FromString(wrapper.data))
+
+    assert convert_with_json(messages) == convert_directly(messages)
+    print(f"{len(messages)} messages, {len(process_game_record(res))} records")
+
+    for name, func in (
+        ("json round trip", convert_with_json),
+        ("message_to_dict", convert_directly),
+    ):
+        number = 20
+        best = min(timeit.repeat(lambda: func(messages), number=number, repeat=5))
+        print(f"{name:>16}: {best / number * 1000:8.2f} ms per game")
+
+
+if __name__ == "__main__":
+    main()
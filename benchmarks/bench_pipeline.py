@@ -0,0 +1,218 @@
+"""Measure each stage of the decode -> validate -> summarize pipeline
+
+Every game of the corpus runs through the stages behind /uuid-raw, /uuid and
+/uuid-csv. Each stage reports its best time and, in a separate traced run,
+the memory it retains, its peak memory and the number of memory blocks it
+leaves allocated.
+
+Usage:
+    python -m benchmarks.bench_pipeline [--fixtures PATH] [--check | --update]
+
+--update writes the results to the baseline file, --check exits with status 1
+when a stage got slower or uses more memory than its baseline allows. Times
+depend on the machine, so update the baseline where the check runs.
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+import typing as t
+
+import ms.protocol_pb2 as pb
+
+from benchmarks.samples import make_game_record
+from src.converters import message_to_dict
+from src.records import make_log, process_game_record
+from src.replays import FixtureStore
+from src.summaries import (
+    SUMMARY_RECORD_NAMES,
+    make_csv_row,
+    summarize_game_record,
+    summarize_log,
+)
+from src.utils import iter_csv_lines
+from src.validations import validate_log
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+Stage = t.Callable[[], t.Any]
+Result = t.Dict[str, float]
+
+# changes below these are noise, whatever the relative change is
+MIN_TIME_CHANGE_MS = 0.01
+MIN_MEMORY_CHANGE_KIB = 4.0
+MIN_BLOCKS_CHANGE = 16
+
+
+def make_corpus(fixtures_path: str = "") -> t.Dict[str, bytes]:
+    """Build serialized game records to measure
+
+    Args:
+        fixtures_path (str, optional): fixture directory of recorded games to add
+
+    Returns:
+        Dict[str, bytes]: serialized ResGameRecord of each case
+    """
+    corpus = {
+        "short": make_game_record(rounds=4, turns=40),
+        "long": make_game_record(rounds=16, turns=70),
+        "long-actions": make_game_record(rounds=16, turns=70, new_format=True),
+        "yakuman": make_game_record(rounds=16, turns=20, yakuman=True),
+    }
+    cases = {name: res.SerializeToString() for name, res in corpus.items()}
+    if fixtures_path:
+        store = FixtureStore(fixtures_path)
+        for uuid in store.uuids():
+            data = store.load_game_record(uuid)
+            if data is not None:
+                cases[uuid] = data
+    return cases
+
+
+def make_stages(data: bytes) -> t.Dict[str, Stage]:
+    # inputs of each stage are prepared up front so stages are measured alone
+    res = pb.ResGameRecord.FromString(data)
+    log = make_log(res, SUMMARY_RECORD_NAMES)
+    summary = summarize_log(log)
+
+    return {
+        "parse": lambda: pb.ResGameRecord.FromString(data),
+        "decode": lambda: process_game_record(res),
+        "decode-summary-records": lambda: process_game_record(
+            res, SUMMARY_RECORD_NAMES
+        ),
+        "head": lambda: message_to_dict(res, exclude_fields=("data",)),
+        "validate": lambda: validate_log(log),
+        "summarize": lambda: summarize_log(log),
+        # what /uuid and /uuid-csv run instead of decode + head + summarize
+        "summarize-record": lambda: summarize_game_record(res),
+        "csv": lambda: list(iter_csv_lines([make_csv_row(summary)])),
+    }
+
+
+def measure(stage: Stage, min_time: float = 0.1) -> Result:
+    number, elapsed = timeit.Timer(stage).autorange()
+    number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    best = min(timeit.repeat(stage, number=number, repeat=5)) / number
+
+    tracemalloc.start()
+    try:
+        result = stage()
+        retained, peak = tracemalloc.get_traced_memory()
+        # blocks allocated by the stage and still alive, its result included
+        blocks = len(tracemalloc.take_snapshot().traces)
+    finally:
+        tracemalloc.stop()
+    del result
+
+    return {
+        "ms": round(best * 1000, 4),
+        "retained_kib": round(retained / 1024, 1),
+        "peak_kib": round(peak / 1024, 1),
+        "blocks": blocks,
+    }
+
+
+def run(cases: t.Dict[str, bytes]) -> t.Dict[str, t.Dict[str, Result]]:
+    results = {}  # type: t.Dict[str, t.Dict[str, Result]]
+    for name, data in cases.items():
+        results[name] = {
+            stage_name: measure(stage)
+            for stage_name, stage in make_stages(data).items()
+        }
+    return results
+
+
+def print_results(results: t.Dict[str, t.Dict[str, Result]]) -> None:
+    print(
+        f"{'case':>14} {'stage':>24} {'ms':>10} {'retained KiB':>13} {'peak KiB':>10}"
+        f" {'blocks':>8}"
+    )
+    for name, stages in results.items():
+        for stage_name, result in stages.items():
+            print(
+                f"{name[:14]:>14} {stage_name:>24} {result['ms']:10.4f}"
+                f" {result['retained_kib']:13.1f} {result['peak_kib']:10.1f}"
+                f" {result['blocks']:8d}"
+            )
+
+
+def find_regressions(
+    results: t.Dict[str, t.Dict[str, Result]],
+    baseline: t.Dict[str, t.Dict[str, Result]],
+    time_tolerance: float,
+    memory_tolerance: float,
+) -> t.List[str]:
+    """Compare results with baseline
+
+    Cases, stages and measures missing from the baseline are skipped, and
+    changes too small to measure reliably are ignored.
+
+    Args:
+        results (Dict): results of run
+        baseline (Dict): results stored by --update
+        time_tolerance (float): allowed relative slowdown
+        memory_tolerance (float): allowed relative growth of peak memory and
+            of allocated blocks
+
+    Returns:
+        List[str]: description of each regression
+    """
+    regressions = []
+    for name, stages in results.items():
+        for stage_name, result in stages.items():
+            expected = baseline.get(name, {}).get(stage_name)
+            if expected is None:
+                continue
+            for key, tolerance, min_change in (
+                ("ms", time_tolerance, MIN_TIME_CHANGE_MS),
+                ("peak_kib", memory_tolerance, MIN_MEMORY_CHANGE_KIB),
+                ("blocks", memory_tolerance, MIN_BLOCKS_CHANGE),
+            ):
+                if key not in expected:
+                    continue
+                limit = max(expected[key] * (1 + tolerance), expected[key] + min_change)
+                if result[key] > limit:
+                    regressions.append(
+                        f"{name} {stage_name}: {key} {result[key]} > {limit:.4f}"
+                        f" (baseline {expected[key]})"
+                    )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fixtures", default="", help="fixture directory to add")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--check", action="store_true", help="fail on regressions")
+    group.add_argument("--update", action="store_true", help="write baseline")
+    parser.add_argument("--time-tolerance", type=float, default=1.0)
+    parser.add_argument("--memory-tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = run(make_corpus(args.fixtures))
+    print_results(results)
+
+    if args.update:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+    elif args.check:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(
+            results, baseline, args.time_tolerance, args.memory_tolerance
+        )
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions")
+
+
+if __name__ == "__main__":
+    main()
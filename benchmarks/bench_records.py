@@ -0,0 +1,54 @@
+"""Measure per-record overhead of decoding round records
+
+Usage:
+    python -m benchmarks.bench_records
+"""
+import timeit
+import typing as t
+
+import ms.protocol_pb2 as pb
+
+from benchmarks.samples import make_game_record
+from src.converters import message_to_dict
+from src.records import GameRecordView
+
+
+def decode_with_getattr(items: t.Sequence[bytes]) -> t.List[t.Dict]:
+    records = []
+    for item in items:
+        round_record_wrapper = pb.Wrapper()
+        round_record_wrapper.ParseFromString(item)
+        round_record_classname = round_record_wrapper.name[4:]
+        round_record_class = getattr(pb, round_record_classname)
+        round_record = round_record_class()
+        round_record.ParseFromString(round_record_wrapper.data)
+        records.append(
+            {"name": round_record_classname, "data": message_to_dict(round_record)}
+        )
+    return records
+
+
+def decode_with_registry(view: GameRecordView) -> t.List[t.Dict]:
+    return [record.to_dict() for record in view]
+
+
+def main() -> None:
+    res = make_game_record(rounds=16, turns=70)
+    details = pb.GameDetailRecords.FromString(pb.Wrapper.FromString(res.data).data)
+    items = list(details.records)
+    view = GameRecordView(res)
+    assert decode_with_getattr(items) == decode_with_registry(view)
+
+    print(f"{len(items)} records")
+    for name, func in (
+        ("getattr", lambda: decode_with_getattr(items)),
+        ("registry", lambda: decode_with_registry(view)),
+        ("registry, RecordHule only", lambda: list(view.filter({"RecordHule"}))),
+    ):
+        number = 20
+        best = min(timeit.repeat(func, number=number, repeat=5))
+        print(f"{name:>26}: {best / number / len(items) * 1e6:6.2f} us per record")
+
+
+if __name__ == "__main__":
+    main()
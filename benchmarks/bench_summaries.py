@@ -0,0 +1,91 @@
+"""Compare seat-indexed summaries with the linear scans they replace
+
+Usage:
+    python -m benchmarks.bench_summaries
+"""
+import timeit
+import typing as t
+
+from benchmarks.samples import make_game_record
+from src.consts import IMPORTANT_YAKUS, YAKU_MAP
+from src.converters import message_to_dict
+from src.ms_apis import process_game_record
+from src.summaries import (
+    SUMMARY_RECORD_NAMES,
+    Account,
+    GameSummary,
+    Hule,
+    NotedYaku,
+    PlayerRank,
+    PlayerResult,
+    build_summary,
+)
+
+
+def build_summary_with_scans(
+    accounts: t.List[Account], results: t.List[PlayerResult], hules: t.List[Hule]
+) -> GameSummary:
+    players = []
+    for result in results:
+        for account in accounts:
+            if account.seat == result.seat:
+                players.append((account, result.final_point))
+                break
+    players.sort(key=lambda player: player[1], reverse=True)
+    player_ranks = [
+        PlayerRank(account.id, account.seat, account.nickname, final_point, i + 1)
+        for i, (account, final_point) in enumerate(players)
+    ]
+    noted_yakus = []
+    for hule in hules:
+        is_important = False
+        for yaku in (YAKU_MAP[fan_id] for fan_id in hule.fan_ids):
+            if yaku in IMPORTANT_YAKUS:
+                is_important = True
+                for player in player_ranks:
+                    if player.seat == hule.seat:
+                        noted_yakus.append(NotedYaku(yaku, player))
+                        break
+        if not is_important and hule.fan_count >= 13:
+            for player in player_ranks:
+                if player.seat == hule.seat:
+                    noted_yakus.append(NotedYaku("헤아림역만", player))
+                    break
+    return GameSummary("", 0, 0, 0, player_ranks, noted_yakus)
+
+
+def main() -> None:
+    res = make_game_record(rounds=16, turns=8, yakuman=True)
+    data = message_to_dict(res)
+    records = process_game_record(res, record_names=SUMMARY_RECORD_NAMES)
+    accounts = [
+        Account(account["accountId"], account.get("seat", 0), account["nickname"])
+        for account in data["head"]["accounts"]
+    ]
+    results = [
+        PlayerResult(result.get("seat", 0), result.get("partPoint1", 0))
+        for result in data["head"]["result"]["players"]
+    ]
+    # a yakuman on every win, each listed with a few ordinary fans
+    hules = [
+        Hule(hule.get("seat", 0), [2, 12, 31] + [fan["id"] for fan in hule["fans"]], 13)
+        for record in records
+        for hule in record["data"]["hules"]
+    ] * 8
+
+    def indexed() -> GameSummary:
+        return build_summary("", 0, 0, 0, accounts, results, hules)
+
+    def scans() -> GameSummary:
+        return build_summary_with_scans(accounts, results, hules)
+
+    assert indexed() == scans()
+    print(f"{len(hules)} hules")
+    for name, func in (("linear scans", scans), ("seat index", indexed)):
+        number = 200
+        best = min(timeit.repeat(func, number=number, repeat=5))
+        print(f"{name:>12}: {best / number * 1e6:8.1f} us per game")
+
+
+if __name__ == "__main__":
+    main()
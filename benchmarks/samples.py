@@ -0,0 +1,146 @@
+import random
+import typing as t
+
+import ms.protocol_pb2 as pb
+
+TILES = [f"{number}{suit}" for suit in "mps" for number in range(10)] + [
+    f"{number}z" for number in range(1, 8)
+]
+
+
+def wrap(message: t.Any) -> bytes:
+    wrapper = pb.Wrapper()
+    wrapper.name = ".lq." + message.DESCRIPTOR.name
+    wrapper.data = message.SerializeToString()
+    return wrapper.SerializeToString()
+
+
+def make_new_round(rng: random.Random, ju: int) -> pb.RecordNewRound:
+    record = pb.RecordNewRound()
+    record.chang = ju // 4
+    record.ju = ju % 4
+    record.scores.extend([25000, 25000, 25000, 25000])
+    record.dora = rng.choice(TILES)
+    record.doras.append(record.dora)
+    for tiles in (record.tiles0, record.tiles1, record.tiles2, record.tiles3):
+        tiles.extend(rng.choice(TILES) for _ in range(13))
+    record.tiles0.append(rng.choice(TILES))
+    record.left_tile_count = 69
+    record.md5 = "%032x" % rng.getrandbits(128)
+    return record
+
+
+def make_hule(rng: random.Random, yakuman: bool) -> pb.RecordHule:
+    record = pb.RecordHule()
+    hule = record.hules.add()
+    hule.seat = rng.randrange(4)
+    hule.hand.extend(rng.choice(TILES) for _ in range(13))
+    hule.hu_tile = rng.choice(TILES)
+    hule.zimo = rng.random() < 0.5
+    fan_ids = [42] if yakuman else [2, 12, 31]
+    for fan_id in fan_ids:
+        fan = hule.fans.add()
+        fan.id = fan_id
+        fan.val = 13 if yakuman else 1
+    hule.count = 13 if yakuman else 3
+    hule.fu = 30
+    hule.point_sum = 32000 if yakuman else 3900
+    record.old_scores.extend([25000, 25000, 25000, 25000])
+    record.delta_scores.extend([hule.point_sum, -hule.point_sum, 0, 0])
+    record.scores.extend(
+        old + delta for old, delta in zip(record.old_scores, record.delta_scores)
+    )
+    return record
+
+
+def make_round(rng: random.Random, ju: int, turns: int, yakuman: bool) -> t.List[bytes]:
+    items = [wrap(make_new_round(rng, ju))]
+    left_tile_count = 69
+    for turn in range(turns):
+        seat = turn % 4
+        if turn:
+            deal = pb.RecordDealTile()
+            deal.seat = seat
+            deal.tile = rng.choice(TILES)
+            left_tile_count -= 1
+            deal.left_tile_count = left_tile_count
+            items.append(wrap(deal))
+        discard = pb.RecordDiscardTile()
+        discard.seat = seat
+        discard.tile = rng.choice(TILES)
+        discard.moqie = rng.random() < 0.3
+        items.append(wrap(discard))
+        if turn % 11 == 5:
+            call = pb.RecordChiPengGang()
+            call.seat = (seat + 1) % 4
+            call.type = 1
+            call.tiles.extend([discard.tile] * 3)
+            call.froms.extend([seat, call.seat, call.seat])
+            items.append(wrap(call))
+    if ju % 3 == 2:
+        no_tile = pb.RecordNoTile()
+        no_tile.players.add().tingpai = True
+        items.append(wrap(no_tile))
+    else:
+        items.append(wrap(make_hule(rng, yakuman)))
+    return items
+
+
+def make_game_record(
+    rounds: int = 8,
+    turns: int = 60,
+    new_format: bool = False,
+    yakuman: bool = False,
+    seed: int = 0,
+) -> pb.ResGameRecord:
+    """Build a synthetic game record shaped like fetchGameRecord responses
+
+    Args:
+        rounds (int, optional): number of rounds
+        turns (int, optional): number of discards per round
+        new_format (bool, optional): store rounds as actions instead of records
+        yakuman (bool, optional): make every win a kokushi musou
+        seed (int, optional): seed of random tiles
+
+    Returns:
+        ResGameRecord: game record
+    """
+    rng = random.Random(seed)
+    details = pb.GameDetailRecords()
+    for ju in range(rounds):
+        for item in make_round(rng, ju, turns, yakuman):
+            if new_format:
+                action = details.actions.add()
+                action.type = 1
+                action.result = item
+            else:
+                details.records.append(item)
+
+    res = pb.ResGameRecord()
+    head = res.head
+    head.uuid = "000000-00000000-0000-0000-0000-{:012d}".format(seed)
+    head.start_time = 1621937111
+    head.end_time = 1621938770
+    head.config.category = 1
+    head.config.meta.room_id = 20496
+    head.config.mode.mode = 2
+    rule = head.config.mode.detail_rule
+    rule.bianjietishi = True
+    rule.dora_count = 3
+    rule.fandian = 30000
+    rule.fanfu = 1
+    rule.init_point = 25000
+    rule.shiduan = 1
+    rule.time_add = 20
+    rule.time_fixed = 5
+    for seat, point in enumerate([36400, 30600, 29100, 3900]):
+        account = head.accounts.add()
+        account.account_id = 10000000 + seat
+        account.seat = seat
+        account.nickname = f"player{seat}"
+        player = head.result.players.add()
+        player.seat = seat
+        player.part_point_1 = point
+        player.total_point = point - 25000
+    res.data = wrap(details)
+    return res
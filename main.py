@@ -1,6 +1,6 @@
 import logging
 
-from src import create_app
+from src import create_app, create_asgi_app
 
 logging.basicConfig(
     level=logging.INFO,
@@ -9,3 +9,4 @@ logging.basicConfig(
 )
 
 app = create_app()
+asgi_app = create_asgi_app(app)
@@ -1,15 +1,56 @@
+import hashlib
+import os
 import typing as t
 
 from flask import Flask
 
 from src.apis import bp as api_bp
+from src.asgi import AsgiApp
+from src.commands import rebuild_archive_command
+from src.validations import DEFAULT_RULESET, compile_ruleset, load_rulesets
 
 
-def create_app(test_config: t.Dict = None) -> Flask:
+def create_app(test_config: t.Optional[t.Dict] = None) -> Flask:
     app = Flask(__name__)
+    app.config.from_mapping(
+        BATCH_CONCURRENCY=int(os.environ.get("MAJSOUL_BATCH_CONCURRENCY", "4")),
+        BATCH_MAX_SIZE=int(os.environ.get("MAJSOUL_BATCH_MAX_SIZE", "100")),
+        BATCH_CSV_MAX_SIZE=int(os.environ.get("MAJSOUL_BATCH_CSV_MAX_SIZE", "10000")),
+        RULESETS={DEFAULT_RULESET.name: DEFAULT_RULESET},
+        # Cache-Control of successful responses of finished games
+        RECORD_CACHE_CONTROL=os.environ.get(
+            "MAJSOUL_RECORD_CACHE_CONTROL", "public, max-age=31536000, immutable"
+        ),
+    )
+    rulesets_path = os.environ.get("MAJSOUL_RULESETS_PATH", "")
+    if rulesets_path:
+        app.config["RULESETS"].update(load_rulesets(rulesets_path))
     app.register_blueprint(api_bp)
+    app.cli.add_command(rebuild_archive_command)
 
     if test_config is not None:
         app.config.from_mapping(test_config)
 
+    # rulesets are compiled once, requests pick one by name
+    app.config["VALIDATORS"] = {
+        name: compile_ruleset(ruleset)
+        for name, ruleset in app.config["RULESETS"].items()
+    }
+    # summaries change with rulesets, so do ETags of responses
+    app.config["RULESETS_DIGEST"] = hashlib.sha256(
+        repr(sorted(app.config["RULESETS"].items())).encode()
+    ).hexdigest()
+
     return app
+
+
+def create_asgi_app(app: t.Optional[Flask] = None) -> AsgiApp:
+    """Wrap app for ASGI servers such as uvicorn
+
+    Args:
+        app (Flask, optional): app to serve, created by create_app if omitted
+
+    Returns:
+        AsgiApp: ASGI application
+    """
+    return AsgiApp(app if app is not None else create_app())
@@ -1,218 +1,760 @@
-from datetime import datetime, timedelta, timezone
-import traceback
+import asyncio
+from collections import deque
+import concurrent.futures
+import functools
+import hashlib
+import logging
+import time
 import typing as t
 
-from flask import Blueprint, jsonify
+from flask import Blueprint, Response, current_app, g, request
+import ms.protocol_pb2 as pb
 
-from src.consts import YAKU_MAP, IMPORTANT_YAKUS
-from src.ms_apis import get_log
-from src.validations import validate_log
-from src.utils import csv_response
+from src.metrics import (
+    format_server_timing,
+    registry,
+    request_seconds,
+    request_timings,
+    time_stage,
+)
+from src.archives import GameQuery
+from src.caches import make_cached_record
+from src.columnar import write_columnar
+from src.compressions import (
+    IDENTITY,
+    StoredResponse,
+    compress,
+    iter_compressed,
+    negotiate_coding,
+    pack_response,
+    unpack_response,
+)
+from src.formats import (
+    MSGPACK_MIMETYPE,
+    PROTOBUF_MIMETYPE,
+    negotiate_raw_format,
+    pack_msgpack,
+)
+from src.jsons import JSON_MIMETYPE, iter_log_json, json_response
+from src.ms_apis import (
+    game_archive,
+    get_game_record,
+    get_log,
+    get_record_digest,
+    get_serialized_game_record,
+    in_flight_fetches,
+    record_cache,
+    response_cache,
+    session_loop,
+    session_pool,
+)
+from src.records import LOG_FIELDS, RECORD_NAMES, ExcludedNames, make_log
+from src.summaries import (
+    GameSummary,
+    Summary,
+    make_csv_row,
+    make_exception_summary,
+    summarize_game_record,
+    summarize_log,
+)
+from src.utils import csv_response, csv_stream_response
+from src.validations import DEFAULT_RULESET, Validator
 
 if t.TYPE_CHECKING:
     from flask.typing import ResponseReturnValue
 
 bp = Blueprint("api", __name__)
 
+GAMES_MAX_LIMIT = 1000
+
+
+@bp.before_app_request
+def start_request_timing() -> None:
+    g.started_at = time.perf_counter()
+    g.timings = []
+    request_timings.set(g.timings)
+
+
+@bp.after_app_request
+def add_server_timing(response: Response) -> Response:
+    """Add Server-Timing header with stages of request and record its duration
+
+    Args:
+        response (Response): response of request
+
+    Returns:
+        Response: response with Server-Timing header
+    """
+    started_at = g.get("started_at")
+    if started_at is None:
+        return response
+    elapsed = time.perf_counter() - started_at
+    timings = g.timings + [("total", elapsed)]
+    response.headers["Server-Timing"] = format_server_timing(timings)
+    request_seconds.observe(
+        elapsed,
+        endpoint=request.endpoint or "unknown",
+        status=str(response.status_code),
+    )
+    request_timings.set(None)
+    return response
+
+
+def get_validator() -> Validator:
+    """Get validator of ruleset named by ``ruleset`` query arg
+
+    Returns:
+        Validator: validator of ruleset, default ruleset if arg is omitted
+    """
+    name = request.args.get("ruleset") or DEFAULT_RULESET.name
+    validators = current_app.config["VALIDATORS"]
+    if name not in validators:
+        raise ValueError(
+            f"Invalid ruleset: {name}. It should be one of {', '.join(validators)}."
+        )
+    return validators[name]
+
+
+def summarize_and_archive(
+    game_record: t.Union[pb.ResGameRecord, t.Dict], validate: Validator
+) -> Summary:
+    """Summarize game record and store the summary in game archive if it is enabled
+
+    Errors of the archive, such as a locked database, are logged and counted
+    as errors of the archive stage.
+
+    Args:
+        game_record (Union[ResGameRecord, Dict]): game record from
+            get_game_record, or dict with error
+        validate (Validator): validator of ruleset the game should follow
+
+    Returns:
+        Summary: summary of game, or error if log is invalid
+    """
+    with time_stage("summarize"):
+        if isinstance(game_record, dict):
+            summary = summarize_log(game_record, validate)
+        else:
+            summary = summarize_game_record(game_record, validate)
+    if game_archive is not None and isinstance(summary, GameSummary):
+        # archive is a side effect, so the summary is sent even if it fails
+        try:
+            with time_stage("archive"):
+                game_archive.add(summary)
+        except Exception:
+            logging.warning(f"Failed to archive game {summary.uuid}", exc_info=True)
+    return summary
+
+
+# query args read by views of game records, others never change the response
+RECORD_ARGS = ("ruleset", "fields", "records", "exclude_records")
+# bump when bodies of record responses change for the same record and args
+RECORD_RESPONSE_VERSION = 2
+
+
+async def get_record_etag(uuid: str, variant: str = "") -> t.Optional[str]:
+    """Make ETag of response for cached game record
+
+    Tag covers record content, rulesets, response version, endpoint, query
+    args read by the views and variant, so every variant of response of one
+    record has its own tag, while args such as cache busters share it.
+
+    Args:
+        uuid (str): uuid of Majsoul log
+        variant (str, optional): representation negotiated from request headers
+
+    Returns:
+        Optional[str]: ETag without quotes, None if record is not cached
+    """
+    digest = await get_record_digest(uuid)
+    if digest is None:
+        return None
+    args = "&".join(
+        f"{name}={request.args[name]}" for name in RECORD_ARGS if name in request.args
+    )
+    rulesets_digest = current_app.config["RULESETS_DIGEST"]
+    return hashlib.sha256(
+        f"{digest}:{rulesets_digest}:v{RECORD_RESPONSE_VERSION}:"
+        f"{request.endpoint}?{args}:{variant}".encode()
+    ).hexdigest()[:40]
+
+
+AsyncView = t.Callable[[str], t.Awaitable["ResponseReturnValue"]]
+
+# headers kept with stored bodies, others are set for every response
+STORED_HEADERS = ("Content-Type", "Content-Disposition")
+# streamed bodies above this size are sent without being kept in memory
+STREAMED_BODY_MAX_BYTES = 8 << 20
+
+
+def make_record_response(
+    headers: t.Dict[str, str],
+    body: t.Union[bytes, t.Iterable[bytes]],
+    etag: str,
+    coding: str,
+    vary: t.Iterable[str],
+) -> Response:
+    """Make cacheable response of finished game
+
+    Args:
+        headers (Dict[str, str]): stored headers of response
+        body (Union[bytes, Iterable[bytes]]): body or chunks of body encoded
+            with coding
+        etag (str): ETag of response without content coding
+        coding (str): content coding of body
+        vary (Iterable[str]): request headers response was negotiated by
+
+    Returns:
+        Response: response with ETag of the coding and cache headers
+    """
+    response = Response(body, headers=headers)
+    if coding != IDENTITY:
+        response.headers["Content-Encoding"] = coding
+    # each coding is another representation, so it has its own strong tag
+    response.set_etag(etag if coding == IDENTITY else f"{etag}-{coding}")
+    response.headers["Cache-Control"] = current_app.config["RECORD_CACHE_CONTROL"]
+    response.vary.update(vary)
+    return response
+
+
+def store_response(key: str, stored_response: StoredResponse) -> None:
+    """Store encoded response in response cache if it is enabled
+
+    Errors of the cache, such as a full disk, are logged and counted as
+    errors of the store_response stage, so the response is still sent.
+
+    Args:
+        key (str): key of response cache
+        stored_response (StoredResponse): headers and encoded body
+    """
+    if response_cache is None:
+        return
+    try:
+        with time_stage("store_response"):
+            response_cache.set(key, make_cached_record(pack_response(stored_response)))
+    except Exception:
+        logging.warning(f"Failed to store response {key}", exc_info=True)
+
+
+def iter_and_store_response(
+    key: str, headers: t.Dict[str, str], chunks: t.Iterable[bytes]
+) -> t.Iterator[bytes]:
+    """Pass chunks of body through and store the body once all are sent
+
+    Bodies of responses closed before their end, or larger than
+    STREAMED_BODY_MAX_BYTES, are not stored.
+
+    Args:
+        key (str): key of response cache
+        headers (Dict[str, str]): stored headers of response
+        chunks (Iterable[bytes]): chunks of encoded body
+
+    Yields:
+        bytes: each chunk
+    """
+    body = []  # type: t.Optional[t.List[bytes]]
+    size = 0
+    for chunk in chunks:
+        if body is not None:
+            size += len(chunk)
+            if size <= STREAMED_BODY_MAX_BYTES:
+                body.append(chunk)
+            else:
+                body = None
+        yield chunk
+    if body is not None:
+        store_response(key, StoredResponse(headers=headers, body=b"".join(body)))
+
+
+def cache_game_record(
+    negotiate_format: t.Optional[t.Callable[[], str]] = None
+) -> t.Callable[[AsyncView], AsyncView]:
+    """Make responses of a finished game cacheable by HTTP caches
+
+    Successful responses of cached records get a strong ETag and a long
+    Cache-Control lifetime, others are not stored. Their body is encoded with
+    the content coding negotiated by Accept-Encoding and stored in response
+    cache, so repeated requests send stored bytes without running the view.
+    Streamed bodies are encoded while they are sent, and stored only when
+    compressed, so uncompressed ones never build up in memory.
+    If-None-Match matching the ETag is answered with 304 from record cache,
+    without fetching.
+
+    Args:
+        negotiate_format (Callable[[], str], optional): function choosing
+            format of view from Accept of request, None if view has one format
+
+    Returns:
+        Callable[[AsyncView], AsyncView]: decorator adding cache headers to
+            view taking uuid of Majsoul log
+    """
+    vary = ("Accept", "Accept-Encoding") if negotiate_format else ("Accept-Encoding",)
+
+    def decorator(view: AsyncView) -> AsyncView:
+        @functools.wraps(view)
+        async def wrapper(uuid: str) -> "ResponseReturnValue":
+            return await serve_game_record(view, uuid)
+
+        return wrapper
+
+    async def serve_game_record(view: AsyncView, uuid: str) -> "ResponseReturnValue":
+        coding = negotiate_coding(request.accept_encodings)
+        variant = negotiate_format() if negotiate_format is not None else ""
+        etag = await get_record_etag(uuid, variant)
+        if etag is not None:
+            coded_etag = etag if coding == IDENTITY else f"{etag}-{coding}"
+            if request.if_none_match.contains_weak(coded_etag):
+                response = make_record_response({}, b"", etag, coding, vary)
+                response.status_code = 304
+                return response
+            if response_cache is not None:
+                cached_body = await response_cache.get_async(f"{etag}-{coding}")
+                if cached_body is not None:
+                    stored_response = unpack_response(cached_body.data)
+                    return make_record_response(
+                        stored_response.headers,
+                        stored_response.body,
+                        etag,
+                        coding,
+                        vary,
+                    )
+
+        response = current_app.make_response(await view(uuid))
+        if response.status_code != 200:
+            response.headers["Cache-Control"] = "no-store"
+            return response
+        # records are cached once fetched, so the tag exists from now on
+        etag = etag or await get_record_etag(uuid, variant)
+        if etag is None:
+            response.headers["Cache-Control"] = "no-store"
+            return response
+
+        headers = {
+            name: response.headers[name]
+            for name in STORED_HEADERS
+            if name in response.headers
+        }
+        key = f"{etag}-{coding}"
+        if response.is_streamed:
+            chunks = iter_compressed(coding, response.iter_encoded())
+            if coding != IDENTITY:
+                chunks = iter_and_store_response(key, headers, chunks)
+            return make_record_response(headers, chunks, etag, coding, vary)
+
+        with time_stage("compress"):
+            body = compress(coding, response.get_data())
+        if response_cache is not None:
+            await asyncio.get_running_loop().run_in_executor(
+                None, store_response, key, StoredResponse(headers=headers, body=body)
+            )
+        return make_record_response(headers, body, etag, coding, vary)
+
+    return decorator
+
 
 @bp.route("/uuid-raw/<uuid>")
+@cache_game_record(lambda: negotiate_raw_format(request.accept_mimetypes))
 async def route_uuid_raw(uuid: str) -> "ResponseReturnValue":
-    """Serve full Majsoul log as json
+    """Serve full Majsoul log as json, MessagePack or protobuf
+
+    Format is negotiated by Accept. Json is streamed while records are
+    decoded, MessagePack has the same structure. Protobuf is the serialized
+    ResGameRecord as cached, so it ignores query args.
+
+    Query arg ``fields`` selects top-level fields, ``records`` or
+    ``exclude_records`` selects records by comma separated names. Other
+    records are never decoded.
 
     Args:
         uuid (str): uuid of Majsoul log
 
     Returns:
-        ResponseReturnValue: full Majsoul log as json
+        ResponseReturnValue: full Majsoul log
     """
+    raw_format = negotiate_raw_format(request.accept_mimetypes)
+    if raw_format == PROTOBUF_MIMETYPE:
+        serialized_record = await get_serialized_game_record(uuid)
+        if isinstance(serialized_record, dict):
+            return json_response(serialized_record)
+        return Response(serialized_record, mimetype=PROTOBUF_MIMETYPE)
+
+    try:
+        fields = get_names_arg(
+            "fields", LOG_FIELDS, f"comma separated {', '.join(sorted(LOG_FIELDS))}"
+        )
+        record_names = get_record_names()
+    except ValueError as e:
+        return json_response({"result": "ERROR", "message": str(e)}), 400
+
+    game_record = await get_game_record(uuid)
+    if isinstance(game_record, dict):
+        return json_response(game_record)
+    if raw_format == MSGPACK_MIMETYPE:
+        with time_stage("decode"):
+            data = make_log(game_record, record_names, fields)
+        return Response(pack_msgpack(data), mimetype=MSGPACK_MIMETYPE)
+    return Response(
+        iter_log_json(game_record, record_names, fields), mimetype=JSON_MIMETYPE
+    )
+
+
+@bp.route("/uuid-columnar/<uuid>")
+@cache_game_record()
+async def route_uuid_columnar(uuid: str) -> "ResponseReturnValue":
+    """Serve full Majsoul log as columnar file
+
+    Args:
+        uuid (str): uuid of Majsoul log
 
+    Returns:
+        ResponseReturnValue: columnar file, or json with error
+    """
     data = await get_log(uuid)
-    return jsonify(data)
+    if "error" in data:
+        return json_response(data), 500
+
+    res = Response(write_columnar([data]), mimetype="application/octet-stream")
+    res.headers["Content-Disposition"] = "attachment; filename=export.mjcol"
+    return res
 
 
 @bp.route("/uuid/<uuid>")
+@cache_game_record()
 async def route_uuid(uuid: str) -> "ResponseReturnValue":
     """Serve simple Majsoul log as json
 
+    Query arg ``ruleset`` names ruleset the game should follow.
+
     Args:
         uuid (str): uuid of Majsoul log
 
     Returns:
         ResponseReturnValue: simple Majsoul log as json
     """
-    data = await get_log(uuid)
     try:
-        is_valid, errors = validate_log(data)
-        if not is_valid:
-            return (
-                jsonify(
-                    {
-                        "result": "ERROR",
-                        "message": "Invalid game log.",
-                        "errors": errors,
-                        "data": data,
-                    }
-                ),
-                500,
-            )
+        validate = get_validator()
+    except ValueError as e:
+        return json_response({"result": "ERROR", "message": str(e)}), 400
 
-        head = data["head"]
-
-        results = head["result"]["players"]
-
-        # parse for players
-        player_ranks = []
-        for result in results:
-            if "seat" in result:
-                seat = result["seat"]
-                for player in head["accounts"]:
-                    if "seat" in player and player["seat"] == seat:
-                        final_point = (
-                            result["partPoint1"] if "partPoint1" in result else 0
-                        )
-                        player_ranks.append(
-                            {
-                                "id": player["accountId"],
-                                "seat": seat,
-                                "nickname": player["nickname"],
-                                "finalPoint": final_point,
-                            }
-                        )
-                        break
-            else:
-                for player in head["accounts"]:
-                    if "seat" not in player:
-                        final_point = (
-                            result["partPoint1"] if "partPoint1" in result else 0
-                        )
-                        player_ranks.append(
-                            {
-                                "id": player["accountId"],
-                                "seat": 0,
-                                "nickname": player["nickname"],
-                                "finalPoint": final_point,
-                            }
-                        )
-                        break
-
-        # set rank by final points
-        player_ranks.sort(key=lambda player: player["finalPoint"], reverse=True)
-        for i in range(len(player_ranks)):
-            player_ranks[i]["rank"] = i + 1
-
-        # parse for noted_yakus
-        noted_yakus = []
-        for record in data["records"]:
-            if record["name"] != "RecordHule":
-                continue
-            for hule in record["data"]["hules"]:
-                yakus = (YAKU_MAP[fan["id"]] for fan in hule["fans"])
-                is_important = False
-                for yaku in yakus:
-                    # check important yaku
-                    if yaku in IMPORTANT_YAKUS:
-                        is_important = True
-                        seat = 0
-                        if "seat" in hule:
-                            seat = hule["seat"]
-                        for player in player_ranks:
-                            if player["seat"] == seat:
-                                noted_yakus.append(
-                                    {
-                                        "yaku": yaku,
-                                        "player": player,
-                                    }
-                                )
-                                break
-                # check counted yakuman
-                if not is_important and hule["count"] >= 13:
-                    seat = 0
-                    if "seat" in hule:
-                        seat = hule["seat"]
-                    for player in player_ranks:
-                        if player["seat"] == seat:
-                            noted_yakus.append(
-                                {
-                                    "yaku": "헤아림역만",
-                                    "player": player,
-                                }
-                            )
-                            break
-
-        return jsonify(
-            {
-                "result": "OK",
-                "uuid": head["uuid"],
-                "roomId": head["config"]["meta"]["roomId"],
-                "startTime": head["startTime"],
-                "endTime": head["endTime"],
-                "ranks": player_ranks,
-                "noted_yakus": noted_yakus,
-            }
-        )
-    except Exception:
-        return (
-            jsonify(
-                {
-                    "result": "ERROR",
-                    "message": traceback.format_exc(),
-                    "errors": [
-                        {
-                            "code": "unexpected-exception",
-                            "message": "Unexpected exception.",
-                        }
-                    ],
-                    "data": data,
-                }
-            ),
-            500,
-        )
+    game_record = await get_game_record(uuid)
+    summary = summarize_and_archive(game_record, validate)
+    return json_response(summary.to_dict()), summary.status_code
 
 
 @bp.route("/uuid-csv/<uuid>")
+@cache_game_record()
 async def route_uuid_csv(uuid: str) -> "ResponseReturnValue":
     """Serve simple Majsoul log as csv
 
+    Query arg ``ruleset`` names ruleset the game should follow.
+
     Args:
         uuid (str): uuid of Majsoul log
 
     Returns:
         ResponseReturnValue: simple Majsoul log as csv
     """
-    response = await route_uuid(uuid)
-    if isinstance(response, tuple):
-        status_code = response[1]
-        response = response[0]
-    else:
-        status_code = response.status_code
-
-    if status_code != 200:
-        if status_code == 500:
-            result = response.get_json()
-            if result["result"] == "ERROR":
-                rows = [""] * 10
-                rows.append(
-                    "Error: ("
-                    + ") & (".join(error["message"] for error in result["errors"])
-                    + ")"
-                )
-                return csv_response(rows), status_code
-        return response, status_code
-
-    result = response.get_json()
-    date = datetime.fromtimestamp(result["startTime"], timezone.utc).astimezone(
-        timezone(timedelta(hours=9))
+    try:
+        validate = get_validator()
+    except ValueError as e:
+        return json_response({"result": "ERROR", "message": str(e)}), 400
+
+    game_record = await get_game_record(uuid)
+    summary = summarize_and_archive(game_record, validate)
+    return csv_response(make_csv_row(summary)), summary.status_code
+
+
+async def get_summaries(
+    uuids: t.List[str], concurrency: int, validate: Validator
+) -> t.List[Summary]:
+    """Fetch and summarize Majsoul logs concurrently
+
+    Args:
+        uuids (List[str]): uuids of Majsoul logs
+        concurrency (int): max number of logs fetched at once
+        validate (Validator): validator of ruleset the games should follow
+
+    Returns:
+        List[Summary]: summary of each uuid
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def get_summary(uuid: str) -> Summary:
+        async with semaphore:
+            try:
+                game_record = await get_game_record(uuid)
+            except Exception:
+                return make_exception_summary()
+        return summarize_and_archive(game_record, validate)
+
+    return await asyncio.gather(*(get_summary(uuid) for uuid in uuids))
+
+
+def iter_summaries(
+    uuids: t.Iterable[str], concurrency: int, validate: Validator
+) -> t.Iterator[Summary]:
+    """Fetch and summarize Majsoul logs, yielding each summary as it is ready
+
+    At most ``concurrency`` logs are fetched or waiting to be consumed at once,
+    so memory does not grow with the number of uuids.
+
+    Args:
+        uuids (Iterable[str]): uuids of Majsoul logs
+        concurrency (int): max number of logs fetched at once
+        validate (Validator): validator of ruleset the games should follow
+
+    Yields:
+        Summary: summary of each uuid in uuid order
+    """
+    uuid_iter = iter(uuids)
+    pending = deque()  # type: t.Deque[concurrent.futures.Future]
+
+    def submit_next() -> None:
+        uuid = next(uuid_iter, None)
+        if uuid is not None:
+            pending.append(session_loop.submit(get_game_record(uuid)))
+
+    for _ in range(concurrency):
+        submit_next()
+    while pending:
+        future = pending.popleft()
+        submit_next()
+        try:
+            game_record = future.result()
+        except Exception:
+            yield make_exception_summary()
+            continue
+        yield summarize_and_archive(game_record, validate)
+
+
+def get_batch_uuids(
+    max_size: int,
+) -> t.Tuple[t.Optional[t.List[str]], t.Optional[str]]:
+    """Read uuids from json body of batch request
+
+    Body is either a list of uuids or an object with ``uuids`` list.
+
+    Args:
+        max_size (int): max number of uuids
+
+    Returns:
+        Tuple[Optional[List[str]], Optional[str]]: uuids, or error message
+    """
+    body = request.get_json(silent=True)
+    if isinstance(body, dict):
+        body = body.get("uuids")
+    if not isinstance(body, list) or not all(isinstance(uuid, str) for uuid in body):
+        return None, 'Body should be a list of uuids or {"uuids": [...]}.'
+    if len(body) > max_size:
+        return None, f"Too many uuids: {len(body)}. It should be at most {max_size}."
+    return body, None
+
+
+@bp.route("/batch", methods=["POST"])
+async def route_batch() -> "ResponseReturnValue":
+    """Serve simple Majsoul logs of many uuids as json
+
+    Query arg ``ruleset`` names ruleset the games should follow.
+
+    Returns:
+        ResponseReturnValue: summary of each uuid in request order
+    """
+    uuids, error = get_batch_uuids(current_app.config["BATCH_MAX_SIZE"])
+    if uuids is None:
+        return json_response({"result": "ERROR", "message": error}), 400
+    try:
+        validate = get_validator()
+    except ValueError as e:
+        return json_response({"result": "ERROR", "message": str(e)}), 400
+
+    summaries = await get_summaries(
+        uuids, current_app.config["BATCH_CONCURRENCY"], validate
     )
-    rows = ["{date.year}년 {date.month}월 {date.day}일".format(date=date)]
-    for rank in result["ranks"]:
-        rows.append(rank["nickname"])
-        rows.append(rank["finalPoint"])
-    rows.append(result["roomId"])
-    if result["noted_yakus"]:
-        rows.append(
-            "/".join(
-                f'{noted_yaku["player"]["rank"]}위 {noted_yaku["yaku"]}'
-                for noted_yaku in result["noted_yakus"]
-            )
+    return json_response(
+        {
+            "result": "OK",
+            "results": [
+                dict(summary.to_dict(), uuid=uuid, status=summary.status_code)
+                for uuid, summary in zip(uuids, summaries)
+            ],
+        }
+    )
+
+
+@bp.route("/batch-csv", methods=["POST"])
+def route_batch_csv() -> "ResponseReturnValue":
+    """Stream simple Majsoul logs of many uuids as csv
+
+    Each row is sent as soon as its log is summarized.
+    Query arg ``ruleset`` names ruleset the games should follow.
+
+    Returns:
+        ResponseReturnValue: csv row of each uuid in request order
+    """
+    # rows are sent as they are made, so the response does not grow in memory
+    uuids, error = get_batch_uuids(current_app.config["BATCH_CSV_MAX_SIZE"])
+    if uuids is None:
+        return json_response({"result": "ERROR", "message": error}), 400
+    try:
+        validate = get_validator()
+    except ValueError as e:
+        return json_response({"result": "ERROR", "message": str(e)}), 400
+
+    summaries = iter_summaries(uuids, current_app.config["BATCH_CONCURRENCY"], validate)
+    return csv_stream_response(make_csv_row(summary) for summary in summaries)
+
+
+def get_int_arg(name: str) -> t.Optional[int]:
+    value = request.args.get(name)
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name}: {value}. It should be an integer.")
+
+
+def get_names_arg(
+    name: str, allowed_names: t.AbstractSet[str], expected_value_hint: str
+) -> t.Optional[t.FrozenSet[str]]:
+    value = request.args.get(name)
+    if value is None:
+        return None
+    names = frozenset(filter(None, value.split(",")))
+    invalid_names = names - allowed_names
+    if invalid_names:
+        raise ValueError(
+            f"Invalid {name}: {','.join(sorted(invalid_names))}. "
+            f"It should be {expected_value_hint}."
         )
-    return csv_response(rows)
+    return names
+
+
+def get_record_names() -> t.Optional[t.Container[str]]:
+    """Read record names to keep from ``records`` or ``exclude_records`` query arg
+
+    Returns:
+        Optional[Container[str]]: record names to keep, None to keep all
+    """
+    hint = "comma separated record names like RecordHule"
+    record_names = get_names_arg("records", RECORD_NAMES, hint)
+    excluded_names = get_names_arg("exclude_records", RECORD_NAMES, hint)
+    if excluded_names is None:
+        return record_names
+    if record_names is not None:
+        raise ValueError("Only one of records and exclude_records can be given.")
+    return ExcludedNames(excluded_names)
+
+
+@bp.route("/games")
+def route_games() -> "ResponseReturnValue":
+    """Serve archived summaries matching query, latest first
+
+    Query args ``account``, ``room``, ``from`` and ``to`` (unix seconds of
+    start time, ``to`` exclusive) filter games, ``limit`` and ``offset`` page
+    them.
+
+    Returns:
+        ResponseReturnValue: summaries of matched games as json
+    """
+    if game_archive is None:
+        return (
+            json_response({"result": "ERROR", "message": "Game archive is disabled."}),
+            404,
+        )
+
+    try:
+        limit = get_int_arg("limit")
+        query = GameQuery(
+            account_id=get_int_arg("account"),
+            room_id=get_int_arg("room"),
+            start=get_int_arg("from"),
+            end=get_int_arg("to"),
+            limit=max(0, min(limit, GAMES_MAX_LIMIT)) if limit is not None else 100,
+            offset=get_int_arg("offset") or 0,
+        )
+    except ValueError as e:
+        return json_response({"result": "ERROR", "message": str(e)}), 400
+
+    summaries = game_archive.find(query)
+    return json_response(
+        {"result": "OK", "games": [summary.to_dict() for summary in summaries]}
+    )
+
+
+@bp.route("/players/<int:account_id>/stats")
+def route_player_stats(account_id: int) -> "ResponseReturnValue":
+    """Serve totals of archived games of player
+
+    Query arg ``room`` limits totals to one room.
+
+    Args:
+        account_id (int): account id of player
+
+    Returns:
+        ResponseReturnValue: totals of player as json
+    """
+    if game_archive is None:
+        return (
+            json_response({"result": "ERROR", "message": "Game archive is disabled."}),
+            404,
+        )
+    try:
+        room_id = get_int_arg("room")
+    except ValueError as e:
+        return json_response({"result": "ERROR", "message": str(e)}), 400
+
+    stats = game_archive.get_player_stats(account_id, room_id)
+    if stats is None:
+        return json_response({"result": "ERROR", "message": "No archived games."}), 404
+    return json_response(dict(stats.to_dict(), result="OK"))
+
+
+@bp.route("/rooms/<int:room_id>/stats")
+def route_room_stats(room_id: int) -> "ResponseReturnValue":
+    """Serve totals of archived games of room
+
+    Args:
+        room_id (int): friendly match room id
+
+    Returns:
+        ResponseReturnValue: totals of room as json
+    """
+    if game_archive is None:
+        return (
+            json_response({"result": "ERROR", "message": "Game archive is disabled."}),
+            404,
+        )
+
+    stats = game_archive.get_room_stats(room_id)
+    if stats is None:
+        return json_response({"result": "ERROR", "message": "No archived games."}), 404
+    return json_response(dict(stats.to_dict(), result="OK"))
+
+
+@bp.route("/stats")
+def route_stats() -> "ResponseReturnValue":
+    """Serve counters of caches and lobby sessions
+
+    Returns:
+        ResponseReturnValue: cache and session stats as json
+    """
+    return json_response(
+        {
+            "cache": record_cache.stats() if record_cache is not None else None,
+            "sessions": session_pool.stats(),
+            "in_flight": in_flight_fetches.stats(),
+            "archive": game_archive.stats() if game_archive is not None else None,
+            "responses": response_cache.stats() if response_cache is not None else None,
+        }
+    )
+
+
+@bp.route("/metrics")
+def route_metrics() -> "ResponseReturnValue":
+    """Serve stage and request metrics in Prometheus text format
+
+    Returns:
+        ResponseReturnValue: metrics of this worker
+    """
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,411 @@
+import sqlite3
+import threading
+import typing as t
+
+from src.summaries import GameSummary, NotedYaku, PlayerRank
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    uuid TEXT PRIMARY KEY,
+    room_id INTEGER NOT NULL,
+    start_time INTEGER NOT NULL,
+    end_time INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS games_room_id ON games (room_id, start_time);
+CREATE INDEX IF NOT EXISTS games_start_time ON games (start_time);
+
+CREATE TABLE IF NOT EXISTS players (
+    uuid TEXT NOT NULL REFERENCES games (uuid) ON DELETE CASCADE,
+    account_id INTEGER NOT NULL,
+    seat INTEGER NOT NULL,
+    nickname TEXT NOT NULL,
+    final_point INTEGER NOT NULL,
+    rank INTEGER NOT NULL,
+    PRIMARY KEY (uuid, rank)
+);
+CREATE INDEX IF NOT EXISTS players_account_id ON players (account_id);
+
+CREATE TABLE IF NOT EXISTS noted_yakus (
+    uuid TEXT NOT NULL REFERENCES games (uuid) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    rank INTEGER NOT NULL,
+    yaku TEXT NOT NULL,
+    PRIMARY KEY (uuid, position)
+);
+
+CREATE TABLE IF NOT EXISTS player_stats (
+    account_id INTEGER NOT NULL,
+    room_id INTEGER NOT NULL,
+    nickname TEXT NOT NULL,
+    games INTEGER NOT NULL,
+    rank_sum INTEGER NOT NULL,
+    rank_1 INTEGER NOT NULL,
+    rank_2 INTEGER NOT NULL,
+    rank_3 INTEGER NOT NULL,
+    rank_4 INTEGER NOT NULL,
+    point_sum INTEGER NOT NULL,
+    yakumans INTEGER NOT NULL,
+    PRIMARY KEY (account_id, room_id)
+);
+
+CREATE TABLE IF NOT EXISTS room_stats (
+    room_id INTEGER PRIMARY KEY,
+    games INTEGER NOT NULL,
+    yakumans INTEGER NOT NULL
+);
+"""
+
+# running totals are adjusted by each added or replaced game
+_UPDATE_PLAYER_STATS = """
+INSERT INTO player_stats (
+    account_id, room_id, nickname, games, rank_sum,
+    rank_1, rank_2, rank_3, rank_4, point_sum, yakumans
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (account_id, room_id) DO UPDATE SET
+    nickname = CASE WHEN excluded.games > 0
+        THEN excluded.nickname ELSE player_stats.nickname END,
+    games = player_stats.games + excluded.games,
+    rank_sum = player_stats.rank_sum + excluded.rank_sum,
+    rank_1 = player_stats.rank_1 + excluded.rank_1,
+    rank_2 = player_stats.rank_2 + excluded.rank_2,
+    rank_3 = player_stats.rank_3 + excluded.rank_3,
+    rank_4 = player_stats.rank_4 + excluded.rank_4,
+    point_sum = player_stats.point_sum + excluded.point_sum,
+    yakumans = player_stats.yakumans + excluded.yakumans
+"""
+_UPDATE_ROOM_STATS = """
+INSERT INTO room_stats (room_id, games, yakumans) VALUES (?, ?, ?)
+ON CONFLICT (room_id) DO UPDATE SET
+    games = room_stats.games + excluded.games,
+    yakumans = room_stats.yakumans + excluded.yakumans
+"""
+# games loaded per query, older SQLite allows only 999 parameters
+_MAX_LOADED_GAMES = 500
+
+_PLAYER_STATS_COLUMNS = (
+    "account_id, nickname, games, rank_sum, rank_1, rank_2, rank_3, rank_4,"
+    " point_sum, yakumans"
+)
+
+
+class GameQuery(t.NamedTuple):
+    """Filters of archived games, None fields match every game
+
+    Attributes:
+        account_id (int, optional): account which played the game
+        room_id (int, optional): friendly match room id
+        start (int, optional): earliest start time in unix seconds, inclusive
+        end (int, optional): latest start time in unix seconds, exclusive
+        limit (int): max number of games
+        offset (int): number of games to skip
+    """
+
+    account_id: t.Optional[int] = None
+    room_id: t.Optional[int] = None
+    start: t.Optional[int] = None
+    end: t.Optional[int] = None
+    limit: int = 100
+    offset: int = 0
+
+
+class PlayerStats(t.NamedTuple):
+    account_id: int
+    room_id: t.Optional[int]
+    nickname: str
+    games: int
+    rank_sum: int
+    rank_counts: t.List[int]
+    point_sum: int
+    yakumans: int
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        return {
+            "accountId": self.account_id,
+            "roomId": self.room_id,
+            "nickname": self.nickname,
+            "games": self.games,
+            "averageRank": self.rank_sum / self.games,
+            "rankCounts": self.rank_counts,
+            "totalPoints": self.point_sum,
+            "averagePoints": self.point_sum / self.games,
+            "yakumans": self.yakumans,
+        }
+
+
+class RoomStats(t.NamedTuple):
+    room_id: int
+    games: int
+    yakumans: int
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        return {"roomId": self.room_id, "games": self.games, "yakumans": self.yakumans}
+
+
+class GameArchive:
+    """Summaries of games stored in a SQLite database
+
+    Games are stored with their ranks and noted yakus, and can be queried by
+    account, room and start time without fetching them again. Totals of each
+    player and room are kept up to date as games are added, so reading them
+    does not scan the games.
+
+    Args:
+        path (str): path of database file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA foreign_keys = ON")
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+
+    def add(self, summary: GameSummary) -> bool:
+        """Store summary of game, replacing the stored one of same uuid
+
+        Summaries of finished games rarely change, so an unchanged one is not
+        written again.
+
+        Args:
+            summary (GameSummary): summary of game
+
+        Returns:
+            bool: False if the same summary was already stored
+        """
+        with self._lock, self._db:
+            # workers may share the file, so the stored game is read under the
+            # write lock, or two of them would both count it in the totals
+            self._db.execute("BEGIN IMMEDIATE")
+            old_summaries = self._load_summaries(self._select_games(summary.uuid))
+            if old_summaries == [summary]:
+                return False
+            self._replace(old_summaries, summary)
+        return True
+
+    def _replace(
+        self, old_summaries: t.List[GameSummary], summary: GameSummary
+    ) -> None:
+        for old_summary in old_summaries:
+            self._update_stats(old_summary, -1)
+        self._update_stats(summary, 1)
+        self._db.execute("DELETE FROM games WHERE uuid = ?", (summary.uuid,))
+        self._db.execute(
+            "INSERT INTO games (uuid, room_id, start_time, end_time)"
+            " VALUES (?, ?, ?, ?)",
+            (summary.uuid, summary.room_id, summary.start_time, summary.end_time),
+        )
+        self._db.executemany(
+            "INSERT INTO players"
+            " (uuid, account_id, seat, nickname, final_point, rank)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    summary.uuid,
+                    rank.id,
+                    rank.seat,
+                    rank.nickname,
+                    rank.final_point,
+                    rank.rank,
+                )
+                for rank in summary.ranks
+            ],
+        )
+        self._db.executemany(
+            "INSERT INTO noted_yakus (uuid, position, rank, yaku)"
+            " VALUES (?, ?, ?, ?)",
+            [
+                (summary.uuid, position, noted_yaku.player.rank, noted_yaku.yaku)
+                for position, noted_yaku in enumerate(summary.noted_yakus)
+            ],
+        )
+
+    def _update_stats(self, summary: GameSummary, sign: int) -> None:
+        # noted yakus by rank of the player who made them
+        yakumans = {}  # type: t.Dict[int, int]
+        for noted_yaku in summary.noted_yakus:
+            yaku_rank = noted_yaku.player.rank
+            yakumans[yaku_rank] = yakumans.get(yaku_rank, 0) + 1
+
+        rows = []
+        for player in summary.ranks:
+            rank_counts = [sign if player.rank == i else 0 for i in range(1, 5)]
+            rows.append(
+                (player.id, summary.room_id, player.nickname, sign, sign * player.rank)
+                + tuple(rank_counts)
+                + (sign * player.final_point, sign * yakumans.get(player.rank, 0))
+            )
+        self._db.executemany(_UPDATE_PLAYER_STATS, rows)
+        self._db.execute(
+            _UPDATE_ROOM_STATS,
+            (summary.room_id, sign, sign * len(summary.noted_yakus)),
+        )
+        if sign < 0:
+            self._db.execute("DELETE FROM player_stats WHERE games <= 0")
+            self._db.execute("DELETE FROM room_stats WHERE games <= 0")
+
+    def _select_games(self, uuid: str) -> t.List[t.Tuple]:
+        return self._db.execute(
+            "SELECT uuid, room_id, start_time, end_time FROM games WHERE uuid = ?",
+            (uuid,),
+        ).fetchall()
+
+    def _load_summaries(self, rows: t.List[t.Tuple]) -> t.List[GameSummary]:
+        if len(rows) > _MAX_LOADED_GAMES:
+            return [
+                summary
+                for i in range(0, len(rows), _MAX_LOADED_GAMES)
+                for summary in self._load_summaries(rows[i : i + _MAX_LOADED_GAMES])
+            ]
+
+        uuids = [row[0] for row in rows]
+        placeholders = ",".join("?" * len(uuids))
+        ranks = {
+            uuid: {} for uuid in uuids
+        }  # type: t.Dict[str, t.Dict[int, PlayerRank]]
+        for uuid, account_id, seat, nickname, final_point, rank in self._db.execute(
+            "SELECT uuid, account_id, seat, nickname, final_point, rank FROM players"
+            f" WHERE uuid IN ({placeholders}) ORDER BY rank",
+            uuids,
+        ):
+            ranks[uuid][rank] = PlayerRank(
+                id=account_id,
+                seat=seat,
+                nickname=nickname,
+                final_point=final_point,
+                rank=rank,
+            )
+        noted_yakus = {
+            uuid: [] for uuid in uuids
+        }  # type: t.Dict[str, t.List[NotedYaku]]
+        for uuid, rank, yaku in self._db.execute(
+            "SELECT uuid, rank, yaku FROM noted_yakus"
+            f" WHERE uuid IN ({placeholders}) ORDER BY position",
+            uuids,
+        ):
+            noted_yakus[uuid].append(NotedYaku(yaku=yaku, player=ranks[uuid][rank]))
+
+        return [
+            GameSummary(
+                uuid=uuid,
+                room_id=room_id,
+                start_time=start_time,
+                end_time=end_time,
+                ranks=list(ranks[uuid].values()),
+                noted_yakus=noted_yakus[uuid],
+            )
+            for uuid, room_id, start_time, end_time in rows
+        ]
+
+    def get(self, uuid: str) -> t.Optional[GameSummary]:
+        with self._lock:
+            summaries = self._load_summaries(self._select_games(uuid))
+        return summaries[0] if summaries else None
+
+    def find(self, query: GameQuery) -> t.List[GameSummary]:
+        """Find games matching every filter of query, latest first
+
+        Args:
+            query (GameQuery): filters of games
+
+        Returns:
+            List[GameSummary]: summaries of matched games
+        """
+        conditions = []  # type: t.List[str]
+        params = []  # type: t.List[t.Any]
+        if query.account_id is not None:
+            conditions.append("uuid IN (SELECT uuid FROM players WHERE account_id = ?)")
+            params.append(query.account_id)
+        if query.room_id is not None:
+            conditions.append("room_id = ?")
+            params.append(query.room_id)
+        if query.start is not None:
+            conditions.append("start_time >= ?")
+            params.append(query.start)
+        if query.end is not None:
+            conditions.append("start_time < ?")
+            params.append(query.end)
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT uuid, room_id, start_time, end_time FROM games"
+                f"{where} ORDER BY start_time DESC, uuid LIMIT ? OFFSET ?",
+                params + [query.limit, query.offset],
+            ).fetchall()
+            return self._load_summaries(rows)
+
+    def get_player_stats(
+        self, account_id: int, room_id: t.Optional[int] = None
+    ) -> t.Optional[PlayerStats]:
+        """Get totals of player, in one room or summed over every room
+
+        Args:
+            account_id (int): account id of player
+            room_id (int, optional): friendly match room id, None for every room
+
+        Returns:
+            Optional[PlayerStats]: totals, or None if player has no games
+        """
+        with self._lock:
+            if room_id is not None:
+                rows = self._db.execute(
+                    f"SELECT {_PLAYER_STATS_COLUMNS} FROM player_stats"
+                    " WHERE account_id = ? AND room_id = ?",
+                    (account_id, room_id),
+                ).fetchall()
+            else:
+                rows = self._db.execute(
+                    f"SELECT {_PLAYER_STATS_COLUMNS} FROM player_stats"
+                    " WHERE account_id = ?",
+                    (account_id,),
+                ).fetchall()
+        if not rows:
+            return None
+
+        totals = [0] * 8
+        for row in rows:
+            totals = [total + value for total, value in zip(totals, row[2:])]
+        games, rank_sum, rank_1, rank_2, rank_3, rank_4, point_sum, yakumans = totals
+        return PlayerStats(
+            account_id=account_id,
+            room_id=room_id,
+            # rows are few and unordered, so any nickname of the player will do
+            nickname=rows[-1][1],
+            games=games,
+            rank_sum=rank_sum,
+            rank_counts=[rank_1, rank_2, rank_3, rank_4],
+            point_sum=point_sum,
+            yakumans=yakumans,
+        )
+
+    def get_room_stats(self, room_id: int) -> t.Optional[RoomStats]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT room_id, games, yakumans FROM room_stats WHERE room_id = ?",
+                (room_id,),
+            ).fetchone()
+        return RoomStats(*row) if row is not None else None
+
+    def rebuild_stats(self) -> int:
+        """Recompute totals of every player and room from stored games
+
+        Returns:
+            int: number of games counted
+        """
+        with self._lock, self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.execute("DELETE FROM player_stats")
+            self._db.execute("DELETE FROM room_stats")
+            rows = self._db.execute(
+                "SELECT uuid, room_id, start_time, end_time FROM games"
+                " ORDER BY start_time, uuid"
+            ).fetchall()
+            for summary in self._load_summaries(rows):
+                self._update_stats(summary, 1)
+        return len(rows)
+
+    def stats(self) -> t.Dict[str, t.Any]:
+        with self._lock:
+            (games,) = self._db.execute("SELECT COUNT(*) FROM games").fetchone()
+        return {"games": games}
@@ -0,0 +1,81 @@
+import asyncio
+import inspect
+import logging
+import os
+import typing as t
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgiInstance
+from flask import Flask
+
+from src.ms_apis import session_loop, session_pool
+
+Scope = t.Dict[str, t.Any]
+Receive = t.Callable[[], t.Awaitable[t.Dict[str, t.Any]]]
+Send = t.Callable[[t.Dict[str, t.Any]], t.Awaitable[None]]
+
+REQUEST_THREADS = int(os.environ.get("MAJSOUL_REQUEST_THREADS", "32"))
+
+
+# plain function under the sync_to_async wrapper of WsgiToAsgiInstance
+_run_wsgi_app = inspect.unwrap(WsgiToAsgiInstance.run_wsgi_app)
+
+
+class _WsgiToAsgiInstance(WsgiToAsgiInstance):
+    # WsgiToAsgi runs every request in one shared thread, so a request waiting
+    # for Majsoul would hold up all the others. Each request gets a thread of
+    # the app's executor instead. Requests block on the loop while it writes
+    # caches in the default executor, so they must never run in that one.
+    def __init__(self, wsgi_application: t.Any, executor: ThreadPoolExecutor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    async def run_wsgi_app(self, body: t.BinaryIO) -> None:
+        await sync_to_async(
+            _run_wsgi_app, thread_sensitive=False, executor=self.executor
+        )(self, body)
+
+
+class AsgiApp:
+    """ASGI application serving Flask app with one event loop per worker
+
+    Requests run in threads of the app's own executor. Async views run on
+    the server's event loop, which also carries all upstream traffic, so
+    every in-flight request of the worker shares one pool of lobby sessions.
+
+    Args:
+        app (Flask): Flask app to serve
+        max_threads (int, optional): most requests handled at once, more
+            wait for a free thread
+    """
+
+    def __init__(self, app: Flask, max_threads: int = REQUEST_THREADS):
+        self.app = app
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_threads, thread_name_prefix="asgi-request"
+        )
+
+    async def _lifespan(self, receive: Receive, send: Send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                session_loop.attach(asyncio.get_running_loop())
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                try:
+                    await session_pool.close()
+                except Exception:
+                    logging.warning("Failed to close lobby sessions", exc_info=True)
+                session_loop.detach()
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        # servers without lifespan support still get the loop on first request
+        session_loop.attach(asyncio.get_running_loop())
+        await _WsgiToAsgiInstance(self.app, self.executor)(scope, receive, send)
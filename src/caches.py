@@ -0,0 +1,525 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import typing as t
+from collections import OrderedDict
+
+T = t.TypeVar("T")
+
+# only plain uuids are cached, so keys are always safe file names
+CACHE_KEY_PATTERN = re.compile(r"^[0-9A-Za-z_-]{1,128}$")
+
+# full persistent tiers are trimmed to this share of their max size
+PERSISTENT_TRIM_RATIO = 0.9
+
+
+class CachedRecord(t.NamedTuple):
+    data: bytes
+    digest: str
+
+
+def make_cached_record(data: bytes) -> CachedRecord:
+    """Wrap serialized record with its content digest
+
+    Args:
+        data (bytes): serialized ResGameRecord
+
+    Returns:
+        CachedRecord: record with sha256 digest of data
+    """
+    return CachedRecord(data=data, digest=hashlib.sha256(data).hexdigest())
+
+
+def is_cacheable_key(key: str) -> bool:
+    return bool(CACHE_KEY_PATTERN.match(key))
+
+
+class RecordCache:
+    """Base class of game record cache backends
+
+    Backends store immutable serialized game records by game uuid and count
+    hits, misses, stores and evictions.
+    """
+
+    name = "base"
+    # whether records are read from disk rather than process memory
+    persistent = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def _get(self, key: str) -> t.Optional[CachedRecord]:
+        raise NotImplementedError
+
+    def _set(self, key: str, record: CachedRecord) -> None:
+        raise NotImplementedError
+
+    def _keys(self) -> t.List[str]:
+        raise NotImplementedError
+
+    def _peek(self, key: str) -> t.Optional[CachedRecord]:
+        return None
+
+    def get(self, key: str) -> t.Optional[CachedRecord]:
+        """Get cached record
+
+        Args:
+            key (str): uuid of Majsoul log
+
+        Returns:
+            Optional[CachedRecord]: cached record or None if missing
+        """
+        with self._lock:
+            record = self._get(key)
+            if record is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return record
+
+    def peek(self, key: str) -> t.Optional[CachedRecord]:
+        """Get record only if it is held in process memory
+
+        Misses are not counted, since the caller is expected to look up
+        persistent tiers with get next.
+
+        Args:
+            key (str): uuid of Majsoul log
+
+        Returns:
+            Optional[CachedRecord]: cached record or None if not in memory
+        """
+        with self._lock:
+            record = self._peek(key)
+            if record is not None:
+                self.hits += 1
+            return record
+
+    async def get_async(self, key: str) -> t.Optional[CachedRecord]:
+        """Get cached record without blocking the running event loop
+
+        Records in memory are returned at once, persistent tiers are read in
+        the default executor.
+
+        Args:
+            key (str): uuid of Majsoul log
+
+        Returns:
+            Optional[CachedRecord]: cached record or None if missing
+        """
+        record = self.peek(key)
+        if record is not None:
+            return record
+        if not self.persistent:
+            return self.get(key)
+        return await asyncio.get_running_loop().run_in_executor(None, self.get, key)
+
+    def set(self, key: str, record: CachedRecord) -> None:
+        """Store record
+
+        Args:
+            key (str): uuid of Majsoul log
+            record (CachedRecord): record to store
+        """
+        with self._lock:
+            self._set(key, record)
+            self.stores += 1
+
+    def keys(self) -> t.List[str]:
+        """List uuids of cached records
+
+        Returns:
+            List[str]: uuids of cached records
+        """
+        with self._lock:
+            return self._keys()
+
+    def stats(self) -> t.Dict[str, t.Any]:
+        return {
+            "backend": self.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+        }
+
+
+class MemoryRecordCache(RecordCache):
+    """In-process LRU cache bounded by total bytes
+
+    Args:
+        max_bytes (int): max total size of cached records
+    """
+
+    name = "memory"
+
+    def __init__(self, max_bytes: int):
+        super().__init__()
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._records = OrderedDict()  # type: OrderedDict[str, CachedRecord]
+
+    def _get(self, key: str) -> t.Optional[CachedRecord]:
+        record = self._records.get(key)
+        if record is not None:
+            self._records.move_to_end(key)
+        return record
+
+    def _peek(self, key: str) -> t.Optional[CachedRecord]:
+        return self._get(key)
+
+    def _set(self, key: str, record: CachedRecord) -> None:
+        if len(record.data) > self.max_bytes:
+            return
+        old_record = self._records.pop(key, None)
+        if old_record is not None:
+            self.size -= len(old_record.data)
+        self._records[key] = record
+        self.size += len(record.data)
+        while self.size > self.max_bytes:
+            _, evicted = self._records.popitem(last=False)
+            self.size -= len(evicted.data)
+            self.evictions += 1
+
+    def _keys(self) -> t.List[str]:
+        return list(self._records)
+
+    def stats(self) -> t.Dict[str, t.Any]:
+        stats = super().stats()
+        stats.update(
+            {
+                "entries": len(self._records),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+            }
+        )
+        return stats
+
+
+class SqliteRecordCache(RecordCache):
+    """Persistent cache stored in a SQLite database
+
+    When bounded, records stored longest ago are evicted first. Workers may
+    share the file, so its real size is read again before evicting.
+
+    Args:
+        path (str): path of database file
+        max_bytes (int, optional): max total size of records, 0 for no limit
+    """
+
+    name = "sqlite"
+    persistent = True
+
+    def __init__(self, path: str, max_bytes: int = 0):
+        super().__init__()
+        self.path = path
+        self.max_bytes = max_bytes
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            " uuid TEXT PRIMARY KEY,"
+            " digest TEXT NOT NULL,"
+            " data BLOB NOT NULL"
+            ")"
+        )
+        self._db.commit()
+        self.size = self._read_size()
+
+    def _read_size(self) -> int:
+        return self._db.execute(
+            "SELECT COALESCE(SUM(LENGTH(data)), 0) FROM records"
+        ).fetchone()[0]
+
+    def _get(self, key: str) -> t.Optional[CachedRecord]:
+        row = self._db.execute(
+            "SELECT data, digest FROM records WHERE uuid = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return CachedRecord(data=bytes(row[0]), digest=row[1])
+
+    def _set(self, key: str, record: CachedRecord) -> None:
+        if self.max_bytes and len(record.data) > self.max_bytes:
+            return
+        with self._db:
+            row = self._db.execute(
+                "SELECT LENGTH(data) FROM records WHERE uuid = ?", (key,)
+            ).fetchone()
+            # replaced rows get a new rowid, so rowid orders rows by store time
+            self._db.execute(
+                "INSERT OR REPLACE INTO records (uuid, digest, data) VALUES (?, ?, ?)",
+                (key, record.digest, record.data),
+            )
+        self.size += len(record.data) - (row[0] if row is not None else 0)
+        if self.max_bytes and self.size > self.max_bytes:
+            self._trim()
+
+    def _trim(self) -> None:
+        self.size = self._read_size()
+        target = self.max_bytes * PERSISTENT_TRIM_RATIO
+        while self.size > target:
+            rows = self._db.execute(
+                "SELECT uuid, LENGTH(data) FROM records ORDER BY rowid LIMIT 64"
+            ).fetchall()
+            if not rows:
+                break
+            with self._db:
+                for key, size in rows:
+                    self._db.execute("DELETE FROM records WHERE uuid = ?", (key,))
+                    self.size -= size
+                    self.evictions += 1
+                    if self.size <= target:
+                        break
+
+    def _keys(self) -> t.List[str]:
+        return [row[0] for row in self._db.execute("SELECT uuid FROM records")]
+
+    def stats(self) -> t.Dict[str, t.Any]:
+        stats = super().stats()
+        stats.update({"bytes": self.size, "max_bytes": self.max_bytes})
+        return stats
+
+
+class DirectoryRecordCache(RecordCache):
+    """Persistent cache stored as one file per record
+
+    When bounded, records stored longest ago are evicted first. Workers may
+    share the directory, so it is scanned again before evicting.
+
+    Args:
+        path (str): directory to store records
+        max_bytes (int, optional): max total size of records, 0 for no limit
+    """
+
+    name = "directory"
+    persistent = True
+
+    def __init__(self, path: str, max_bytes: int = 0):
+        super().__init__()
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+        # sizes of stored files, oldest first, only tracked when bounded
+        self._sizes = self._scan() if max_bytes else OrderedDict()
+        self.size = sum(self._sizes.values())
+        # digests of files read or written, by key with mtime and size of file
+        self._digests = {}  # type: t.Dict[str, t.Tuple[int, int, str]]
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.path, key + ".pb")
+
+    def _scan(self) -> "OrderedDict[str, int]":
+        entries = []  # type: t.List[t.Tuple[float, str, int]]
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if not entry.name.endswith(".pb"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, entry.name[:-3], stat.st_size))
+        entries.sort()
+        return OrderedDict((key, size) for _, key, size in entries)
+
+    def _get(self, key: str) -> t.Optional[CachedRecord]:
+        try:
+            with open(self._get_path(key), "rb") as f:
+                stat = os.fstat(f.fileno())
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        # files are replaced as a whole, so an unchanged stat means same data
+        known = self._digests.get(key)
+        if known is not None and known[:2] == (stat.st_mtime_ns, stat.st_size):
+            return CachedRecord(data=data, digest=known[2])
+        record = make_cached_record(data)
+        self._digests[key] = (stat.st_mtime_ns, stat.st_size, record.digest)
+        return record
+
+    def _set(self, key: str, record: CachedRecord) -> None:
+        if self.max_bytes and len(record.data) > self.max_bytes:
+            return
+        path = self._get_path(key)
+        tmp_path = "{}.{}.tmp".format(path, threading.get_ident())
+        with open(tmp_path, "wb") as f:
+            f.write(record.data)
+            stat = os.fstat(f.fileno())
+        os.replace(tmp_path, path)
+        self._digests[key] = (stat.st_mtime_ns, stat.st_size, record.digest)
+        if not self.max_bytes:
+            return
+        self.size += len(record.data) - self._sizes.pop(key, 0)
+        self._sizes[key] = len(record.data)
+        if self.size > self.max_bytes:
+            self._trim()
+
+    def _trim(self) -> None:
+        self._sizes = self._scan()
+        self.size = sum(self._sizes.values())
+        target = self.max_bytes * PERSISTENT_TRIM_RATIO
+        while self.size > target and self._sizes:
+            key, size = self._sizes.popitem(last=False)
+            self._digests.pop(key, None)
+            try:
+                os.remove(self._get_path(key))
+            except FileNotFoundError:
+                pass
+            self.size -= size
+            self.evictions += 1
+
+    def _keys(self) -> t.List[str]:
+        return [name[:-3] for name in os.listdir(self.path) if name.endswith(".pb")]
+
+    def stats(self) -> t.Dict[str, t.Any]:
+        stats = super().stats()
+        if self.max_bytes:
+            stats.update({"bytes": self.size, "max_bytes": self.max_bytes})
+        return stats
+
+
+class TieredRecordCache(RecordCache):
+    """Cache looking up tiers in order and promoting hits to faster tiers
+
+    Args:
+        tiers (List[RecordCache]): caches from fastest to slowest
+    """
+
+    name = "tiered"
+
+    def __init__(self, tiers: t.List[RecordCache]):
+        super().__init__()
+        self.tiers = tiers
+        self.persistent = any(tier.persistent for tier in tiers)
+
+    def _get(self, key: str) -> t.Optional[CachedRecord]:
+        for i, tier in enumerate(self.tiers):
+            record = tier.get(key)
+            if record is not None:
+                for upper_tier in self.tiers[:i]:
+                    upper_tier.set(key, record)
+                return record
+        return None
+
+    def _peek(self, key: str) -> t.Optional[CachedRecord]:
+        for tier in self.tiers:
+            record = tier.peek(key)
+            if record is not None:
+                return record
+        return None
+
+    def _set(self, key: str, record: CachedRecord) -> None:
+        for tier in self.tiers:
+            tier.set(key, record)
+
+    def _keys(self) -> t.List[str]:
+        keys = {}  # type: t.Dict[str, None]
+        for tier in self.tiers:
+            keys.update(dict.fromkeys(tier.keys()))
+        return list(keys)
+
+    def stats(self) -> t.Dict[str, t.Any]:
+        stats = super().stats()
+        stats["tiers"] = [tier.stats() for tier in self.tiers]
+        return stats
+
+
+def create_record_cache(
+    memory_bytes: int, path: str = "", path_max_bytes: int = 0
+) -> t.Optional[RecordCache]:
+    """Create record cache from settings
+
+    Args:
+        memory_bytes (int): size of in-process tier, 0 to disable it
+        path (str, optional): SQLite file (*.db, *.sqlite, *.sqlite3) or directory of
+            persistent tier, empty to disable it
+        path_max_bytes (int, optional): size of persistent tier, 0 for no limit
+
+    Returns:
+        Optional[RecordCache]: configured cache or None if every tier is disabled
+    """
+    tiers = []  # type: t.List[RecordCache]
+    if memory_bytes > 0:
+        tiers.append(MemoryRecordCache(memory_bytes))
+    if path:
+        if os.path.splitext(path)[1] in (".db", ".sqlite", ".sqlite3"):
+            tiers.append(SqliteRecordCache(path, path_max_bytes))
+        else:
+            tiers.append(DirectoryRecordCache(path, path_max_bytes))
+    logging.info(f"Record cache tiers: {[tier.name for tier in tiers]}")
+    if not tiers:
+        return None
+    if len(tiers) == 1:
+        return tiers[0]
+    return TieredRecordCache(tiers)
+
+
+class RefreshingValue(t.Generic[T]):
+    """Value loaded by an async function and refreshed in the background
+
+    The first get loads the value. After ttl seconds get still returns the
+    stale value at once and starts a single background refresh. A failed
+    refresh keeps the stale value. Must only be used from a single event loop.
+
+    Args:
+        load (Callable[[], Awaitable[T]]): loads a fresh value
+        ttl (float): seconds before the value is refreshed
+    """
+
+    def __init__(self, load: t.Callable[[], t.Awaitable[T]], ttl: float):
+        self._load = load
+        self.ttl = ttl
+        self._value = None  # type: t.Optional[T]
+        self._loaded_at = 0.0
+        self._task = None  # type: t.Optional[asyncio.Future]
+        self.loads = 0
+        self.failures = 0
+
+    async def _refresh(self) -> T:
+        try:
+            value = await self._load()
+        except Exception:
+            self.failures += 1
+            raise
+        self._value = value
+        self._loaded_at = time.monotonic()
+        self.loads += 1
+        return value
+
+    def _start_refresh(self) -> asyncio.Future:
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._refresh())
+        return self._task
+
+    def _log_refresh_error(self, task: asyncio.Future) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logging.warning(
+                "Background refresh failed, keeping stale value",
+                exc_info=task.exception(),
+            )
+
+    async def get(self) -> T:
+        """Get value, loading it on first use
+
+        Returns:
+            T: cached or freshly loaded value
+        """
+        if self._value is None:
+            return await asyncio.shield(self._start_refresh())
+        if time.monotonic() - self._loaded_at >= self.ttl:
+            if self._task is None or self._task.done():
+                self._start_refresh().add_done_callback(self._log_refresh_error)
+        return self._value
+
+    def invalidate(self) -> None:
+        """Drop value so the next get loads it again"""
+        self._value = None
@@ -0,0 +1,496 @@
+import json
+import mmap
+import struct
+import sys
+import typing as t
+from array import array
+
+from src.records import RECORD_TYPES, WRAPPER_NAME_PREFIX
+
+# file starts with MAGIC, little-endian uint32 header size and json header,
+# followed by little-endian column buffers aligned to ALIGNMENT bytes
+MAGIC = b"MJCOLv1\n"
+ALIGNMENT = 8
+FORMAT_VERSION = 2
+
+# tile codes are indexes of TILES, 0m/0p/0s are red fives
+TILES = [f"{number}{suit}" for suit in "mps" for number in range(10)] + [
+    f"{number}z" for number in range(1, 8)
+]  # type: t.List[str]
+TILE_CODES = {tile: code for code, tile in enumerate(TILES)}  # type: t.Dict[str, int]
+NO_TILE = 255
+NO_SEAT = -1
+
+# table name to columns of (name, kind), kind is an array typecode, "str" for
+# strings or "list:<typecode>" for variable length lists
+SCHEMA = {
+    "games": [
+        ("uuid", "str"),
+        ("room_id", "i"),
+        ("start_time", "q"),
+        ("end_time", "q"),
+    ],
+    "players": [
+        ("game", "I"),
+        ("seat", "B"),
+        ("account_id", "I"),
+        ("nickname", "str"),
+        ("final_point", "i"),
+    ],
+    "rounds": [
+        ("game", "I"),
+        ("chang", "B"),
+        ("ju", "B"),
+        ("ben", "H"),
+        ("dora", "B"),
+        ("doras", "list:B"),
+        ("liqibang", "H"),
+        ("scores", "list:i"),
+        ("tiles0", "list:B"),
+        ("tiles1", "list:B"),
+        ("tiles2", "list:B"),
+        ("tiles3", "list:B"),
+    ],
+    "actions": [
+        ("game", "I"),
+        ("round", "I"),
+        ("kind", "B"),
+        ("seat", "b"),
+        ("tile", "B"),
+        ("type", "B"),
+        ("flags", "B"),
+        ("tiles", "list:B"),
+        ("froms", "list:B"),
+        ("doras", "list:B"),
+    ],
+    "hules": [
+        ("game", "I"),
+        ("round", "I"),
+        ("action", "I"),
+        ("seat", "B"),
+        ("zimo", "B"),
+        ("count", "H"),
+        ("fu", "H"),
+        ("point_sum", "I"),
+        ("hu_tile", "B"),
+        ("fan_ids", "list:H"),
+        ("fan_vals", "list:H"),
+    ],
+    "results": [
+        ("game", "I"),
+        ("round", "I"),
+        ("action", "I"),
+        ("delta_scores", "list:i"),
+        ("scores", "list:i"),
+        ("tingpai", "list:B"),
+        ("liujumanguan", "B"),
+    ],
+}  # type: t.Dict[str, t.List[t.Tuple[str, str]]]
+
+# bits of actions.flags, set on discards
+FLAG_MOQIE = 1
+FLAG_LIQI = 2
+
+# records ending a round, each has a row in results
+RESULT_RECORD_NAMES = frozenset(["RecordHule", "RecordNoTile", "RecordLiuJu"])
+
+ColumnSpec = t.Dict[str, t.Any]
+
+
+def encode_tile(tile: t.Optional[str]) -> int:
+    if not tile:
+        return NO_TILE
+    return TILE_CODES.get(tile, NO_TILE)
+
+
+def decode_tile(code: int) -> t.Optional[str]:
+    return TILES[code] if code < len(TILES) else None
+
+
+class _ListBuilder:
+    __slots__ = ("offsets", "values")
+
+    def __init__(self, typecode: str):
+        self.offsets = array("I", [0])
+        self.values = array(typecode)
+
+    def append(self, items: t.Iterable[t.Any]) -> None:
+        self.values.extend(items)
+        self.offsets.append(len(self.values))
+
+
+class _StringBuilder(_ListBuilder):
+    def __init__(self):
+        super().__init__("B")
+
+    def append(self, items: t.Iterable[t.Any]) -> None:
+        self.values.frombytes(str(items).encode("utf-8"))
+        self.offsets.append(len(self.values))
+
+
+def _make_builder(kind: str) -> t.Any:
+    if kind == "str":
+        return _StringBuilder()
+    if kind.startswith("list:"):
+        return _ListBuilder(kind[len("list:") :])
+    return array(kind)
+
+
+class ColumnarWriter:
+    """Build columnar tables from game logs
+
+    Keeps games, players, rounds with starting hands, round actions, wins
+    and score changes of round results. Tiles are stored as one byte codes
+    and record names as codes of the ``kinds`` dictionary in the header.
+    Fields of records not listed in SCHEMA are dropped.
+    """
+
+    def __init__(self):
+        self.kinds = []  # type: t.List[str]
+        self._kind_codes = {}  # type: t.Dict[str, t.Tuple[int, bool]]
+        self.tables = {
+            table: {name: _make_builder(kind) for name, kind in columns}
+            for table, columns in SCHEMA.items()
+        }  # type: t.Dict[str, t.Dict[str, t.Any]]
+
+    def _append(self, table: str, **values: t.Any) -> None:
+        for name, column in self.tables[table].items():
+            column.append(values[name])
+
+    def _get_kind(self, name: str) -> t.Tuple[int, bool]:
+        kind = self._kind_codes.get(name)
+        if kind is None:
+            record_type = RECORD_TYPES.get(WRAPPER_NAME_PREFIX + name)
+            has_seat = record_type is not None and (
+                "seat" in record_type.message_class.DESCRIPTOR.fields_by_name
+            )
+            kind = self._kind_codes[name] = (len(self.kinds), has_seat)
+            self.kinds.append(name)
+        return kind
+
+    def add_log(self, log: t.Dict[str, t.Any]) -> None:
+        """Add game log in the shape returned by get_log
+
+        Args:
+            log (Dict[str, Any]): game head with records
+        """
+        head = log["head"]
+        game = len(self.tables["games"]["room_id"])
+        # fields with default values are omitted from log
+        self._append(
+            "games",
+            uuid=head.get("uuid", ""),
+            room_id=head.get("config", {}).get("meta", {}).get("roomId", 0),
+            start_time=int(head.get("startTime", 0)),
+            end_time=int(head.get("endTime", 0)),
+        )
+
+        final_points = {
+            player.get("seat", 0): player.get("partPoint1", 0)
+            for player in head.get("result", {}).get("players", [])
+        }
+        for account in head.get("accounts", []):
+            seat = account.get("seat", 0)
+            self._append(
+                "players",
+                game=game,
+                seat=seat,
+                account_id=account.get("accountId", 0),
+                nickname=account.get("nickname", ""),
+                final_point=final_points.get(seat, 0),
+            )
+
+        round_index = -1
+        for record in log.get("records", []):
+            name = record["name"]
+            data = record["data"]
+            if name == "RecordNewRound":
+                round_index = len(self.tables["rounds"]["chang"])
+                self._append(
+                    "rounds",
+                    game=game,
+                    chang=data.get("chang", 0),
+                    ju=data.get("ju", 0),
+                    ben=data.get("ben", 0),
+                    dora=encode_tile(data.get("dora")),
+                    doras=[encode_tile(tile) for tile in data.get("doras", [])],
+                    liqibang=data.get("liqibang", 0),
+                    scores=data.get("scores", []),
+                    **{
+                        f"tiles{seat}": [
+                            encode_tile(tile) for tile in data.get(f"tiles{seat}", [])
+                        ]
+                        for seat in range(4)
+                    },
+                )
+            if round_index < 0:
+                continue
+            self._add_action(game, round_index, name, data)
+
+    def _add_action(
+        self, game: int, round_index: int, name: str, data: t.Dict[str, t.Any]
+    ) -> None:
+        action = len(self.tables["actions"]["kind"])
+        kind, has_seat = self._get_kind(name)
+        tiles = data.get("tiles", [])
+        if isinstance(tiles, str):
+            # RecordAnGangAddGang has a single tile string
+            tiles = [tiles]
+        # doras of a new round are kept in rounds, others are revealed by the action
+        doras = data.get("doras", []) if name != "RecordNewRound" else []
+        flags = 0
+        if data.get("moqie"):
+            flags |= FLAG_MOQIE
+        if data.get("isLiqi") or data.get("isWliqi"):
+            flags |= FLAG_LIQI
+        self._append(
+            "actions",
+            game=game,
+            round=round_index,
+            kind=kind,
+            seat=data.get("seat", 0) if has_seat else NO_SEAT,
+            tile=encode_tile(data.get("tile")),
+            type=data.get("type", 0),
+            flags=flags,
+            tiles=[encode_tile(tile) for tile in tiles],
+            froms=data.get("froms", []),
+            doras=[encode_tile(tile) for tile in doras],
+        )
+        if name in RESULT_RECORD_NAMES:
+            self._add_result(game, round_index, action, name, data)
+
+        for hule in data.get("hules", []) if name == "RecordHule" else []:
+            fans = hule.get("fans", [])
+            self._append(
+                "hules",
+                game=game,
+                round=round_index,
+                action=action,
+                seat=hule.get("seat", 0),
+                zimo=int(hule.get("zimo", False)),
+                count=hule.get("count", 0),
+                fu=hule.get("fu", 0),
+                point_sum=hule.get("pointSum", 0),
+                hu_tile=encode_tile(hule.get("huTile")),
+                fan_ids=[fan.get("id", 0) for fan in fans],
+                fan_vals=[fan.get("val", 0) for fan in fans],
+            )
+
+    def _add_result(
+        self,
+        game: int,
+        round_index: int,
+        action: int,
+        name: str,
+        data: t.Dict[str, t.Any],
+    ) -> None:
+        delta_scores = data.get("deltaScores", [])
+        scores = data.get("scores", []) if name == "RecordHule" else []
+        if name == "RecordNoTile":
+            # nagashi mangan pays once per player, other draws have one payment
+            payments = data.get("scores", [])
+            old_scores = payments[0].get("oldScores", []) if payments else []
+            delta_scores = [0] * len(old_scores)
+            for payment in payments:
+                for seat, delta in enumerate(payment.get("deltaScores", [])):
+                    if seat < len(delta_scores):
+                        delta_scores[seat] += delta
+            scores = [old + delta for old, delta in zip(old_scores, delta_scores)]
+        self._append(
+            "results",
+            game=game,
+            round=round_index,
+            action=action,
+            delta_scores=delta_scores,
+            scores=scores,
+            tingpai=[
+                int(player.get("tingpai", False)) for player in data.get("players", [])
+            ],
+            liujumanguan=int(data.get("liujumanguan", False)),
+        )
+
+    def to_bytes(self) -> bytes:
+        """Serialize tables into columnar file
+
+        Returns:
+            bytes: file content
+        """
+        buffers = []  # type: t.List[bytes]
+        position = [0]
+
+        def add_buffer(values: array) -> ColumnSpec:
+            if sys.byteorder == "big":
+                values = array(values.typecode, values)
+                values.byteswap()
+            data = values.tobytes()
+            spec = {
+                "type": values.typecode,
+                "offset": position[0],
+                "count": len(values),
+            }
+            padding = -len(data) % ALIGNMENT
+            buffers.append(data + b"\0" * padding)
+            position[0] += len(data) + padding
+            return spec
+
+        tables = {}  # type: t.Dict[str, t.Any]
+        for table, columns in self.tables.items():
+            specs = {}  # type: t.Dict[str, ColumnSpec]
+            length = 0
+            for name, kind in SCHEMA[table]:
+                column = columns[name]
+                if isinstance(column, _ListBuilder):
+                    specs[name] = {
+                        "kind": kind,
+                        "offsets": add_buffer(column.offsets),
+                        "values": add_buffer(column.values),
+                    }
+                    length = len(column.offsets) - 1
+                else:
+                    specs[name] = {"kind": kind, "values": add_buffer(column)}
+                    length = len(column)
+            tables[table] = {"length": length, "columns": specs}
+
+        header = json.dumps(
+            {
+                "version": FORMAT_VERSION,
+                "tiles": TILES,
+                "kinds": self.kinds,
+                "tables": tables,
+            },
+            separators=(",", ":"),
+        ).encode("utf-8")
+        prefix_size = len(MAGIC) + 4 + len(header)
+        header += b" " * (-prefix_size % ALIGNMENT)
+        return b"".join([MAGIC, struct.pack("<I", len(header)), header] + buffers)
+
+
+def write_columnar(logs: t.Iterable[t.Dict[str, t.Any]]) -> bytes:
+    """Convert game logs into columnar file
+
+    Args:
+        logs (Iterable[Dict[str, Any]]): game logs in the shape returned by get_log
+
+    Returns:
+        bytes: file content
+    """
+    writer = ColumnarWriter()
+    for log in logs:
+        writer.add_log(log)
+    return writer.to_bytes()
+
+
+class ListColumn(t.Sequence[t.Any]):
+    """Column of variable length lists, each item is a slice of values"""
+
+    def __init__(self, offsets: t.Sequence[int], values: t.Sequence[t.Any]):
+        self.offsets = offsets
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: t.Any) -> t.Any:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        return self.values[self.offsets[index] : self.offsets[index + 1]]
+
+
+class StringColumn(ListColumn):
+    def __getitem__(self, index: t.Any) -> t.Any:
+        if isinstance(index, slice):
+            return super().__getitem__(index)
+        return bytes(super().__getitem__(index)).decode("utf-8")
+
+
+class ColumnarFile:
+    """Columnar file opened without copying its columns
+
+    Numeric columns are memoryviews over the buffer, so a memory-mapped file
+    is only read as its columns are accessed. Columns must be released
+    before the file is closed.
+
+    Args:
+        buffer (Any): object supporting the buffer protocol with file content
+    """
+
+    def __init__(self, buffer: t.Any):
+        self._mmap = None  # type: t.Optional[mmap.mmap]
+        self._buffer = memoryview(buffer)
+        if bytes(self._buffer[: len(MAGIC)]) != MAGIC:
+            raise ValueError("Not a columnar game log file")
+        (header_size,) = struct.unpack_from("<I", self._buffer, len(MAGIC))
+        data_start = len(MAGIC) + 4 + header_size
+        header = json.loads(bytes(self._buffer[len(MAGIC) + 4 : data_start]))
+        if header["version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported columnar version: {header['version']}")
+        self.header = header
+        self.kinds = header["kinds"]  # type: t.List[str]
+        self._data = self._buffer[data_start:]
+
+    @classmethod
+    def open(cls, path: str) -> "ColumnarFile":
+        """Memory-map columnar file
+
+        Args:
+            path (str): path of file
+
+        Returns:
+            ColumnarFile: opened file, close it when done
+        """
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            columnar_file = cls(mapped)
+        except BaseException:
+            mapped.close()
+            raise
+        columnar_file._mmap = mapped
+        return columnar_file
+
+    def close(self) -> None:
+        self._data.release()
+        self._buffer.release()
+        if self._mmap is not None:
+            self._mmap.close()
+
+    def __enter__(self) -> "ColumnarFile":
+        return self
+
+    def __exit__(self, *args: t.Any) -> None:
+        self.close()
+
+    def _get_buffer(self, spec: ColumnSpec) -> t.Sequence[t.Any]:
+        start = spec["offset"]
+        size = array(spec["type"]).itemsize * spec["count"]
+        view = self._data[start : start + size]
+        if sys.byteorder == "big":
+            values = array(spec["type"])
+            values.frombytes(view)
+            values.byteswap()
+            return values
+        return view.cast(spec["type"])
+
+    def table_length(self, table: str) -> int:
+        return self.header["tables"][table]["length"]
+
+    def column(self, table: str, name: str) -> t.Sequence[t.Any]:
+        """Get column of table
+
+        Args:
+            table (str): table name (games, players, rounds, actions, hules or
+                results)
+            name (str): column name
+
+        Returns:
+            Sequence[Any]: numbers, ListColumn of lists or StringColumn of str
+        """
+        spec = self.header["tables"][table]["columns"][name]
+        values = self._get_buffer(spec["values"])
+        if spec["kind"] == "str":
+            return StringColumn(self._get_buffer(spec["offsets"]), values)
+        if spec["kind"].startswith("list:"):
+            return ListColumn(self._get_buffer(spec["offsets"]), values)
+        return values
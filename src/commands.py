@@ -0,0 +1,59 @@
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+import ms.protocol_pb2 as pb
+
+from src.ms_apis import game_archive, record_cache
+from src.summaries import GameSummary, summarize_game_record
+from src.validations import DEFAULT_RULESET
+
+
+@click.command("rebuild-archive")
+@click.option(
+    "--from-cache",
+    is_flag=True,
+    help="Summarize every game record in the record cache into the archive first.",
+)
+@click.option(
+    "--ruleset",
+    default=DEFAULT_RULESET.name,
+    help="Ruleset cached games should follow to be archived.",
+)
+@with_appcontext
+def rebuild_archive_command(from_cache: bool, ruleset: str) -> None:
+    """Recompute player and room totals of the game archive"""
+    validators = current_app.config["VALIDATORS"]
+    if ruleset not in validators:
+        raise click.BadParameter(
+            f"It should be one of {', '.join(validators)}.", param_hint="--ruleset"
+        )
+    if game_archive is None:
+        raise click.ClickException(
+            "Game archive is disabled, set MAJSOUL_ARCHIVE_PATH."
+        )
+
+    if from_cache:
+        if record_cache is None:
+            raise click.ClickException("Record cache is disabled.")
+        added = 0
+        unchanged = 0
+        skipped = 0
+        for uuid in record_cache.keys():
+            cached_record = record_cache.get(uuid)
+            if cached_record is None:
+                continue
+            res = pb.ResGameRecord.FromString(cached_record.data)
+            summary = summarize_game_record(res, validators[ruleset])
+            if not isinstance(summary, GameSummary):
+                skipped += 1
+            elif game_archive.add(summary):
+                added += 1
+            else:
+                unchanged += 1
+        click.echo(
+            f"Archived {added} cached games, {unchanged} were unchanged,"
+            f" skipped {skipped} invalid games"
+        )
+
+    games = game_archive.rebuild_stats()
+    click.echo(f"Recomputed totals of {games} games")
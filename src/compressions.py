@@ -0,0 +1,127 @@
+import json
+import zlib
+import typing as t
+
+from werkzeug.datastructures import Accept
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+IDENTITY = "identity"
+
+# compresses chunks and flushes the rest at the end
+StreamCompressor = t.Tuple[t.Callable[[bytes], bytes], t.Callable[[], bytes]]
+
+
+def _open_gzip() -> StreamCompressor:
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress, compressor.flush
+
+
+def _open_brotli() -> StreamCompressor:
+    compressor = brotli.Compressor(quality=9)
+    return compressor.process, compressor.finish
+
+
+def _open_zstd() -> StreamCompressor:
+    compressor = zstandard.ZstdCompressor(level=12).compressobj()
+    return compressor.compress, compressor.flush
+
+
+# bodies are compressed once and stored, so levels favor size over speed
+COMPRESSORS = {}  # type: t.Dict[str, t.Callable[[], StreamCompressor]]
+if brotli is not None:
+    COMPRESSORS["br"] = _open_brotli
+if zstandard is not None:
+    COMPRESSORS["zstd"] = _open_zstd
+COMPRESSORS["gzip"] = _open_gzip
+
+
+def negotiate_coding(accept_encodings: Accept) -> str:
+    """Choose content coding for Accept-Encoding of request
+
+    Codings of equal quality are chosen in order of COMPRESSORS, and identity
+    is chosen when client prefers it or accepts no available coding.
+
+    Args:
+        accept_encodings (Accept): parsed Accept-Encoding header
+
+    Returns:
+        str: name of content coding, identity if body is sent as is
+    """
+    coding = accept_encodings.best_match(list(COMPRESSORS) + [IDENTITY])
+    return coding if coding is not None else IDENTITY
+
+
+def iter_compressed(coding: str, chunks: t.Iterable[bytes]) -> t.Iterator[bytes]:
+    """Compress chunks of body with content coding as they are consumed
+
+    Args:
+        coding (str): name of content coding from negotiate_coding
+        chunks (Iterable[bytes]): chunks of body
+
+    Yields:
+        bytes: compressed chunks, chunks themselves for identity
+    """
+    if coding == IDENTITY:
+        yield from chunks
+        return
+    compress_chunk, flush = COMPRESSORS[coding]()
+    for chunk in chunks:
+        compressed = compress_chunk(chunk)
+        if compressed:
+            yield compressed
+    yield flush()
+
+
+def compress(coding: str, body: bytes) -> bytes:
+    """Compress body with content coding
+
+    Args:
+        coding (str): name of content coding from negotiate_coding
+        body (bytes): body to compress
+
+    Returns:
+        bytes: compressed body, body itself for identity
+    """
+    if coding == IDENTITY:
+        return body
+    return b"".join(iter_compressed(coding, [body]))
+
+
+class StoredResponse(t.NamedTuple):
+    headers: t.Dict[str, str]
+    # body encoded with content coding it is stored for
+    body: bytes
+
+
+def pack_response(response: StoredResponse) -> bytes:
+    """Serialize stored response as json line of headers followed by body
+
+    Args:
+        response (StoredResponse): response to serialize
+
+    Returns:
+        bytes: serialized response
+    """
+    return json.dumps(response.headers).encode() + b"\n" + response.body
+
+
+def unpack_response(data: bytes) -> StoredResponse:
+    """Deserialize response serialized by pack_response
+
+    Args:
+        data (bytes): serialized response
+
+    Returns:
+        StoredResponse: headers and body of response
+    """
+    headers, _, body = data.partition(b"\n")
+    return StoredResponse(headers=json.loads(headers), body=body)
@@ -99,3 +99,8 @@ IMPORTANT_YAKUS = [
     "돌 위에서 삼년",
     "대칠성",
 ]  # type: t.List[str]
+
+# fan ids of IMPORTANT_YAKUS, so yakus are classified without name lookups
+IMPORTANT_YAKU_IDS = frozenset(
+    fan_id for fan_id, yaku in YAKU_MAP.items() if yaku in IMPORTANT_YAKUS
+)  # type: t.FrozenSet[int]
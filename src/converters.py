@@ -0,0 +1,155 @@
+import base64
+import math
+import typing as t
+
+from google.protobuf.descriptor import Descriptor, FieldDescriptor
+from google.protobuf.internal import type_checkers
+from google.protobuf.json_format import MessageToDict
+from google.protobuf.message import Message
+
+ValueConverter = t.Callable[[t.Any], t.Any]
+FieldConverter = t.Tuple[str, ValueConverter]
+
+_INT64_TYPES = (FieldDescriptor.CPPTYPE_INT64, FieldDescriptor.CPPTYPE_UINT64)
+
+# converters are built once per field and reused for every message
+_field_converters = {}  # type: t.Dict[FieldDescriptor, FieldConverter]
+
+
+def _is_well_known_type(descriptor: Descriptor) -> bool:
+    return descriptor.file.name.startswith("google/protobuf/")
+
+
+def _convert_identity(value: t.Any) -> t.Any:
+    return value
+
+
+def _convert_bytes(value: bytes) -> str:
+    return base64.b64encode(value).decode("utf-8")
+
+
+def _convert_int64(value: int) -> str:
+    return str(value)
+
+
+def _convert_double(value: float) -> t.Any:
+    if math.isinf(value):
+        return "-Infinity" if value < 0.0 else "Infinity"
+    if math.isnan(value):
+        return "NaN"
+    return value
+
+
+def _convert_float(value: float) -> t.Any:
+    if math.isinf(value) or math.isnan(value):
+        return _convert_double(value)
+    # same shortest representation as json_format uses for 32-bit floats
+    return type_checkers.ToShortestFloat(value)  # type: ignore[attr-defined]
+
+
+def _convert_map_key(key: t.Any) -> str:
+    if isinstance(key, bool):
+        return "true" if key else "false"
+    return str(key)
+
+
+def _make_enum_converter(field: FieldDescriptor) -> ValueConverter:
+    enum_type = field.enum_type
+    if enum_type.full_name == "google.protobuf.NullValue":
+        return lambda value: None
+    names = {value.number: value.name for value in enum_type.values}
+    is_closed = getattr(enum_type, "is_closed", False)
+
+    def convert_enum(value: int) -> t.Any:
+        name = names.get(value)
+        if name is not None:
+            return name
+        if is_closed:
+            raise ValueError(
+                f"Enum field {field.full_name} contains unknown value {value}."
+            )
+        return value
+
+    return convert_enum
+
+
+def _make_value_converter(field: FieldDescriptor) -> ValueConverter:
+    cpp_type = field.cpp_type
+    if cpp_type == FieldDescriptor.CPPTYPE_MESSAGE:
+        if _is_well_known_type(field.message_type):
+            return MessageToDict
+        return message_to_dict
+    if cpp_type == FieldDescriptor.CPPTYPE_ENUM:
+        return _make_enum_converter(field)
+    if cpp_type == FieldDescriptor.CPPTYPE_STRING:
+        if field.type == FieldDescriptor.TYPE_BYTES:
+            return _convert_bytes
+        return _convert_identity
+    if cpp_type == FieldDescriptor.CPPTYPE_BOOL:
+        return bool
+    if cpp_type in _INT64_TYPES:
+        return _convert_int64
+    if cpp_type == FieldDescriptor.CPPTYPE_FLOAT:
+        return _convert_float
+    if cpp_type == FieldDescriptor.CPPTYPE_DOUBLE:
+        return _convert_double
+    return _convert_identity
+
+
+def _make_field_converter(field: FieldDescriptor) -> FieldConverter:
+    if field.is_extension:
+        name = "[{}]".format(field.full_name)
+    else:
+        name = field.json_name  # type: ignore[attr-defined]
+
+    message_type = field.message_type
+    if message_type is not None and message_type.GetOptions().map_entry:
+        value_converter = _make_value_converter(message_type.fields_by_name["value"])
+
+        def convert_map(value: t.Mapping) -> t.Dict[str, t.Any]:
+            return {_convert_map_key(key): value_converter(value[key]) for key in value}
+
+        return name, convert_map
+
+    value_converter = _make_value_converter(field)
+    if field.label == FieldDescriptor.LABEL_REPEATED:
+        if value_converter is _convert_identity:
+            return name, list
+
+        def convert_repeated(value: t.Iterable) -> t.List[t.Any]:
+            return [value_converter(item) for item in value]
+
+        return name, convert_repeated
+
+    return name, value_converter
+
+
+def message_to_dict(
+    message: Message, exclude_fields: t.Container[str] = ()
+) -> t.Dict[str, t.Any]:
+    """Convert protobuf message to dict
+
+    Output is identical to ``json.loads(MessageToJson(message))`` but built in
+    one pass without the intermediate json string.
+
+    Args:
+        message (Message): protobuf message
+        exclude_fields (Container[str], optional): names of top-level fields
+            to leave out without converting them
+
+    Returns:
+        Dict[str, Any]: message as dict with camelCase keys
+    """
+    if _is_well_known_type(message.DESCRIPTOR):
+        return MessageToDict(message)
+
+    result = {}
+    for field, value in message.ListFields():
+        if field.name in exclude_fields:
+            continue
+        converter = _field_converters.get(field)
+        if converter is None:
+            converter = _field_converters[field] = _make_field_converter(field)
+        name, convert = converter
+        result[name] = convert(value)
+    return result
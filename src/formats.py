@@ -0,0 +1,48 @@
+import typing as t
+
+from werkzeug.datastructures import MIMEAccept
+
+from src.jsons import JSON_MIMETYPE
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+PROTOBUF_MIMETYPE = "application/x-protobuf"
+MSGPACK_MIMETYPE = "application/msgpack"
+MSGPACK_MIMETYPES = (MSGPACK_MIMETYPE, "application/x-msgpack")
+
+# formats of /uuid-raw, json first so */* and unknown types get json
+RAW_FORMATS = [JSON_MIMETYPE, PROTOBUF_MIMETYPE]  # type: t.List[str]
+if msgpack is not None:
+    RAW_FORMATS.extend(MSGPACK_MIMETYPES)
+
+
+def negotiate_raw_format(accept_mimetypes: MIMEAccept) -> str:
+    """Choose format of raw log for Accept of request
+
+    Args:
+        accept_mimetypes (MIMEAccept): parsed Accept header
+
+    Returns:
+        str: mimetype of format, json if client accepts no available format
+    """
+    mimetype = accept_mimetypes.best_match(RAW_FORMATS)
+    if mimetype is None:
+        return JSON_MIMETYPE
+    if mimetype in MSGPACK_MIMETYPES:
+        return MSGPACK_MIMETYPE
+    return mimetype
+
+
+def pack_msgpack(obj: t.Any) -> bytes:
+    """Serialize object into MessagePack
+
+    Args:
+        obj (Any): json-style object to serialize
+
+    Returns:
+        bytes: MessagePack of object
+    """
+    return msgpack.packb(obj, use_bin_type=True)
@@ -0,0 +1,101 @@
+import json
+import typing as t
+
+from flask import Response
+import ms.protocol_pb2 as pb
+
+from src.converters import message_to_dict
+from src.records import GameRecordView
+
+try:
+    import orjson
+
+    HAS_ORJSON = True
+except ImportError:  # pragma: no cover
+    HAS_ORJSON = False
+
+JSON_MIMETYPE = "application/json"
+
+# streamed json is sent in chunks of about this size
+STREAM_CHUNK_BYTES = 64 << 10
+
+
+def dumps(obj: t.Any) -> bytes:
+    """Serialize object into compact UTF-8 json
+
+    orjson is used when it is installed, json module otherwise.
+
+    Args:
+        obj (Any): object to serialize
+
+    Returns:
+        bytes: json
+    """
+    if HAS_ORJSON:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def json_response(obj: t.Any) -> Response:
+    """Make json response with the fastest available encoder
+
+    Args:
+        obj (Any): object to serialize
+
+    Returns:
+        Response: json response
+    """
+    return Response(dumps(obj), mimetype=JSON_MIMETYPE)
+
+
+def iter_log_json(
+    res: pb.ResGameRecord,
+    record_names: t.Optional[t.Container[str]] = None,
+    fields: t.Optional[t.Container[str]] = None,
+) -> t.Iterator[bytes]:
+    """Serialize game record as json of make_log, decoding records on the way
+
+    Head is sent first and each record is decoded and serialized only when
+    the previous chunk is consumed, so memory does not grow with the number
+    of records.
+
+    Args:
+        res (ResGameRecord): response of fetchGameRecord
+        record_names (Container[str], optional): record names to decode, None for all
+        fields (Container[str], optional): top-level fields to send, None for all
+
+    Yields:
+        bytes: chunks of json, same document as
+            dumps(make_log(res, record_names, fields))
+    """
+    data = message_to_dict(res, exclude_fields=("data",))
+    if "error" in data:
+        yield dumps(data)
+        return
+    if fields is not None:
+        data = {name: value for name, value in data.items() if name in fields}
+        if "records" not in fields:
+            yield dumps(data)
+            return
+
+    # container is parsed before the first chunk, so broken data fails the request
+    records = GameRecordView(res).filter(record_names)
+
+    head = dumps(data)[:-1]
+    yield head + (b',"records":[' if data else b'"records":[')
+
+    chunk = []  # type: t.List[bytes]
+    size = 0
+    separator = b""
+    for record in records:
+        encoded = dumps(record.to_dict())
+        chunk.append(separator)
+        chunk.append(encoded)
+        separator = b","
+        size += len(encoded) + 1
+        if size >= STREAM_CHUNK_BYTES:
+            yield b"".join(chunk)
+            chunk = []
+            size = 0
+    chunk.append(b"]}")
+    yield b"".join(chunk)
@@ -0,0 +1,268 @@
+import bisect
+import contextvars
+import math
+import threading
+import time
+import typing as t
+from contextlib import contextmanager
+
+LabelValues = t.Tuple[str, ...]
+
+DEFAULT_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+)  # type: t.Tuple[float, ...]
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: t.Sequence[str], values: t.Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape_label_value(value)}"' for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """Base class of metrics rendered in Prometheus text format
+
+    Args:
+        name (str): metric name
+        help (str): description of metric
+        labelnames (Sequence[str], optional): names of labels
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: t.Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _get_label_values(self, labels: t.Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"Labels of {self.name} should be {self.labelnames}: {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _render_samples(self) -> t.List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            lines.extend(self._render_samples())
+        return "\n".join(lines) + "\n"
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: t.Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values = {}  # type: t.Dict[LabelValues, float]
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._get_label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels: str) -> float:
+        return self._values.get(self._get_label_values(labels), 0)
+
+    def _render_samples(self) -> t.List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class _HistogramValue:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(Metric):
+    """Histogram with cumulative buckets
+
+    Args:
+        name (str): metric name
+        help (str): description of metric
+        labelnames (Sequence[str], optional): names of labels
+        buckets (Sequence[float], optional): upper bounds of buckets
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: t.Sequence[str] = (),
+        buckets: t.Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values = {}  # type: t.Dict[LabelValues, _HistogramValue]
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._get_label_values(labels)
+        with self._lock:
+            histogram = self._values.get(key)
+            if histogram is None:
+                histogram = self._values[key] = _HistogramValue(len(self.buckets))
+            histogram.counts[bisect.bisect_left(self.buckets, value)] += 1
+            histogram.sum += value
+            histogram.count += 1
+
+    def get_count(self, **labels: str) -> int:
+        histogram = self._values.get(self._get_label_values(labels))
+        return histogram.count if histogram is not None else 0
+
+    def _render_samples(self) -> t.List[str]:
+        lines = []
+        label_names = self.labelnames + ("le",)
+        for key, histogram in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, histogram.counts):
+                cumulative += count
+                labels = _format_labels(label_names, key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(histogram.sum)}")
+            lines.append(f"{self.name}_count{labels} {histogram.count}")
+        return lines
+
+
+M = t.TypeVar("M", bound=Metric)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []  # type: t.List[Metric]
+
+    def register(self, metric: M) -> M:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Render every metric in Prometheus text exposition format
+
+        Returns:
+            str: metrics text
+        """
+        return "".join(metric.render() for metric in self._metrics)
+
+
+registry = Registry()
+
+stage_seconds = registry.register(
+    Histogram(
+        "majsoul_stage_seconds",
+        "Time spent in each stage of serving a log.",
+        labelnames=("stage",),
+    )
+)
+stage_errors = registry.register(
+    Counter(
+        "majsoul_stage_errors_total",
+        "Exceptions raised by each stage of serving a log.",
+        labelnames=("stage", "error"),
+    )
+)
+upstream_error_responses = registry.register(
+    Counter(
+        "majsoul_upstream_error_responses_total",
+        "Majsoul responses with an error code.",
+        labelnames=("code",),
+    )
+)
+maintenance_errors = registry.register(
+    Counter(
+        "majsoul_maintenance_errors_total",
+        "Requests failed because Majsoul is under maintenance.",
+    )
+)
+request_seconds = registry.register(
+    Histogram(
+        "majsoul_request_seconds",
+        "Time spent serving each endpoint.",
+        labelnames=("endpoint", "status"),
+    )
+)
+
+# stage timings of the request being served, None outside of requests
+request_timings = contextvars.ContextVar(
+    "request_timings", default=None
+)  # type: contextvars.ContextVar[t.Optional[t.List[t.Tuple[str, float]]]]
+
+
+@contextmanager
+def time_stage(stage: str) -> t.Iterator[None]:
+    """Measure a stage into histogram and Server-Timing of the current request
+
+    Exceptions raised by the stage are counted by type and re-raised.
+
+    Args:
+        stage (str): stage name
+    """
+    started_at = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        stage_errors.inc(stage=stage, error=type(e).__name__)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started_at
+        stage_seconds.observe(elapsed, stage=stage)
+        timings = request_timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+
+def format_server_timing(timings: t.Iterable[t.Tuple[str, float]]) -> str:
+    """Format stage timings as Server-Timing header value
+
+    Repeated stages are summed into one entry.
+
+    Args:
+        timings (Iterable[Tuple[str, float]]): stage name and seconds
+
+    Returns:
+        str: header value like ``fetch_game_record;dur=120.5, decode;dur=3.2``
+    """
+    durations = {}  # type: t.Dict[str, float]
+    for stage, elapsed in timings:
+        durations[stage] = durations.get(stage, 0.0) + elapsed
+    return ", ".join(
+        f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in durations.items()
+    )
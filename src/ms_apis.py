@@ -1,5 +1,5 @@
+import asyncio
 import os
-import json
 import hashlib
 import hmac
 import logging
@@ -11,52 +11,129 @@ import typing as t
 from ms.base import MSRPCChannel
 from ms.rpc import Lobby
 import ms.protocol_pb2 as pb
-from google.protobuf.json_format import MessageToJson
+
+from src.archives import GameArchive
+from src.caches import (
+    RefreshingValue,
+    create_record_cache,
+    is_cacheable_key,
+    make_cached_record,
+)
+from src.metrics import maintenance_errors, time_stage, upstream_error_responses
+from src.records import make_log, process_game_record
+from src.replays import FixtureStore, ReplayLobby, ReplaySession, ServerDocuments
+from src.sessions import (
+    CONNECTION_ERRORS,
+    BackgroundLoop,
+    LobbyPool,
+    LobbySession,
+    SingleFlight,
+)
+
+T = t.TypeVar("T")
 
 MS_HOST = os.environ["MAJSOUL_HOST"]
+POOL_SIZE = int(os.environ.get("MAJSOUL_POOL_SIZE", "1"))
+SESSION_MAX_IN_FLIGHT = int(os.environ.get("MAJSOUL_SESSION_MAX_IN_FLIGHT", "8"))
+SESSION_MAX_AGE = float(os.environ.get("MAJSOUL_SESSION_MAX_AGE", "3600"))
+SESSION_CHECK_INTERVAL = float(os.environ.get("MAJSOUL_SESSION_CHECK_INTERVAL", "30"))
+REQUEST_TIMEOUT = float(os.environ.get("MAJSOUL_REQUEST_TIMEOUT", "30"))
+CACHE_MEMORY_BYTES = int(os.environ.get("MAJSOUL_CACHE_MEMORY_BYTES", str(64 << 20)))
+CACHE_PATH = os.environ.get("MAJSOUL_CACHE_PATH", "")
+RESPONSE_CACHE_MEMORY_BYTES = int(
+    os.environ.get("MAJSOUL_RESPONSE_CACHE_MEMORY_BYTES", str(64 << 20))
+)
+RESPONSE_CACHE_PATH = os.environ.get("MAJSOUL_RESPONSE_CACHE_PATH", "")
+RESPONSE_CACHE_PATH_MAX_BYTES = int(
+    os.environ.get("MAJSOUL_RESPONSE_CACHE_PATH_MAX_BYTES", str(1 << 30))
+)
+SERVER_INFO_TTL = float(os.environ.get("MAJSOUL_SERVER_INFO_TTL", "600"))
+RECORD_PATH = os.environ.get("MAJSOUL_RECORD_PATH", "")
+REPLAY_PATH = os.environ.get("MAJSOUL_REPLAY_PATH", "")
+REPLAY_LATENCY = float(os.environ.get("MAJSOUL_REPLAY_LATENCY", "0"))
+ARCHIVE_PATH = os.environ.get("MAJSOUL_ARCHIVE_PATH", "")
+
 
 class MaintenanceError(Exception):
     pass
 
 
-async def connect() -> t.Tuple[Lobby, MSRPCChannel, str]:
+class LoginError(Exception):
+    pass
+
+
+class ServerInfo(t.NamedTuple):
+    client_version: str
+    servers: t.List[str]
+
+
+async def fetch_server_documents() -> ServerDocuments:
     async with aiohttp.ClientSession() as session:
         async with session.get("{}/1/version.json".format(MS_HOST)) as res:
             version = await res.json()
-            logging.info(f"Version: {version}")
-
-            version = version["version"]
-            client_version = "web-" + version.replace(".w", "")
 
-        async with session.get("{}/1/v{}/config.json".format(MS_HOST, version)) as res:
+        url = "{}/1/v{}/config.json".format(MS_HOST, version["version"])
+        async with session.get(url) as res:
             config = await res.json()
-            logging.info(f"Config: {config}")
-
-            url = config["ip"][0]["region_urls"][1]["url"]
 
+        url = config["ip"][0]["region_urls"][1]["url"]
         async with session.get(url + "?service=ws-gateway&protocol=ws&ssl=true") as res:
             servers = await res.json()
-            logging.info(f"Available servers: {servers}")
 
-            if "servers" not in servers:
-                logging.error("No servers available")
-                if "maintenance" in servers:
-                    raise MaintenanceError(servers["maintenance"].get("message", ""))
-                raise Exception("Unknown error")
+    return ServerDocuments(version=version, config=config, servers=servers)
+
+
+def parse_server_documents(documents: ServerDocuments) -> ServerInfo:
+    logging.info(f"Version: {documents.version}")
+    client_version = "web-" + documents.version["version"].replace(".w", "")
 
-            servers = servers["servers"]
-            server = random.choice(servers)
-            endpoint = "wss://{}/gateway".format(server)
+    logging.info(f"Config: {documents.config}")
+
+    servers = documents.servers
+    logging.info(f"Available servers: {servers}")
+    if "servers" not in servers:
+        logging.error("No servers available")
+        if "maintenance" in servers:
+            raise MaintenanceError(servers["maintenance"].get("message", ""))
+        raise Exception("Unknown error")
+
+    return ServerInfo(client_version=client_version, servers=servers["servers"])
+
+
+async def fetch_server_info() -> ServerInfo:
+    if replay_store is not None:
+        documents = replay_store.load_server_documents()
+    else:
+        with time_stage("server_info"):
+            documents = await fetch_server_documents()
+        if record_store is not None:
+            record_store.save_server_documents(documents)
+    return parse_server_documents(documents)
+
+
+# upstream responses are recorded to or replayed from fixture directories
+record_store = FixtureStore(RECORD_PATH) if RECORD_PATH else None
+replay_store = FixtureStore(REPLAY_PATH) if REPLAY_PATH else None
+
+# version, config and gateways only change on patch days
+server_info = RefreshingValue(fetch_server_info, ttl=SERVER_INFO_TTL)
+
+
+async def connect() -> t.Tuple[Lobby, MSRPCChannel, str]:
+    info = await server_info.get()
+    server = random.choice(info.servers)
+    endpoint = "wss://{}/gateway".format(server)
 
     logging.info(f"Chosen endpoint: {endpoint}")
     channel = MSRPCChannel(endpoint)
 
     lobby = Lobby(channel)
 
-    await channel.connect(MS_HOST)
+    with time_stage("connect"):
+        await channel.connect(MS_HOST)
     logging.info("Connection was established")
 
-    return lobby, channel, client_version
+    return lobby, channel, info.client_version
 
 
 async def login(
@@ -85,75 +162,253 @@ async def login(
     return True
 
 
-async def load_and_process_game_log(
+async def open_session() -> LobbySession:
+    username = os.environ["MAJSOUL_USERNAME"]
+    password = os.environ["MAJSOUL_PASSWORD"]
+
+    if not username or not password:
+        logging.error("Username or password cant be empty")
+
+    for _ in range(2):
+        try:
+            lobby, channel, client_version = await connect()
+        except CONNECTION_ERRORS:
+            # cached gateway may be gone
+            server_info.invalidate()
+            raise
+        session = LobbySession(lobby, channel, client_version)
+        try:
+            with time_stage("login"):
+                logged_in = await login(lobby, username, password, client_version)
+            if logged_in:
+                return session
+        except BaseException:
+            await session.close()
+            raise
+        await session.close()
+        # login is rejected when the cached client version is outdated
+        server_info.invalidate()
+    raise LoginError("Cannot login to Majsoul")
+
+
+async def open_replay_session() -> LobbySession:
+    assert replay_store is not None
+    info = await server_info.get()
+    lobby = ReplayLobby(replay_store, latency=REPLAY_LATENCY)
+    return ReplaySession(lobby, info.client_version)
+
+
+session_loop = BackgroundLoop()
+session_pool = LobbyPool(
+    open_replay_session if replay_store is not None else open_session,
+    size=POOL_SIZE,
+    max_in_flight=SESSION_MAX_IN_FLIGHT,
+    max_age=SESSION_MAX_AGE,
+    check_interval=SESSION_CHECK_INTERVAL,
+    timeout=REQUEST_TIMEOUT,
+)
+in_flight_fetches = SingleFlight()
+record_cache = create_record_cache(CACHE_MEMORY_BYTES, CACHE_PATH)
+# encoded bodies of responses of cached records, by ETag and content coding
+response_cache = create_record_cache(
+    RESPONSE_CACHE_MEMORY_BYTES, RESPONSE_CACHE_PATH, RESPONSE_CACHE_PATH_MAX_BYTES
+)
+game_archive = GameArchive(ARCHIVE_PATH) if ARCHIVE_PATH else None
+
+
+async def fetch_game_record(
     lobby: Lobby, uuid: str, client_version: str
-) -> t.Tuple[t.Any, t.List[t.Dict]]:
+) -> pb.ResGameRecord:
     logging.info("Loading game log")
     req = pb.ReqGameRecord()
     req.game_uuid = uuid
     req.client_version_string = client_version
-    res = await lobby.fetch_game_record(req)
-
-    record_wrapper = pb.Wrapper()
-    record_wrapper.ParseFromString(res.data)
+    with time_stage("fetch_game_record"):
+        res = await lobby.fetch_game_record(req)
+    if res.error.code:
+        upstream_error_responses.inc(code=str(res.error.code))
+    return res
 
-    game_details = pb.GameDetailRecords()
-    game_details.ParseFromString(record_wrapper.data)
 
-    records = []
+async def load_and_process_game_log(
+    lobby: Lobby,
+    uuid: str,
+    client_version: str,
+    record_names: t.Optional[t.Container[str]] = None,
+) -> t.Tuple[t.Any, t.List[t.Dict]]:
+    """Fetch game record and decode its records
+
+    Args:
+        lobby (Lobby): logged-in lobby
+        uuid (str): uuid of Majsoul log
+        client_version (str): client version string used to login
+        record_names (Container[str], optional): record names to decode, or
+            ExcludedNames of records to skip, None for all. Other records are
+            skipped before decoding.
+
+    Returns:
+        Tuple[Any, List[Dict]]: response of fetchGameRecord and decoded records
+    """
+    res = await fetch_game_record(lobby, uuid, client_version)
+    return res, process_game_record(res, record_names)
+
+
+async def fetch_and_store_game_record(uuid: str) -> pb.ResGameRecord:
+    async def fetch(session: LobbySession) -> pb.ResGameRecord:
+        return await fetch_game_record(session.lobby, uuid, session.client_version)
+
+    res = await session_pool.run(fetch)
+    # the record is served even if it cannot be kept
+    if record_store is not None and is_cacheable_key(uuid):
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                None, record_store.save_game_record, uuid, res.SerializeToString()
+            )
+        except Exception:
+            logging.warning(f"Failed to record game {uuid}", exc_info=True)
+    # finished games never change, but errors may be temporary
+    if record_cache is not None and is_cacheable_key(uuid):
+        if not res.error.code and res.data:
+            cached_record = make_cached_record(res.SerializeToString())
+            try:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, record_cache.set, uuid, cached_record
+                )
+            except Exception:
+                logging.warning(f"Failed to cache game {uuid}", exc_info=True)
+    return res
+
+
+async def fetch_game_record_pooled(uuid: str) -> pb.ResGameRecord:
+    """Fetch game record with a shared logged-in session of this worker
+
+    Concurrent calls for the same uuid share one upstream fetch, so callers
+    must treat the returned message as read-only.
+
+    Args:
+        uuid (str): uuid of Majsoul log
+
+    Returns:
+        ResGameRecord: raw response of fetchGameRecord
+    """
+    return await session_loop.run(
+        in_flight_fetches.run(uuid, lambda: fetch_and_store_game_record(uuid))
+    )
+
+
+async def fetch_game_record_cached(uuid: str) -> pb.ResGameRecord:
+    """Fetch game record from cache, or from Majsoul if it is not cached yet
+
+    Args:
+        uuid (str): uuid of Majsoul log
+
+    Returns:
+        ResGameRecord: raw response of fetchGameRecord
+    """
+    if record_cache is not None and is_cacheable_key(uuid):
+        with time_stage("cache"):
+            cached_record = await record_cache.get_async(uuid)
+            if cached_record is not None:
+                return pb.ResGameRecord.FromString(cached_record.data)
+
+    return await fetch_game_record_pooled(uuid)
+
+
+async def fetch_serialized_game_record_cached(uuid: str) -> bytes:
+    """Fetch serialized game record, sending cached bytes as they are
+
+    Args:
+        uuid (str): uuid of Majsoul log
+
+    Returns:
+        bytes: serialized response of fetchGameRecord
+    """
+    if record_cache is not None and is_cacheable_key(uuid):
+        with time_stage("cache"):
+            cached_record = await record_cache.get_async(uuid)
+            if cached_record is not None:
+                return cached_record.data
+
+    res = await fetch_game_record_pooled(uuid)
+    return res.SerializeToString()
+
+
+async def get_record_digest(uuid: str) -> t.Optional[str]:
+    """Get content digest of game record if it is in record cache
+
+    Only finished games are cached, so the digest never changes for a uuid.
+
+    Args:
+        uuid (str): uuid of Majsoul log
+
+    Returns:
+        Optional[str]: sha256 digest of game record, None if not cached
+    """
+    if record_cache is None or not is_cacheable_key(uuid):
+        return None
+    cached_record = await record_cache.get_async(uuid)
+    return cached_record.digest if cached_record is not None else None
 
-    if len(game_details.records) > 0:
-        # old format
-        record_items = game_details.records
-    else:
-        # new format
-        record_items = (
-            action.result
-            for action in game_details.actions
-            if hasattr(action, "result") and len(action.result) > 0
-        )
-
-    for item in record_items:
-        round_record_wrapper = pb.Wrapper()
-        round_record_wrapper.ParseFromString(item)
-        round_record_classname = round_record_wrapper.name[4:]
-        round_record_class = getattr(pb, round_record_classname)
-        round_record = round_record_class()
-        round_record.ParseFromString(round_record_wrapper.data)
-        records.append(
-            {
-                "name": round_record_classname,
-                "data": json.loads(MessageToJson(round_record)),
-            }
-        )
-
-    return res, records
-
-
-async def get_log(uuid: str) -> t.Dict:
-    username = os.environ["MAJSOUL_USERNAME"]
-    password = os.environ["MAJSOUL_PASSWORD"]
 
-    if not username or not password:
-        logging.error("Username or password cant be empty")
+async def catch_upstream_errors(fetch: t.Awaitable[T]) -> t.Union[T, t.Dict]:
+    """Await fetch, turning maintenance and login errors into dict with error
 
+    Args:
+        fetch (Awaitable[T]): fetch from Majsoul
+
+    Returns:
+        Union[T, Dict]: result of fetch, or json-style dict with error
+    """
     try:
-        lobby, channel, client_version = await connect()
+        return await fetch
     except MaintenanceError as e:
+        maintenance_errors.inc()
         return {"error": f"Server is under maintenance: {str(e)}"}
+    except LoginError as e:
+        return {"error": str(e)}
+
+
+async def get_game_record(uuid: str) -> t.Union[pb.ResGameRecord, t.Dict]:
+    """Get game record of Majsoul log
+
+    Args:
+        uuid (str): uuid of Majsoul log
+
+    Returns:
+        Union[ResGameRecord, Dict]: response of fetchGameRecord, or json-style
+            dict with error if it cannot be fetched
+    """
+    return await catch_upstream_errors(fetch_game_record_cached(uuid))
+
+
+async def get_serialized_game_record(uuid: str) -> t.Union[bytes, t.Dict]:
+    """Get serialized game record of Majsoul log without parsing cached bytes
 
+    Args:
+        uuid (str): uuid of Majsoul log
 
-    await login(lobby, username, password, client_version)
+    Returns:
+        Union[bytes, Dict]: serialized response of fetchGameRecord, or
+            json-style dict with error if it cannot be fetched
+    """
+    return await catch_upstream_errors(fetch_serialized_game_record_cached(uuid))
 
-    game_log, records = await load_and_process_game_log(lobby, uuid, client_version)
 
-    await channel.close()
+async def get_log(
+    uuid: str, record_names: t.Optional[t.Container[str]] = None
+) -> t.Dict:
+    """Get Majsoul log as json-style dict
 
-    data = json.loads(MessageToJson(game_log))  # type: t.Dict[str, t.Any]
-    if "data" in data:
-        del data["data"]
+    Args:
+        uuid (str): uuid of Majsoul log
+        record_names (Container[str], optional): record names to decode, None for all
 
-    if "error" not in data:
-        data["records"] = records
+    Returns:
+        Dict: game head with records, or dict with error
+    """
+    game_log = await get_game_record(uuid)
+    if isinstance(game_log, dict):
+        return game_log
 
-    return data
+    with time_stage("decode"):
+        return make_log(game_log, record_names)
@@ -0,0 +1,311 @@
+import base64
+import functools
+import logging
+import typing as t
+
+from google.protobuf.message import Message
+import ms.protocol_pb2 as pb
+
+from src.converters import message_to_dict
+
+WRAPPER_NAME_PREFIX = ".lq."
+
+# field tags of Wrapper.name and Wrapper.data
+_WRAPPER_NAME_TAG = 0x0A
+_WRAPPER_DATA_TAG = 0x12
+
+
+class RecordType:
+    """Protobuf class of a record
+
+    Args:
+        name (str): record name without package prefix (e.g. RecordHule)
+        message_class (Type[Message]): protobuf class of the record
+    """
+
+    __slots__ = ("name", "message_class")
+
+    def __init__(self, name: str, message_class: t.Type[Message]):
+        self.name = name
+        self.message_class = message_class
+
+    def decode(self, body: bytes) -> Message:
+        return self.message_class.FromString(body)
+
+    def decode_to_dict(self, body: bytes) -> t.Dict[str, t.Any]:
+        """Decode record body into dict
+
+        Args:
+            body (bytes): serialized record
+
+        Returns:
+            Dict[str, Any]: record as dict with camelCase keys
+        """
+        return message_to_dict(self.message_class.FromString(body))
+
+
+# wrapper name (e.g. .lq.RecordHule) to record type, built once at import
+RECORD_TYPES = {
+    WRAPPER_NAME_PREFIX + name: RecordType(name, getattr(pb, name))
+    for name in pb.DESCRIPTOR.message_types_by_name
+}  # type: t.Dict[str, RecordType]
+RECORD_NAMES = frozenset(record_type.name for record_type in RECORD_TYPES.values())
+
+# top-level fields of log made by make_log
+LOG_FIELDS = frozenset(
+    [
+        field.json_name
+        for field in pb.ResGameRecord.DESCRIPTOR.fields
+        if field.name not in ("data", "error")
+    ]
+    + ["records"]
+)
+
+
+def _read_varint(item: bytes, pos: int) -> t.Tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = item[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+@functools.lru_cache(maxsize=16)
+def _wrapper_prefixes(names: t.FrozenSet[str]) -> t.Optional[t.Tuple[bytes, ...]]:
+    prefixes = []
+    for name in names:
+        wrapper_name = (WRAPPER_NAME_PREFIX + name).encode()
+        if len(wrapper_name) >= 0x80:
+            return None
+        prefixes.append(bytes([_WRAPPER_NAME_TAG, len(wrapper_name)]) + wrapper_name)
+    return tuple(prefixes)
+
+
+def split_wrapper(item: bytes) -> t.Tuple[str, bytes]:
+    """Split serialized Wrapper into its name and body
+
+    Args:
+        item (bytes): serialized Wrapper
+
+    Returns:
+        Tuple[str, bytes]: wrapper name and serialized body
+    """
+    try:
+        # record names are shorter than 128 bytes, so their length is one byte
+        if item[0] == _WRAPPER_NAME_TAG and item[1] < 0x80:
+            pos = 2 + item[1]
+            name = item[2:pos].decode()
+            if pos == len(item):
+                return name, b""
+            if item[pos] == _WRAPPER_DATA_TAG:
+                length = item[pos + 1]
+                pos += 2
+                if length >= 0x80:
+                    length, pos = _read_varint(item, pos - 1)
+                if pos + length == len(item):
+                    return name, item[pos:]
+    except (IndexError, UnicodeDecodeError):
+        pass
+    # unusual field layout, let protobuf parse it
+    wrapper = pb.Wrapper.FromString(item)
+    return wrapper.name, wrapper.data
+
+
+def peek_record_name(item: bytes) -> str:
+    """Read record name of serialized Wrapper
+
+    Args:
+        item (bytes): serialized Wrapper of a round record
+
+    Returns:
+        str: record name without package prefix (e.g. RecordHule)
+    """
+    return split_wrapper(item)[0][len(WRAPPER_NAME_PREFIX) :]
+
+
+class LazyRecord:
+    """Round record which decodes its body on first access
+
+    Records of a type missing from the protocol keep their body undecoded:
+    ``message`` is None and ``to_dict`` exposes the body as base64.
+
+    Args:
+        name (str): record name (e.g. RecordHule)
+        body (bytes): serialized record
+        record_type (RecordType, optional): type of record, None if unknown
+    """
+
+    __slots__ = ("name", "record_type", "_body", "_message")
+
+    def __init__(self, name: str, body: bytes, record_type: t.Optional[RecordType]):
+        self.name = name
+        self.record_type = record_type
+        self._body = body
+        self._message = None  # type: t.Optional[Message]
+
+    @property
+    def message(self) -> t.Optional[Message]:
+        if self._message is None and self.record_type is not None:
+            self._message = self.record_type.decode(self._body)
+        return self._message
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        if self.record_type is None:
+            return {
+                "name": self.name,
+                "data": {},
+                "raw": base64.b64encode(self._body).decode("utf-8"),
+            }
+        if self._message is not None:
+            data = message_to_dict(self._message)
+        else:
+            data = self.record_type.decode_to_dict(self._body)
+        return {"name": self.name, "data": data}
+
+
+class ExcludedNames:
+    """Record names other than excluded names
+
+    Given as record names, it keeps every record but the excluded ones.
+
+    Args:
+        names (Iterable[str]): record names to exclude
+    """
+
+    __slots__ = ("names",)
+
+    def __init__(self, names: t.Iterable[str]):
+        self.names = frozenset(names)
+
+    def __contains__(self, name: object) -> bool:
+        return name not in self.names
+
+
+class GameRecordView:
+    """Lazy view of round records in a game record
+
+    Only the container is parsed up front. Record names are read on
+    iteration and record bodies are decoded when accessed.
+
+    Args:
+        res (ResGameRecord): response of fetchGameRecord
+    """
+
+    def __init__(self, res: pb.ResGameRecord):
+        record_wrapper = pb.Wrapper.FromString(res.data)
+        game_details = pb.GameDetailRecords.FromString(record_wrapper.data)
+
+        if len(game_details.records) > 0:
+            # old format
+            self._items = game_details.records  # type: t.Iterable[bytes]
+        else:
+            # new format
+            self._items = [
+                action.result
+                for action in game_details.actions
+                if len(action.result) > 0
+            ]
+
+    def __iter__(self) -> t.Iterator[LazyRecord]:
+        return self.filter()
+
+    def filter(
+        self, names: t.Optional[t.Container[str]] = None
+    ) -> t.Iterator[LazyRecord]:
+        """Iterate records, skipping records not in names without decoding them
+
+        Args:
+            names (Container[str], optional): record names to keep, None to keep all
+
+        Yields:
+            LazyRecord: matched record
+        """
+        # Wrapper is serialized with its name first, so records of other names
+        # are skipped by comparing bytes before splitting them
+        prefixes = None
+        excluded_prefixes = None
+        if isinstance(names, (set, frozenset)):
+            prefixes = _wrapper_prefixes(frozenset(names))
+        elif isinstance(names, ExcludedNames):
+            excluded_prefixes = _wrapper_prefixes(names.names)
+
+        unknown_names = set()  # type: t.Set[str]
+        for item in self._items:
+            if prefixes is not None and not item.startswith(prefixes):
+                continue
+            if excluded_prefixes and item.startswith(excluded_prefixes):
+                continue
+            wrapper_name, body = split_wrapper(item)
+            record_type = RECORD_TYPES.get(wrapper_name)
+            if record_type is not None:
+                name = record_type.name
+            else:
+                name = wrapper_name[len(WRAPPER_NAME_PREFIX) :]
+                if name not in unknown_names:
+                    unknown_names.add(name)
+                    logging.warning(f"Unknown record type: {wrapper_name}")
+            if names is None or name in names:
+                yield LazyRecord(name, body, record_type)
+
+    def messages(
+        self, names: t.Optional[t.Container[str]] = None
+    ) -> t.Iterator[t.Tuple[str, Message]]:
+        """Iterate decoded records, skipping records of unknown type
+
+        Args:
+            names (Container[str], optional): record names to keep, None to keep all
+
+        Yields:
+            Tuple[str, Message]: record name and decoded record
+        """
+        for record in self.filter(names):
+            message = record.message
+            if message is not None:
+                yield record.name, message
+
+
+def process_game_record(
+    res: pb.ResGameRecord, record_names: t.Optional[t.Container[str]] = None
+) -> t.List[t.Dict]:
+    """Decode round records of game record into json-style dicts
+
+    Args:
+        res (ResGameRecord): response of fetchGameRecord
+        record_names (Container[str], optional): record names to decode, None for all
+
+    Returns:
+        List[Dict]: decoded records in order
+    """
+    return [record.to_dict() for record in GameRecordView(res).filter(record_names)]
+
+
+def make_log(
+    res: pb.ResGameRecord,
+    record_names: t.Optional[t.Container[str]] = None,
+    fields: t.Optional[t.Container[str]] = None,
+) -> t.Dict:
+    """Convert game record into json-style dict
+
+    Args:
+        res (ResGameRecord): response of fetchGameRecord
+        record_names (Container[str], optional): record names to decode, None for all
+        fields (Container[str], optional): top-level fields to keep, None for all
+
+    Returns:
+        Dict: game head with records, or dict with error
+    """
+    # records are decoded from data below, so it is never base64-encoded
+    data = message_to_dict(res, exclude_fields=("data",))
+    if "error" in data:
+        return data
+
+    if fields is not None:
+        data = {name: value for name, value in data.items() if name in fields}
+    if fields is None or "records" in fields:
+        data["records"] = process_game_record(res, record_names)
+
+    return data
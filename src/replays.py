@@ -0,0 +1,150 @@
+import asyncio
+import json
+import os
+import threading
+import typing as t
+
+import ms.protocol_pb2 as pb
+
+from src.caches import is_cacheable_key
+from src.sessions import LobbySession
+
+# error code replayed for uuids without a recorded game record
+MISSING_RECORD_ERROR_CODE = 1203
+
+
+class ServerDocuments(t.NamedTuple):
+    """JSON documents describing the Majsoul servers
+
+    Attributes:
+        version (Dict): version.json of the web client
+        config (Dict): config.json of the client version
+        servers (Dict): response of the ws-gateway service
+    """
+
+    version: t.Dict[str, t.Any]
+    config: t.Dict[str, t.Any]
+    servers: t.Dict[str, t.Any]
+
+
+class FixtureStore:
+    """Directory of recorded upstream responses
+
+    Layout::
+
+        server.json          version, config and gateway documents
+        records/<uuid>.pb    serialized ResGameRecord of each uuid
+
+    Args:
+        path (str): fixture directory
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _get_server_path(self) -> str:
+        return os.path.join(self.path, "server.json")
+
+    def _get_record_path(self, uuid: str) -> str:
+        if not is_cacheable_key(uuid):
+            raise ValueError(f"Invalid fixture key: {uuid}")
+        return os.path.join(self.path, "records", uuid + ".pb")
+
+    def _write(self, path: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = "{}.{}.tmp".format(path, threading.get_ident())
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def load_server_documents(self) -> ServerDocuments:
+        with open(self._get_server_path(), encoding="utf-8") as f:
+            return ServerDocuments(**json.load(f))
+
+    def save_server_documents(self, documents: ServerDocuments) -> None:
+        data = json.dumps(documents._asdict(), ensure_ascii=False, indent=2)
+        with self._lock:
+            self._write(self._get_server_path(), data.encode("utf-8"))
+
+    def load_game_record(self, uuid: str) -> t.Optional[bytes]:
+        """Load recorded game record
+
+        Args:
+            uuid (str): uuid of Majsoul log
+
+        Returns:
+            Optional[bytes]: serialized ResGameRecord or None if not recorded
+        """
+        try:
+            with open(self._get_record_path(uuid), "rb") as f:
+                return f.read()
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save_game_record(self, uuid: str, data: bytes) -> None:
+        """Record game record
+
+        Args:
+            uuid (str): uuid of Majsoul log
+            data (bytes): serialized ResGameRecord
+        """
+        with self._lock:
+            self._write(self._get_record_path(uuid), data)
+
+    def uuids(self) -> t.List[str]:
+        try:
+            names = os.listdir(os.path.join(self.path, "records"))
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-3] for name in names if name.endswith(".pb"))
+
+
+class ReplayLobby:
+    """Stand-in for Lobby answering from a fixture store
+
+    Args:
+        store (FixtureStore): recorded responses
+        latency (float, optional): seconds to wait before each response
+    """
+
+    def __init__(self, store: FixtureStore, latency: float = 0):
+        self.store = store
+        self.latency = latency
+
+    async def _wait(self) -> None:
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+
+    async def fetch_game_record(self, req: pb.ReqGameRecord) -> pb.ResGameRecord:
+        await self._wait()
+        data = self.store.load_game_record(req.game_uuid)
+        if data is None:
+            res = pb.ResGameRecord()
+            res.error.code = MISSING_RECORD_ERROR_CODE
+            return res
+        return pb.ResGameRecord.FromString(data)
+
+    async def heatbeat(self, req: pb.ReqHeatBeat) -> pb.ResCommon:
+        await self._wait()
+        return pb.ResCommon()
+
+
+class ReplaySession(LobbySession):
+    """Lobby session replaying recorded responses without a connection
+
+    Args:
+        lobby (ReplayLobby): lobby answering from fixtures
+        client_version (str): client version of recorded server documents
+    """
+
+    def __init__(self, lobby: ReplayLobby, client_version: str):
+        super().__init__(
+            lobby=lobby, channel=None, client_version=client_version  # type: ignore
+        )
+
+    def is_connected(self) -> bool:
+        return not self.broken
+
+    async def close(self) -> None:
+        self.broken = True
@@ -0,0 +1,407 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import logging
+import os
+import threading
+import time
+import typing as t
+from contextlib import asynccontextmanager
+
+from ms.base import MSRPCChannel
+from ms.rpc import Lobby
+import ms.protocol_pb2 as pb
+
+T = t.TypeVar("T")
+
+# errors which mean the websocket is gone and the session must be replaced
+CONNECTION_ERRORS = (
+    ConnectionError,
+    OSError,
+    EOFError,
+    asyncio.TimeoutError,
+    asyncio.IncompleteReadError,
+)  # type: t.Tuple[t.Type[BaseException], ...]
+
+try:
+    from websockets.exceptions import ConnectionClosed
+
+    CONNECTION_ERRORS += (ConnectionClosed,)
+except ImportError:  # pragma: no cover
+    pass
+
+
+class LobbySession:
+    """Authenticated Majsoul lobby connection
+
+    Args:
+        lobby (Lobby): lobby service bound to channel
+        channel (MSRPCChannel): connected websocket channel
+        client_version (str): client version string used to login
+    """
+
+    def __init__(self, lobby: Lobby, channel: MSRPCChannel, client_version: str):
+        self.lobby = lobby
+        self.channel = channel
+        self.client_version = client_version
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+        self.broken = False
+        # upstream calls currently carried by the session
+        self.in_flight = 0
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.created_at
+
+    @property
+    def idle_time(self) -> float:
+        return time.monotonic() - self.last_used_at
+
+    def is_connected(self) -> bool:
+        """Check whether the websocket and its dispatcher task are still running
+
+        Returns:
+            bool: True if the channel can still carry requests
+        """
+        if self.broken:
+            return False
+        ws = getattr(self.channel, "_ws", None)
+        dispatcher = getattr(self.channel, "_msg_dispatcher", None)
+        if ws is None or dispatcher is None or dispatcher.done():
+            return False
+        return not getattr(ws, "closed", False)
+
+    async def ping(self, timeout: float) -> bool:
+        """Send heartbeat to check the session is still logged in
+
+        Args:
+            timeout (float): seconds to wait for the response
+
+        Returns:
+            bool: True if the server answered without error
+        """
+        try:
+            res = await asyncio.wait_for(
+                self.lobby.heatbeat(pb.ReqHeatBeat()), timeout=timeout
+            )
+        except CONNECTION_ERRORS:
+            return False
+        return not res.error.code
+
+    async def close(self) -> None:
+        self.broken = True
+        try:
+            await self.channel.close()
+        except Exception:
+            logging.warning("Failed to close lobby channel", exc_info=True)
+
+
+class LobbyPool:
+    """Pool of long-lived authenticated lobby sessions
+
+    Sessions are opened lazily by ``factory`` and replaced when they drop, get
+    too old or fail the heartbeat check. The channel matches responses to
+    requests by index, so each session carries up to ``max_in_flight`` calls
+    at once, and a new one is opened only when all of them are busy. The pool
+    must only be used from a single event loop.
+
+    Args:
+        factory (Callable[[], Awaitable[LobbySession]]): opens and logs in a new session
+        size (int): max number of sessions
+        max_in_flight (int): max concurrent calls per session
+        max_age (float): seconds before a session is re-logged in
+        check_interval (float): idle seconds before a session is pinged on checkout
+        timeout (float): seconds to wait for a single upstream call
+    """
+
+    def __init__(
+        self,
+        factory: t.Callable[[], t.Awaitable[LobbySession]],
+        size: int = 1,
+        max_in_flight: int = 1,
+        max_age: float = 3600,
+        check_interval: float = 30,
+        timeout: float = 30,
+    ):
+        self._factory = factory
+        self.size = max(1, size)
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_age = max_age
+        self.check_interval = check_interval
+        self.timeout = timeout
+
+        # sessions new calls may use, retired ones are closed by their last call
+        self._sessions = []  # type: t.List[LobbySession]
+        self._in_use = 0
+        self._semaphore = None  # type: t.Optional[asyncio.Semaphore]
+        self._lock = None  # type: t.Optional[asyncio.Lock]
+
+        self.opened = 0
+        self.discarded = 0
+        self.failures = 0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # created lazily so it binds to the loop that actually uses the pool
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.size * self.max_in_flight)
+        return self._semaphore
+
+    def _get_lock(self) -> asyncio.Lock:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def _is_usable(self, session: LobbySession) -> bool:
+        if not session.is_connected() or session.age >= self.max_age:
+            return False
+        # busy sessions just answered, idle ones may have been logged out
+        if not session.in_flight and session.idle_time >= self.check_interval:
+            return await session.ping(self.timeout)
+        return True
+
+    async def _discard(self, session: LobbySession) -> None:
+        self.discarded += 1
+        await session.close()
+
+    async def _take(self) -> LobbySession:
+        async with self._get_lock():
+            session = None  # type: t.Optional[LobbySession]
+            # least busy sessions first, so calls spread over open sessions
+            for candidate in sorted(self._sessions, key=lambda s: s.in_flight):
+                if candidate.in_flight >= self.max_in_flight:
+                    break
+                if await self._is_usable(candidate):
+                    session = candidate
+                    break
+                self._sessions.remove(candidate)
+                if not candidate.in_flight:
+                    await self._discard(candidate)
+            if session is None:
+                # semaphore leaves room for one more session when all are busy
+                session = await asyncio.wait_for(self._factory(), timeout=self.timeout)
+                self.opened += 1
+                self._sessions.append(session)
+            session.in_flight += 1
+            return session
+
+    async def acquire(self) -> LobbySession:
+        """Take a healthy session from the pool, opening a new one if needed
+
+        Returns:
+            LobbySession: session carrying the caller's call, possibly along
+                with calls of others
+        """
+        semaphore = self._get_semaphore()
+        await semaphore.acquire()
+        try:
+            session = await self._take()
+        except BaseException:
+            semaphore.release()
+            raise
+        self._in_use += 1
+        return session
+
+    async def release(self, session: LobbySession, broken: bool = False) -> None:
+        """Return session to the pool
+
+        Args:
+            session (LobbySession): session taken by acquire
+            broken (bool, optional): drop the session instead of reusing it
+        """
+        self._in_use -= 1
+        session.in_flight -= 1
+        try:
+            if broken or session.broken or not session.is_connected():
+                # other calls on the session fail on their own
+                if session in self._sessions:
+                    self._sessions.remove(session)
+            else:
+                session.last_used_at = time.monotonic()
+            if not session.in_flight and session not in self._sessions:
+                await self._discard(session)
+        finally:
+            self._get_semaphore().release()
+
+    @asynccontextmanager
+    async def session(self) -> t.AsyncIterator[LobbySession]:
+        session = await self.acquire()
+        broken = False
+        try:
+            yield session
+        except CONNECTION_ERRORS:
+            broken = True
+            raise
+        finally:
+            await self.release(session, broken=broken)
+
+    async def run(
+        self, func: t.Callable[[LobbySession], t.Awaitable[T]], retries: int = 1
+    ) -> T:
+        """Call func with a pooled session, retrying on a fresh one if the connection drops
+
+        Args:
+            func (Callable[[LobbySession], Awaitable[T]]): upstream call
+            retries (int, optional): number of retries on connection errors
+
+        Returns:
+            T: result of func
+        """
+        attempt = 0
+        while True:
+            try:
+                async with self.session() as session:
+                    return await asyncio.wait_for(func(session), timeout=self.timeout)
+            except CONNECTION_ERRORS:
+                self.failures += 1
+                if attempt >= retries:
+                    raise
+                attempt += 1
+                logging.warning("Lobby session dropped, retrying", exc_info=True)
+
+    async def close(self) -> None:
+        sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            await session.close()
+
+    def stats(self) -> t.Dict[str, t.Any]:
+        return {
+            "size": self.size,
+            "max_in_flight": self.max_in_flight,
+            "sessions": len(self._sessions),
+            "idle": sum(1 for session in self._sessions if not session.in_flight),
+            "in_use": self._in_use,
+            "opened": self.opened,
+            "discarded": self.discarded,
+            "failures": self.failures,
+        }
+
+
+class SingleFlight:
+    """Deduplicate concurrent calls sharing the same key
+
+    While a call for a key is in flight, later callers with the same key wait
+    for its result instead of starting their own. Must only be used from a
+    single event loop.
+    """
+
+    def __init__(self):
+        self._calls = {}  # type: t.Dict[str, asyncio.Future]
+        self.calls = 0
+        self.shared = 0
+
+    def _finish(self, key: str, future: asyncio.Future) -> None:
+        self._calls.pop(key, None)
+        # mark exception as retrieved even if every waiter was cancelled
+        if not future.cancelled():
+            future.exception()
+
+    async def run(self, key: str, func: t.Callable[[], t.Awaitable[T]]) -> T:
+        """Call func, or join the call already in flight for key
+
+        Args:
+            key (str): key identifying the call
+            func (Callable[[], Awaitable[T]]): call to make if none is in flight
+
+        Returns:
+            T: result of the shared call
+        """
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func())
+            self._calls[key] = future
+            future.add_done_callback(lambda f: self._finish(key, f))
+            self.calls += 1
+        else:
+            self.shared += 1
+        # a cancelled waiter must not cancel the call for the others
+        return await asyncio.shield(future)
+
+    def stats(self) -> t.Dict[str, t.Any]:
+        return {
+            "in_flight": len(self._calls),
+            "calls": self.calls,
+            "shared": self.shared,
+        }
+
+
+async def _run_in_context(
+    context: contextvars.Context, coro: t.Coroutine[t.Any, t.Any, T]
+) -> T:
+    for var, value in context.items():
+        var.set(value)
+    return await coro
+
+
+class BackgroundLoop:
+    """Long-lived event loop of a worker, running in a daemon thread
+
+    Flask runs every async view in its own short-lived event loop, so
+    websockets opened in one request cannot be used by the next. Running all
+    upstream traffic on one long-lived loop per process lets the sessions be
+    shared by every request of the worker. Under an ASGI server the loop of
+    the server is attached instead of starting a thread.
+
+    Coroutines run with a copy of the context variables of the submitting
+    thread, like tasks created on the caller's own loop would.
+    """
+
+    def __init__(self, name: str = "majsoul-loop"):
+        self._name = name
+        self._lock = threading.Lock()
+        self._loop = None  # type: t.Optional[asyncio.AbstractEventLoop]
+        self._pid = None  # type: t.Optional[int]
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            # threads do not survive fork, so each worker process starts its own
+            if self._loop is None or self._pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(
+                    target=loop.run_forever, name=self._name, daemon=True
+                )
+                thread.start()
+                self._loop = loop
+                self._pid = os.getpid()
+            return self._loop
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Use an already running loop, such as the one of an ASGI server
+
+        Args:
+            loop (AbstractEventLoop): loop running in this process
+        """
+        with self._lock:
+            if self._loop is not loop:
+                self._loop = loop
+                self._pid = os.getpid()
+
+    def detach(self) -> None:
+        with self._lock:
+            self._loop = None
+            self._pid = None
+
+    def submit(
+        self, coro: t.Coroutine[t.Any, t.Any, T]
+    ) -> "concurrent.futures.Future[T]":
+        return asyncio.run_coroutine_threadsafe(
+            _run_in_context(contextvars.copy_context(), coro), self.get_loop()
+        )
+
+    async def run(self, coro: t.Coroutine[t.Any, t.Any, T]) -> T:
+        """Await coro on the background loop from any other event loop
+
+        Args:
+            coro (Coroutine[Any, Any, T]): coroutine to run
+
+        Returns:
+            T: result of coro
+        """
+        loop = self.get_loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            return await coro
+        return await asyncio.wrap_future(self.submit(coro))
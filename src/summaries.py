@@ -0,0 +1,359 @@
+from datetime import datetime, timedelta, timezone
+import traceback
+import typing as t
+
+import ms.protocol_pb2 as pb
+
+from src.consts import YAKU_MAP, IMPORTANT_YAKU_IDS
+from src.converters import message_to_dict
+from src.records import GameRecordView, make_log
+from src.validations import ValidationError, Validator, validate_log
+
+# records read by summaries, others are never decoded
+SUMMARY_RECORD_NAMES = frozenset(["RecordHule"])
+
+
+def make_exception_summary(data: t.Any = None) -> "SummaryError":
+    """Make error summary for the exception being handled
+
+    Args:
+        data (Any, optional): log data which caused the exception
+
+    Returns:
+        SummaryError: error summary
+    """
+    return SummaryError(
+        message=traceback.format_exc(),
+        errors=[
+            ValidationError(
+                {"code": "unexpected-exception", "message": "Unexpected exception."}
+            )
+        ],
+        data=data,
+    )
+
+
+class PlayerRank(t.NamedTuple):
+    id: int
+    seat: int
+    nickname: str
+    final_point: int
+    rank: int
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        return {
+            "id": self.id,
+            "seat": self.seat,
+            "nickname": self.nickname,
+            "finalPoint": self.final_point,
+            "rank": self.rank,
+        }
+
+
+class NotedYaku(t.NamedTuple):
+    yaku: str
+    player: PlayerRank
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        return {"yaku": self.yaku, "player": self.player.to_dict()}
+
+
+class GameSummary(t.NamedTuple):
+    uuid: str
+    room_id: int
+    start_time: int
+    end_time: int
+    ranks: t.List[PlayerRank]
+    noted_yakus: t.List[NotedYaku]
+
+    @property
+    def status_code(self) -> int:
+        return 200
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        return {
+            "result": "OK",
+            "uuid": self.uuid,
+            "roomId": self.room_id,
+            "startTime": self.start_time,
+            "endTime": self.end_time,
+            "ranks": [rank.to_dict() for rank in self.ranks],
+            "noted_yakus": [noted_yaku.to_dict() for noted_yaku in self.noted_yakus],
+        }
+
+
+class SummaryError(t.NamedTuple):
+    message: str
+    errors: t.List[ValidationError]
+    data: t.Any = None
+
+    @property
+    def status_code(self) -> int:
+        return 500
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        return {
+            "result": "ERROR",
+            "message": self.message,
+            "errors": self.errors,
+            "data": self.data,
+        }
+
+
+Summary = t.Union[GameSummary, SummaryError]
+
+
+class Account(t.NamedTuple):
+    id: int
+    seat: int
+    nickname: str
+
+
+class PlayerResult(t.NamedTuple):
+    seat: int
+    final_point: int
+
+
+class Hule(t.NamedTuple):
+    seat: int
+    fan_ids: t.List[int]
+    # han of the win, 13 or more is a counted yakuman
+    fan_count: int
+
+
+def build_summary(
+    uuid: str,
+    room_id: int,
+    start_time: int,
+    end_time: int,
+    accounts: t.Iterable[Account],
+    results: t.Iterable[PlayerResult],
+    hules: t.Iterable[Hule],
+) -> GameSummary:
+    """Rank players by final points and collect noted yakus
+
+    Args:
+        uuid (str): uuid of Majsoul log
+        room_id (int): friendly match room id
+        start_time (int): game start unix time
+        end_time (int): game end unix time
+        accounts (Iterable[Account]): players of game
+        results (Iterable[PlayerResult]): final points of each seat
+        hules (Iterable[Hule]): wins of game in order
+
+    Returns:
+        GameSummary: summary of game
+    """
+    accounts_by_seat = {}  # type: t.Dict[int, Account]
+    for account in accounts:
+        accounts_by_seat.setdefault(account.seat, account)
+
+    # parse for players
+    players = []
+    for result in results:
+        seat_account = accounts_by_seat.get(result.seat)
+        if seat_account is not None:
+            players.append((seat_account, result.final_point))
+
+    # set rank by final points
+    players.sort(key=lambda player: player[1], reverse=True)
+    player_ranks = [
+        PlayerRank(
+            id=account.id,
+            seat=account.seat,
+            nickname=account.nickname,
+            final_point=final_point,
+            rank=i + 1,
+        )
+        for i, (account, final_point) in enumerate(players)
+    ]
+    ranks_by_seat = {}  # type: t.Dict[int, PlayerRank]
+    for player in player_ranks:
+        ranks_by_seat.setdefault(player.seat, player)
+
+    # parse for noted_yakus
+    noted_yakus = []
+    for hule in hules:
+        winner = ranks_by_seat.get(hule.seat)
+        if winner is None:
+            continue
+        # check important yaku
+        important_fan_ids = [
+            fan_id for fan_id in hule.fan_ids if fan_id in IMPORTANT_YAKU_IDS
+        ]
+        for fan_id in important_fan_ids:
+            noted_yakus.append(NotedYaku(yaku=YAKU_MAP[fan_id], player=winner))
+        # check counted yakuman
+        if not important_fan_ids and hule.fan_count >= 13:
+            noted_yakus.append(NotedYaku(yaku="헤아림역만", player=winner))
+
+    return GameSummary(
+        uuid=uuid,
+        room_id=room_id,
+        start_time=start_time,
+        end_time=end_time,
+        ranks=player_ranks,
+        noted_yakus=noted_yakus,
+    )
+
+
+def summarize_log(data: t.Dict, validate: Validator = validate_log) -> Summary:
+    """Summarize Majsoul log into ranks and noted yakus
+
+    Args:
+        data (Dict): Majsoul log from get_log
+        validate (Validator, optional): validator of ruleset the game should
+            follow, default ruleset if omitted
+
+    Returns:
+        Summary: summary of game, or error if log is invalid
+    """
+    try:
+        is_valid, errors = validate(data)
+        if not is_valid:
+            return SummaryError(message="Invalid game log.", errors=errors, data=data)
+
+        head = data["head"]
+
+        # fields with default values are omitted from log, so seat 0 has no seat
+        return build_summary(
+            uuid=head["uuid"],
+            room_id=head["config"]["meta"]["roomId"],
+            start_time=head["startTime"],
+            end_time=head["endTime"],
+            accounts=(
+                Account(
+                    id=account["accountId"],
+                    seat=account.get("seat", 0),
+                    nickname=account["nickname"],
+                )
+                for account in head["accounts"]
+            ),
+            results=(
+                PlayerResult(
+                    seat=result.get("seat", 0),
+                    final_point=result.get("partPoint1", 0),
+                )
+                for result in head["result"]["players"]
+            ),
+            hules=(
+                Hule(
+                    seat=hule.get("seat", 0),
+                    fan_ids=[fan.get("id", 0) for fan in hule.get("fans", [])],
+                    fan_count=hule.get("count", 0),
+                )
+                for record in data["records"]
+                if record["name"] == "RecordHule"
+                for hule in record["data"]["hules"]
+            ),
+        )
+    except Exception:
+        return make_exception_summary(data)
+
+
+def summarize_game_record(
+    res: pb.ResGameRecord, validate: Validator = validate_log
+) -> Summary:
+    """Summarize game record without converting it into dict
+
+    Only game config is converted, for validate. Fields of summary are read
+    from messages and only RecordHule records are decoded. Invalid games fall
+    back to summarize_log, so their errors carry the log as before.
+
+    Args:
+        res (ResGameRecord): response of fetchGameRecord
+        validate (Validator, optional): validator of ruleset the game should
+            follow, default ruleset if omitted
+
+    Returns:
+        Summary: same summary as summarize_log of the converted log
+    """
+    try:
+        if not res.HasField("error") and res.HasField("head"):
+            head = res.head
+            # validators read only player count and config of head
+            is_valid, _ = validate(
+                {
+                    "head": {
+                        "accounts": head.accounts,
+                        "config": message_to_dict(head.config),
+                    }
+                }
+            )
+            if is_valid:
+                return build_summary(
+                    uuid=head.uuid,
+                    room_id=head.config.meta.room_id,
+                    start_time=head.start_time,
+                    end_time=head.end_time,
+                    accounts=(
+                        Account(
+                            id=account.account_id,
+                            seat=account.seat,
+                            nickname=account.nickname,
+                        )
+                        for account in head.accounts
+                    ),
+                    results=(
+                        PlayerResult(seat=result.seat, final_point=result.part_point_1)
+                        for result in head.result.players
+                    ),
+                    hules=(
+                        Hule(
+                            seat=hule.seat,
+                            fan_ids=[fan.id for fan in hule.fans],
+                            fan_count=hule.count,
+                        )
+                        for _, record in GameRecordView(res).messages(
+                            SUMMARY_RECORD_NAMES
+                        )
+                        for hule in t.cast(pb.RecordHule, record).hules
+                    ),
+                )
+    except Exception:
+        # broken records are reported by summarize_log
+        pass
+
+    try:
+        # full log, so error payloads carry every record like summarize_log
+        data = make_log(res)
+    except Exception:
+        return make_exception_summary()
+    return summarize_log(data, validate)
+
+
+def make_csv_row(summary: Summary) -> t.List[t.Any]:
+    """Make csv row of summary
+
+    Args:
+        summary (Summary): summary from summarize_log
+
+    Returns:
+        List[Any]: date, nickname and final point of each rank, room id and
+            noted yakus, or error messages in the 11th column
+    """
+    if isinstance(summary, SummaryError):
+        rows = [""] * 10  # type: t.List[t.Any]
+        rows.append(
+            "Error: ("
+            + ") & (".join(error["message"] for error in summary.errors)
+            + ")"
+        )
+        return rows
+
+    date = datetime.fromtimestamp(summary.start_time, timezone.utc).astimezone(
+        timezone(timedelta(hours=9))
+    )
+    rows = ["{date.year}년 {date.month}월 {date.day}일".format(date=date)]
+    for rank in summary.ranks:
+        rows.append(rank.nickname)
+        rows.append(rank.final_point)
+    rows.append(summary.room_id)
+    if summary.noted_yakus:
+        rows.append(
+            "/".join(
+                f"{noted_yaku.player.rank}위 {noted_yaku.yaku}"
+                for noted_yaku in summary.noted_yakus
+            )
+        )
+    return rows
@@ -0,0 +1,89 @@
+import typing as t
+
+import ms.protocol_pb2 as pb
+
+UUID = "210807-3a956b38-1df3-48db-b06e-9f1b0a28ba48"
+
+
+def wrap(message: t.Any) -> bytes:
+    wrapper = pb.Wrapper()
+    wrapper.name = ".lq." + message.DESCRIPTOR.name
+    wrapper.data = message.SerializeToString()
+    return wrapper.SerializeToString()
+
+
+def make_game_record() -> pb.ResGameRecord:
+    res = pb.ResGameRecord()
+    head = res.head
+    head.uuid = UUID
+    head.start_time = 1628300996
+    head.end_time = 1628302475
+    head.config.category = 1
+    head.config.meta.room_id = 20481
+    head.config.mode.mode = 2
+    head.config.mode.detail_rule.fandian = 30000
+    for seat, (account_id, nickname, point) in enumerate(
+        [
+            (124782781, "MightyMoon", -13200),
+            (74030349, "BlackSeed", 30300),
+            (75134334, "AI123123123", 49300),
+            (67906613, "ice_Mocha", 33600),
+        ]
+    ):
+        account = head.accounts.add()
+        account.account_id = account_id
+        account.seat = seat
+        account.nickname = nickname
+        player = head.result.players.add()
+        player.seat = seat
+        player.part_point_1 = point
+
+    record = pb.RecordHule()
+    hule = record.hules.add()
+    hule.seat = 2
+    hule.count = 13
+    hule.fans.add().id = 42
+    details = pb.GameDetailRecords()
+    details.records.append(wrap(pb.RecordNewRound()))
+    details.records.append(wrap(record))
+    res.data = wrap(details)
+    return res
+
+
+def make_log() -> t.Dict[str, t.Any]:
+    return {
+        "head": {
+            "uuid": "210807-3a956b38-1df3-48db-b06e-9f1b0a28ba48",
+            "startTime": 1628300996,
+            "endTime": 1628302475,
+            "config": {
+                "category": 1,
+                "meta": {"roomId": 20481},
+                "mode": {"mode": 2, "detailRule": {"fandian": 30000}},
+            },
+            "accounts": [
+                {"accountId": 124782781, "nickname": "MightyMoon"},
+                {"accountId": 74030349, "nickname": "BlackSeed", "seat": 1},
+                {"accountId": 75134334, "nickname": "AI123123123", "seat": 2},
+                {"accountId": 67906613, "nickname": "ice_Mocha", "seat": 3},
+            ],
+            "result": {
+                "players": [
+                    {"seat": 2, "partPoint1": 49300},
+                    {"seat": 3, "partPoint1": 33600},
+                    {"seat": 1, "partPoint1": 30300},
+                    {"partPoint1": -13200},
+                ]
+            },
+        },
+        "records": [
+            {
+                "name": "RecordHule",
+                "data": {"hules": [{"seat": 2, "count": 13, "fans": [{"id": 42}]}]},
+            },
+            {
+                "name": "RecordHule",
+                "data": {"hules": [{"count": 13, "fans": [{"id": 1}, {"id": 31}]}]},
+            },
+        ],
+    }
@@ -514,3 +514,13 @@ def test_uuid_error(client: FlaskClient):
     csv_data = rv.data.decode("utf-8")
     expected_data = ",,,,,,,,,,Error: (Invalid player count: 1. It should be 4.) & (Invalid mode: 1. It should be 4-Player Two-Wind Match Mode(2).) & (Invalid red dora: 4. It should be 3.) & (Invalid min points to win: 25000. It should be 30000.) & (Invalid min han: 2. It should be 1.) & (Invalid starting points: 10000. It should be 25000.) & (Invalid local yaku: 1. It should be 0.) & (Invalid open hand: 1. It should be 0.) & (Invalid thinking time(add): 5. It should be 20.) & (Invalid thinking time(fixed): 3. It should be 5.)\r\n"
     assert csv_data == expected_data
+
+
+def test_batch_invalid_body(client: FlaskClient):
+    rv = client.post(
+        "/batch", json={"uuid": "210525-e9e55c55-f25c-497c-a435-7e29a6df2483"}
+    )
+    json_data = rv.get_json()
+    assert rv.status_code == 400
+    assert json_data is not None
+    assert json_data["result"] == "ERROR"
@@ -0,0 +1,118 @@
+import threading
+import time
+import typing as t
+
+from src.archives import GameArchive, GameQuery
+from src.summaries import GameSummary, NotedYaku, PlayerRank
+
+
+def make_summary(uuid: str, room_id: int, start_time: int) -> GameSummary:
+    ranks = [
+        PlayerRank(id=100 + seat, seat=seat, nickname=f"p{seat}", final_point=0, rank=i)
+        for i, seat in enumerate([2, 0, 3, 1], 1)
+    ]
+    return GameSummary(
+        uuid=uuid,
+        room_id=room_id,
+        start_time=start_time,
+        end_time=start_time + 1800,
+        ranks=ranks,
+        noted_yakus=[NotedYaku(yaku="국사무쌍", player=ranks[3])],
+    )
+
+
+def test_add_and_get():
+    archive = GameArchive(":memory:")
+    summary = make_summary("a", 20496, 1000)
+    assert archive.add(summary)
+    # unchanged summaries are not written again
+    assert not archive.add(summary)
+    assert archive.add(summary._replace(end_time=1001))
+    assert archive.add(summary)
+    assert archive.get("a") == summary
+    assert archive.get("b") is None
+    assert archive.stats() == {"games": 1}
+
+
+def test_add_from_workers_sharing_file(tmp_path: t.Any):
+    path = str(tmp_path / "archive.db")
+    first, second = GameArchive(path), GameArchive(path)
+    summary = make_summary("a", 20496, 1000)
+    first_read = threading.Event()
+    select_games = first._select_games
+
+    def select_games_then_wait(uuid: str) -> t.List[t.Tuple]:
+        rows = select_games(uuid)
+        # the other worker archives the same game before this one writes
+        first_read.set()
+        time.sleep(0.2)
+        return rows
+
+    first._select_games = select_games_then_wait  # type: ignore[method-assign]
+
+    def add_from_second() -> None:
+        first_read.wait()
+        second.add(summary)
+
+    thread = threading.Thread(target=add_from_second)
+    thread.start()
+    first.add(summary)
+    thread.join()
+
+    assert first.stats() == {"games": 1}
+    room_stats = first.get_room_stats(20496)
+    assert room_stats is not None and room_stats.games == 1
+    player_stats = first.get_player_stats(102)
+    assert player_stats is not None and player_stats.games == 1
+
+
+def test_find():
+    archive = GameArchive(":memory:")
+    archive.add(make_summary("a", 20496, 1000))
+    archive.add(make_summary("b", 20496, 2000))
+    archive.add(make_summary("c", 20481, 3000)._replace(ranks=[], noted_yakus=[]))
+
+    def find(**kwargs) -> list:
+        return [summary.uuid for summary in archive.find(GameQuery(**kwargs))]
+
+    assert find() == ["c", "b", "a"]
+    assert find(room_id=20496) == ["b", "a"]
+    assert find(account_id=101) == ["b", "a"]
+    assert find(account_id=101, start=1000, end=2000) == ["a"]
+    assert find(limit=1, offset=1) == ["b"]
+
+
+def test_stats_follow_added_and_replaced_games():
+    archive = GameArchive(":memory:")
+    archive.add(make_summary("a", 20496, 1000))
+    archive.add(make_summary("b", 20496, 2000))
+    archive.add(make_summary("c", 20481, 3000))
+    # replacing a game must not count it twice
+    archive.add(make_summary("c", 20481, 3000)._replace(noted_yakus=[]))
+
+    stats = archive.get_player_stats(101, room_id=20496)
+    assert stats is not None
+    assert stats.to_dict() == {
+        "accountId": 101,
+        "roomId": 20496,
+        "nickname": "p1",
+        "games": 2,
+        "averageRank": 4.0,
+        "rankCounts": [0, 0, 0, 2],
+        "totalPoints": 0,
+        "averagePoints": 0.0,
+        "yakumans": 2,
+    }
+    stats = archive.get_player_stats(101)
+    assert stats is not None
+    assert (stats.games, stats.yakumans) == (3, 2)
+    assert archive.get_player_stats(999) is None
+
+    room_stats = archive.get_room_stats(20481)
+    assert room_stats is not None
+    assert (room_stats.games, room_stats.yakumans) == (1, 0)
+
+    player_stats = archive.get_player_stats(101)
+    assert archive.rebuild_stats() == 3
+    assert archive.get_player_stats(101) == player_stats
+    assert archive.get_room_stats(20481) == room_stats
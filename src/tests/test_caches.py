@@ -0,0 +1,173 @@
+import asyncio
+
+import pytest
+
+from src.caches import (
+    DirectoryRecordCache,
+    MemoryRecordCache,
+    RecordCache,
+    RefreshingValue,
+    SqliteRecordCache,
+    TieredRecordCache,
+    create_record_cache,
+    is_cacheable_key,
+    make_cached_record,
+)
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryRecordCache(max_bytes=10)
+    cache.set("a", make_cached_record(b"1234"))
+    cache.set("b", make_cached_record(b"1234"))
+    assert cache.get("a") is not None
+    cache.set("c", make_cached_record(b"1234"))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 3
+    assert stats["misses"] == 1
+    assert stats["bytes"] == 8
+
+
+def test_memory_cache_skips_oversized_record():
+    cache = MemoryRecordCache(max_bytes=3)
+    cache.set("a", make_cached_record(b"1234"))
+    assert cache.get("a") is None
+
+
+@pytest.mark.parametrize("filename", ["records.sqlite", "records"])
+def test_persistent_cache_survives_restart(tmp_path, filename: str):
+    path = str(tmp_path / filename)
+    cache = create_record_cache(0, path)
+    assert isinstance(cache, (SqliteRecordCache, DirectoryRecordCache))
+    record = make_cached_record(b"\x00record")
+    cache.set("210525-e9e55c55-f25c-497c-a435-7e29a6df2483", record)
+
+    reopened_cache = create_record_cache(0, path)
+    assert reopened_cache is not None
+    assert reopened_cache.get("210525-e9e55c55-f25c-497c-a435-7e29a6df2483") == record
+    assert reopened_cache.get("missing") is None
+    assert reopened_cache.keys() == ["210525-e9e55c55-f25c-497c-a435-7e29a6df2483"]
+
+
+@pytest.mark.parametrize("filename", ["records.sqlite", "records"])
+def test_persistent_cache_evicts_oldest_records(tmp_path, filename: str):
+    path = str(tmp_path / filename)
+    cache = create_record_cache(0, path, path_max_bytes=10)
+    assert cache is not None
+    cache.set("a", make_cached_record(b"1234"))
+    cache.set("b", make_cached_record(b"1234"))
+    cache.set("c", make_cached_record(b"1234"))
+    cache.set("d", make_cached_record(b"12345678901"))
+
+    assert cache.get("a") is None
+    assert cache.get("b") is not None
+    assert cache.get("c") is not None
+    assert cache.get("d") is None
+    assert cache.stats()["evictions"] == 1
+
+    reopened_cache = create_record_cache(0, path, path_max_bytes=10)
+    assert reopened_cache is not None
+    assert reopened_cache.stats()["bytes"] == 8
+
+
+def test_tiered_cache_promotes_hits(tmp_path):
+    memory_cache = MemoryRecordCache(max_bytes=1024)
+    disk_cache = SqliteRecordCache(str(tmp_path / "records.db"))
+    disk_cache.set("a", make_cached_record(b"data"))
+    cache = TieredRecordCache([memory_cache, disk_cache])  # type: RecordCache
+
+    assert cache.get("a") is not None
+    assert memory_cache.get("a") is not None
+    assert cache.stats()["hits"] == 1
+    assert cache.keys() == ["a"]
+
+
+def test_tiered_cache_reads_persistent_tier_off_loop(tmp_path):
+    memory_cache = MemoryRecordCache(max_bytes=1024)
+    disk_cache = DirectoryRecordCache(str(tmp_path / "records"))
+    disk_cache.set("a", make_cached_record(b"data"))
+    cache = TieredRecordCache([memory_cache, disk_cache])
+    assert cache.persistent
+    assert cache.peek("a") is None
+
+    async def main():
+        return await cache.get_async("a"), await cache.get_async("missing")
+
+    record, missing = asyncio.run(main())
+    assert record == make_cached_record(b"data")
+    assert missing is None
+    assert cache.peek("a") == record
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+    assert stats["tiers"][0]["misses"] == 2
+
+
+def test_directory_cache_reuses_digest_of_unchanged_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "records")
+    DirectoryRecordCache(path).set("a", make_cached_record(b"data"))
+    cache = DirectoryRecordCache(path)
+    assert cache.get("a") == make_cached_record(b"data")
+
+    monkeypatch.setattr(
+        "src.caches.make_cached_record",
+        lambda data: pytest.fail("digest of unchanged file computed again"),
+    )
+    assert cache.get("a") == make_cached_record(b"data")
+
+
+def test_cacheable_key():
+    assert is_cacheable_key("210525-e9e55c55-f25c-497c-a435-7e29a6df2483")
+    assert not is_cacheable_key("../etc/passwd")
+    assert not is_cacheable_key("")
+
+
+def test_create_record_cache_disabled():
+    assert create_record_cache(0, "") is None
+
+
+def test_refreshing_value_serves_stale_value_while_refreshing():
+    loads = [0]
+
+    async def load() -> int:
+        loads[0] += 1
+        await asyncio.sleep(0)
+        return loads[0]
+
+    async def main():
+        value = RefreshingValue(load, ttl=0)
+        assert await asyncio.gather(value.get(), value.get()) == [1, 1]
+        # expired: stale value is returned and one refresh starts
+        assert await value.get() == 1
+        assert await value.get() == 1
+        await asyncio.sleep(0.01)
+        assert await value.get() == 2
+        value.invalidate()
+        assert await value.get() == 3
+
+    asyncio.run(main())
+    assert loads[0] == 3
+
+
+def test_refreshing_value_keeps_stale_value_on_error():
+    results = [1, ValueError("maintenance")]
+
+    async def load() -> int:
+        result = results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def main():
+        value = RefreshingValue(load, ttl=0)
+        assert await value.get() == 1
+        assert await value.get() == 1
+        await asyncio.sleep(0.01)
+        assert await value.get() == 1
+        assert value.failures == 1
+
+    asyncio.run(main())
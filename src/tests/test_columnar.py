@@ -0,0 +1,152 @@
+import typing as t
+
+import pytest
+
+from src.columnar import (
+    FLAG_MOQIE,
+    NO_SEAT,
+    NO_TILE,
+    ColumnarFile,
+    decode_tile,
+    write_columnar,
+)
+
+
+def make_log(uuid: str) -> t.Dict[str, t.Any]:
+    return {
+        "head": {
+            "uuid": uuid,
+            "startTime": 1628300996,
+            "endTime": "1628302475",
+            "config": {"meta": {"roomId": 20481}},
+            "accounts": [
+                {"accountId": 124782781, "nickname": "MightyMoon"},
+                {"accountId": 74030349, "nickname": "검은씨앗", "seat": 1},
+            ],
+            "result": {"players": [{"seat": 1, "partPoint1": 30300}, {}]},
+        },
+        "records": [
+            {
+                "name": "RecordNewRound",
+                "data": {
+                    "ju": 1,
+                    "dora": "0m",
+                    "doras": ["0m"],
+                    "scores": [25000, 25000],
+                    "tiles0": ["1m", "9m"],
+                    "tiles1": ["7z"],
+                },
+            },
+            {"name": "RecordDiscardTile", "data": {"tile": "7z", "moqie": True}},
+            {
+                "name": "RecordChiPengGang",
+                "data": {
+                    "seat": 1,
+                    "type": 1,
+                    "tiles": ["7z", "7z", "7z"],
+                    "froms": [1, 1, 0],
+                },
+            },
+            {
+                "name": "RecordHule",
+                "data": {
+                    "deltaScores": [-32000, 32000],
+                    "scores": [-7000, 57000],
+                    "hules": [
+                        {
+                            "seat": 1,
+                            "huTile": "1m",
+                            "count": 13,
+                            "fans": [{"id": 42, "val": 13}, {"id": 8}],
+                        }
+                    ],
+                },
+            },
+            {"name": "RecordNewRound", "data": {"ben": 1, "liqibang": 1}},
+            {
+                "name": "RecordNoTile",
+                "data": {
+                    "liujumanguan": True,
+                    "players": [{"tingpai": True}, {}],
+                    "scores": [
+                        {"seat": 1, "oldScores": [100, 200], "deltaScores": [-20, 20]},
+                        {"oldScores": [80, 220], "deltaScores": [10, -10]},
+                    ],
+                },
+            },
+        ],
+    }
+
+
+def test_round_trip(tmp_path: t.Any):
+    path = tmp_path / "games.mjcol"
+    path.write_bytes(write_columnar([make_log("a"), make_log("b")]))
+
+    with ColumnarFile.open(str(path)) as columnar:
+        assert list(columnar.column("games", "uuid")) == ["a", "b"]
+        assert list(columnar.column("games", "end_time")) == [1628302475] * 2
+        assert (
+            list(columnar.column("players", "nickname"))
+            == [
+                "MightyMoon",
+                "검은씨앗",
+            ]
+            * 2
+        )
+        assert list(columnar.column("players", "final_point"))[:2] == [0, 30300]
+        assert list(columnar.column("rounds", "game")) == [0, 0, 1, 1]
+        assert decode_tile(columnar.column("rounds", "dora")[0]) == "0m"
+        assert columnar.column("rounds", "doras")[0].tolist() == [0]
+        assert columnar.column("rounds", "scores")[2].tolist() == [25000, 25000]
+        assert [
+            decode_tile(code) for code in columnar.column("rounds", "tiles0")[0]
+        ] == ["1m", "9m"]
+        assert columnar.column("rounds", "tiles3")[0].tolist() == []
+        assert list(columnar.column("rounds", "liqibang"))[:2] == [0, 1]
+
+        assert columnar.table_length("actions") == 12
+        kinds = [columnar.kinds[kind] for kind in columnar.column("actions", "kind")]
+        assert kinds[:4] == [
+            "RecordNewRound",
+            "RecordDiscardTile",
+            "RecordChiPengGang",
+            "RecordHule",
+        ]
+        assert list(columnar.column("actions", "seat"))[:4] == [
+            NO_SEAT,
+            0,
+            1,
+            NO_SEAT,
+        ]
+        assert decode_tile(columnar.column("actions", "tile")[1]) == "7z"
+        assert columnar.column("actions", "tile")[2] == NO_TILE
+        assert columnar.column("actions", "flags")[1] == FLAG_MOQIE
+        assert columnar.column("actions", "type")[2] == 1
+        assert [
+            decode_tile(code) for code in columnar.column("actions", "tiles")[2]
+        ] == ["7z"] * 3
+        assert columnar.column("actions", "froms")[2].tolist() == [1, 1, 0]
+        # doras of a new round are only kept in rounds
+        assert columnar.column("actions", "doras")[0].tolist() == []
+
+        assert list(columnar.column("hules", "action")) == [3, 9]
+        assert columnar.column("hules", "fan_ids")[0].tolist() == [42, 8]
+        assert columnar.column("hules", "fan_vals")[0].tolist() == [13, 0]
+
+        assert list(columnar.column("results", "action")) == [3, 5, 9, 11]
+        assert list(columnar.column("results", "round")) == [0, 1, 2, 3]
+        assert columnar.column("results", "delta_scores")[0].tolist() == [
+            -32000,
+            32000,
+        ]
+        assert columnar.column("results", "scores")[0].tolist() == [-7000, 57000]
+        # payments of nagashi mangan are summed
+        assert columnar.column("results", "delta_scores")[1].tolist() == [-10, 10]
+        assert columnar.column("results", "scores")[1].tolist() == [90, 210]
+        assert columnar.column("results", "tingpai")[1].tolist() == [1, 0]
+        assert list(columnar.column("results", "liujumanguan"))[:2] == [0, 1]
+
+
+def test_reject_other_files():
+    with pytest.raises(ValueError):
+        ColumnarFile(b"{}")
@@ -0,0 +1,36 @@
+import gzip
+
+from werkzeug.http import parse_accept_header
+
+from src.compressions import (
+    IDENTITY,
+    StoredResponse,
+    compress,
+    negotiate_coding,
+    pack_response,
+    unpack_response,
+)
+
+
+def test_negotiate_coding():
+    def negotiate(header: str) -> str:
+        return negotiate_coding(parse_accept_header(header))
+
+    assert negotiate("") == IDENTITY
+    assert negotiate("gzip, deflate") == "gzip"
+    assert negotiate("deflate") == IDENTITY
+    assert negotiate("gzip;q=0.5, identity") == IDENTITY
+    assert negotiate("gzip;q=0") == IDENTITY
+
+
+def test_compress():
+    body = b'{"head": {}}' * 100
+    assert compress(IDENTITY, body) is body
+    assert gzip.decompress(compress("gzip", body)) == body
+
+
+def test_pack_response():
+    response = StoredResponse(
+        headers={"Content-Type": "text/csv"}, body=b"a,b\n\x00\x01\n"
+    )
+    assert unpack_response(pack_response(response)) == response
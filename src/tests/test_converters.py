@@ -0,0 +1,76 @@
+import json
+import typing as t
+
+from google.protobuf.json_format import MessageToJson
+import ms.protocol_pb2 as pb
+import pytest
+
+from src.converters import message_to_dict
+
+
+def make_hule() -> pb.RecordHule:
+    record = pb.RecordHule()
+    hule = record.hules.add()
+    hule.seat = 2
+    hule.hand.extend(["1m", "9m", "1p", "9p", "1s", "9s", "1z"])
+    hule.hu_tile = "7z"
+    hule.yiman = True
+    hule.count = 13
+    fan = hule.fans.add()
+    fan.id = 42
+    fan.val = 13
+    record.delta_scores.extend([-32000, 0, 32000, 0])
+    return record
+
+
+def make_game() -> pb.ResGameRecord:
+    res = pb.ResGameRecord()
+    res.head.uuid = "210525-e9e55c55-f25c-497c-a435-7e29a6df2483"
+    res.head.config.meta.room_id = 20496
+    res.head.config.mode.detail_rule.bianjietishi = True
+    account = res.head.accounts.add()
+    account.account_id = 69560545
+    account.nickname = "SiraB"
+    account.views.add().item_id = 308005
+    res.data = b"\x00\x01binary"
+    return res
+
+
+def make_statistic() -> pb.AccountStatisticByGameMode:
+    statistic = pb.AccountStatisticByGameMode()
+    statistic.gold_earn_sum = 0.1
+    statistic.dadian_sum = float("inf")
+    return statistic
+
+
+def make_player_state() -> pb.ResGamePlayerState:
+    state = pb.ResGamePlayerState()
+    state.state_list.extend([0, 1, 2])
+    return state
+
+
+def make_connection() -> pb.ResRequestConnection:
+    connection = pb.ResRequestConnection()
+    connection.timestamp = 2**40
+    return connection
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        pb.RecordNewRound(),
+        make_hule(),
+        make_game(),
+        make_statistic(),
+        make_player_state(),
+        make_connection(),
+    ],
+)
+def test_message_to_dict_matches_json_round_trip(message: t.Any):
+    assert message_to_dict(message) == json.loads(MessageToJson(message))
+
+
+def test_message_to_dict_excludes_fields():
+    expected = json.loads(MessageToJson(make_game()))
+    del expected["data"]
+    assert message_to_dict(make_game(), exclude_fields=("data",)) == expected
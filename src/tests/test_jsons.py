@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+from src import jsons
+from src.jsons import dumps, iter_log_json
+from src.records import make_log
+from src.tests.factories import make_game_record
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_dumps(use_orjson: bool, monkeypatch: pytest.MonkeyPatch):
+    if not use_orjson:
+        monkeypatch.setattr(jsons, "HAS_ORJSON", False)
+    obj = {"nickname": "국사무쌍", "points": [1, -2.5], "ok": True, "none": None}
+    assert json.loads(dumps(obj)) == obj
+
+
+def test_iter_log_json(monkeypatch: pytest.MonkeyPatch):
+    res = make_game_record()
+    monkeypatch.setattr(jsons, "STREAM_CHUNK_BYTES", 1)
+    chunks = list(iter_log_json(res))
+    # head first, then a chunk per record and the end of document
+    assert len(chunks) == 4
+    assert json.loads(chunks[0] + b"]}")["head"]["uuid"] == res.head.uuid
+    assert b"".join(chunks) == dumps(make_log(res))
+
+    assert b"".join(iter_log_json(res, {"RecordHule"})) == dumps(
+        make_log(res, {"RecordHule"})
+    )
+
+    head_only = b"".join(iter_log_json(res, fields={"head"}))
+    assert list(json.loads(head_only)) == ["head"]
+    assert head_only == dumps(make_log(res, fields={"head"}))
+
+    res.error.code = 1203
+    assert b"".join(iter_log_json(res)) == dumps(make_log(res))
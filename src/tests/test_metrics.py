@@ -0,0 +1,68 @@
+import pytest
+
+from src.metrics import (
+    Counter,
+    Histogram,
+    Registry,
+    format_server_timing,
+    request_timings,
+    stage_errors,
+    stage_seconds,
+    time_stage,
+)
+
+
+def test_render_counter():
+    registry = Registry()
+    counter = registry.register(Counter("errors_total", "Errors.", ("code",)))
+    counter.inc(code="1203")
+    counter.inc(2, code='a"b')
+    assert registry.render() == (
+        "# HELP errors_total Errors.\n"
+        "# TYPE errors_total counter\n"
+        'errors_total{code="1203"} 1\n'
+        'errors_total{code="a\\"b"} 2\n'
+    )
+
+
+def test_render_histogram():
+    registry = Registry()
+    histogram = registry.register(Histogram("seconds", "Seconds.", buckets=(0.1, 1)))
+    histogram.observe(0.05)
+    histogram.observe(0.1)
+    histogram.observe(5)
+    assert registry.render().splitlines()[2:] == [
+        'seconds_bucket{le="0.1"} 2',
+        'seconds_bucket{le="1"} 2',
+        'seconds_bucket{le="+Inf"} 3',
+        "seconds_sum 5.15",
+        "seconds_count 3",
+    ]
+
+
+def test_labels_must_match():
+    counter = Counter("errors_total", "Errors.", ("code",))
+    with pytest.raises(ValueError):
+        counter.inc(stage="fetch")
+
+
+def test_time_stage_records_timings_and_errors():
+    timings = []
+    token = request_timings.set(timings)
+    try:
+        with time_stage("test-decode"):
+            pass
+        with pytest.raises(KeyError):
+            with time_stage("test-decode"):
+                raise KeyError()
+    finally:
+        request_timings.reset(token)
+
+    assert [stage for stage, _ in timings] == ["test-decode", "test-decode"]
+    assert stage_seconds.get_count(stage="test-decode") == 2
+    assert stage_errors.get(stage="test-decode", error="KeyError") == 1
+
+
+def test_format_server_timing():
+    timings = [("fetch", 0.1), ("summarize", 0.002), ("fetch", 0.05)]
+    assert format_server_timing(timings) == "fetch;dur=150.0, summarize;dur=2.0"
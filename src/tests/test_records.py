@@ -0,0 +1,122 @@
+import ms.protocol_pb2 as pb
+
+from src.records import (
+    RECORD_TYPES,
+    ExcludedNames,
+    GameRecordView,
+    LazyRecord,
+    peek_record_name,
+    split_wrapper,
+)
+from src.tests.factories import wrap
+
+
+def make_game(new_format: bool) -> pb.ResGameRecord:
+    new_round = pb.RecordNewRound()
+    new_round.tiles0.extend(["1m", "2m", "3m"])
+    discard = pb.RecordDiscardTile()
+    discard.tile = "1m"
+    hule = pb.RecordHule()
+    hule.hules.add().fans.add().id = 42
+
+    details = pb.GameDetailRecords()
+    for item in map(wrap, [new_round, discard, hule]):
+        if new_format:
+            details.actions.add().result = item
+            details.actions.add().type = 2
+        else:
+            details.records.append(item)
+    res = pb.ResGameRecord()
+    res.data = wrap(details)
+    return res
+
+
+def test_peek_record_name():
+    discard = pb.RecordDiscardTile()
+    discard.tile = "5z"
+    assert peek_record_name(wrap(discard)) == "RecordDiscardTile"
+
+
+def test_view_iterates_both_formats():
+    for new_format in (False, True):
+        view = GameRecordView(make_game(new_format))
+        assert [record.name for record in view] == [
+            "RecordNewRound",
+            "RecordDiscardTile",
+            "RecordHule",
+        ]
+
+
+def test_view_decodes_only_filtered_records():
+    view = GameRecordView(make_game(False))
+    records = list(view.filter({"RecordHule"}))
+    assert len(records) == 1
+    assert records[0]._message is None
+    assert records[0].to_dict() == {
+        "name": "RecordHule",
+        "data": {"hules": [{"fans": [{"id": 42}]}]},
+    }
+
+
+def test_view_filters_by_name_prefix():
+    view = GameRecordView(make_game(False))
+    names = ["RecordNewRound", "RecordHule"]
+    # sets skip other records by bytes, other containers split every record
+    assert [record.name for record in view.filter(frozenset(names))] == names
+    assert [record.name for record in view.filter(names)] == names
+    assert list(view.filter({"RecordHul"})) == []
+
+    excluded = ExcludedNames(["RecordDiscardTile"])
+    assert [record.name for record in view.filter(excluded)] == names
+
+
+def test_view_messages():
+    view = GameRecordView(make_game(True))
+    ((name, message),) = view.messages({"RecordDiscardTile"})
+    assert name == "RecordDiscardTile"
+    assert message.tile == "1m"
+
+
+def test_split_wrapper():
+    discard = pb.RecordDiscardTile()
+    discard.tile = "1m"
+    name, body = split_wrapper(wrap(discard))
+    assert name == ".lq.RecordDiscardTile"
+    assert body == discard.SerializeToString()
+
+    assert split_wrapper(wrap(pb.RecordDiscardTile())) == (".lq.RecordDiscardTile", b"")
+
+    wrapper = pb.Wrapper()
+    wrapper.data = b"\x01\x02"
+    assert split_wrapper(wrapper.SerializeToString()) == ("", b"\x01\x02")
+
+
+def test_lazy_record_decodes_once():
+    discard = pb.RecordDiscardTile()
+    discard.tile = "1m"
+    record = LazyRecord(
+        "RecordDiscardTile",
+        discard.SerializeToString(),
+        RECORD_TYPES[".lq.RecordDiscardTile"],
+    )
+    assert record.message is record.message
+    assert record.to_dict() == {"name": "RecordDiscardTile", "data": {"tile": "1m"}}
+
+
+def test_unknown_record_type_falls_back_to_raw_body():
+    wrapper = pb.Wrapper()
+    wrapper.name = ".lq.RecordFromTheFuture"
+    wrapper.data = b"\x08\x01"
+    details = pb.GameDetailRecords()
+    details.records.append(wrapper.SerializeToString())
+    res = pb.ResGameRecord()
+    res.data = wrap(details)
+
+    (record,) = GameRecordView(res)
+    assert record.message is None
+    assert record.to_dict() == {
+        "name": "RecordFromTheFuture",
+        "data": {},
+        "raw": "CAE=",
+    }
+    assert list(GameRecordView(res).messages()) == []
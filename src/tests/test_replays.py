@@ -0,0 +1,442 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import json
+import sqlite3
+import typing as t
+
+from flask.testing import FlaskClient
+import ms.protocol_pb2 as pb
+import pytest
+
+from src import apis, create_app, create_asgi_app, ms_apis
+from src.archives import GameArchive
+from src.asgi import AsgiApp
+from src.caches import MemoryRecordCache
+from src.columnar import ColumnarFile
+from src.replays import (
+    MISSING_RECORD_ERROR_CODE,
+    FixtureStore,
+    ReplayLobby,
+    ServerDocuments,
+)
+from src.sessions import LobbyPool
+from src.tests.factories import UUID, make_game_record
+from src.validations import DEFAULT_RULESET
+
+
+def make_store(path: str) -> FixtureStore:
+    store = FixtureStore(path)
+    store.save_server_documents(
+        ServerDocuments(
+            version={"version": "0.10.1.w"},
+            config={"ip": [{"region_urls": [{}, {"url": "https://gateway"}]}]},
+            servers={"servers": ["gateway:443"]},
+        )
+    )
+    store.save_game_record(UUID, make_game_record().SerializeToString())
+    return store
+
+
+@pytest.fixture
+def replay(tmp_path: t.Any, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(ms_apis, "replay_store", make_store(str(tmp_path)))
+    monkeypatch.setattr(ms_apis, "record_store", None)
+    monkeypatch.setattr(ms_apis, "record_cache", None)
+    monkeypatch.setattr(apis, "response_cache", MemoryRecordCache(1 << 20))
+    monkeypatch.setattr(
+        ms_apis, "server_info", ms_apis.RefreshingValue(ms_apis.fetch_server_info, 60)
+    )
+    monkeypatch.setattr(ms_apis, "session_pool", LobbyPool(ms_apis.open_replay_session))
+
+
+@pytest.fixture
+def client(replay: None) -> t.Iterator[FlaskClient]:
+    with create_app().test_client() as client:
+        yield client
+
+
+def test_store_round_trip(tmp_path: t.Any):
+    store = make_store(str(tmp_path))
+    assert store.uuids() == [UUID]
+    assert store.load_server_documents().servers == {"servers": ["gateway:443"]}
+    assert store.load_game_record("../" + UUID) is None
+
+    lobby = ReplayLobby(store)
+    req = pb.ReqGameRecord()
+    req.game_uuid = UUID
+    res = asyncio.run(lobby.fetch_game_record(req))
+    assert res.head.uuid == UUID
+    req.game_uuid = "missing"
+    res = asyncio.run(lobby.fetch_game_record(req))
+    assert res.error.code == MISSING_RECORD_ERROR_CODE
+
+
+def test_replay_uuid(client: FlaskClient):
+    rv = client.get(f"/uuid/{UUID}")
+    assert rv.status_code == 200
+    json_data = rv.get_json()
+    assert [rank["nickname"] for rank in json_data["ranks"]] == [
+        "AI123123123",
+        "ice_Mocha",
+        "BlackSeed",
+        "MightyMoon",
+    ]
+    assert json_data["noted_yakus"][0]["yaku"] == "국사무쌍"
+    assert ms_apis.server_info.loads == 1
+
+    stages = [entry.split(";")[0] for entry in rv.headers["Server-Timing"].split(", ")]
+    # summaries read messages, so the log is never decoded into dicts
+    assert stages == ["fetch_game_record", "summarize", "total"]
+
+
+def test_replay_uuid_ruleset(replay: None):
+    league = DEFAULT_RULESET._replace(
+        name="league",
+        rules=(DEFAULT_RULESET.rules[0]._replace(expected_value=2),),
+    )
+    app = create_app({"RULESETS": {"default": DEFAULT_RULESET, "league": league}})
+    with app.test_client() as client:
+        rv = client.get(f"/uuid/{UUID}?ruleset=league")
+        assert rv.status_code == 500
+        assert rv.get_json()["errors"][0]["code"] == "invalid-category"
+        assert client.get(f"/uuid/{UUID}?ruleset=default").status_code == 200
+        assert client.get(f"/uuid/{UUID}?ruleset=unknown").status_code == 400
+
+
+def test_replay_uuid_raw_projection(client: FlaskClient):
+    rv = client.get(f"/uuid-raw/{UUID}")
+    assert [record["name"] for record in rv.get_json()["records"]] == [
+        "RecordNewRound",
+        "RecordHule",
+    ]
+
+    rv = client.get(f"/uuid-raw/{UUID}?fields=records&records=RecordHule")
+    assert rv.status_code == 200
+    json_data = rv.get_json()
+    assert list(json_data) == ["records"]
+    assert [record["name"] for record in json_data["records"]] == ["RecordHule"]
+
+    rv = client.get(f"/uuid-raw/{UUID}?exclude_records=RecordHule")
+    assert [record["name"] for record in rv.get_json()["records"]] == ["RecordNewRound"]
+
+    assert client.get(f"/uuid-raw/{UUID}?fields=body").status_code == 400
+    assert client.get(f"/uuid-raw/{UUID}?records=Hule").status_code == 400
+    rv = client.get(f"/uuid-raw/{UUID}?records=RecordHule&exclude_records=RecordHule")
+    assert rv.status_code == 400
+
+
+def test_replay_uuid_raw_formats(client: FlaskClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(ms_apis, "record_cache", MemoryRecordCache(1 << 20))
+    rv = client.get(f"/uuid-raw/{UUID}", headers={"Accept": "text/html, */*"})
+    assert rv.mimetype == "application/json"
+    json_etag = rv.headers["ETag"]
+    rv = client.get(f"/uuid-raw/{UUID}", headers={"Accept": "text/html"})
+    assert rv.mimetype == "application/json"
+    assert rv.headers["ETag"] == json_etag
+
+    rv = client.get(f"/uuid-raw/{UUID}", headers={"Accept": "application/x-protobuf"})
+    assert rv.status_code == 200
+    assert rv.mimetype == "application/x-protobuf"
+    assert rv.data == make_game_record().SerializeToString()
+    assert rv.headers["ETag"] != json_etag
+    assert "Accept" in rv.headers["Vary"]
+
+
+def test_replay_uuid_raw_msgpack(client: FlaskClient):
+    msgpack = pytest.importorskip("msgpack")
+    json_data = client.get(f"/uuid-raw/{UUID}?fields=head").get_json()
+    rv = client.get(
+        f"/uuid-raw/{UUID}?fields=head", headers={"Accept": "application/msgpack"}
+    )
+    assert rv.mimetype == "application/msgpack"
+    assert msgpack.unpackb(rv.data) == json_data
+
+
+def test_replay_uuid_columnar(client: FlaskClient):
+    rv = client.get(f"/uuid-columnar/{UUID}")
+    assert rv.status_code == 200
+    with ColumnarFile(rv.data) as columnar:
+        assert list(columnar.column("games", "uuid")) == [UUID]
+        assert columnar.column("hules", "fan_ids")[0].tolist() == [42]
+
+
+def test_replay_batch(client: FlaskClient):
+    rv = client.post("/batch", json={"uuids": [UUID, "invalid-uuid"]})
+    assert rv.status_code == 200
+    json_data = rv.get_json()
+    assert json_data["result"] == "OK"
+    results = json_data["results"]
+    assert [result["uuid"] for result in results] == [UUID, "invalid-uuid"]
+    assert results[0]["result"] == "OK"
+    assert results[0]["status"] == 200
+    assert [rank["finalPoint"] for rank in results[0]["ranks"]] == [
+        49300,
+        33600,
+        30300,
+        -13200,
+    ]
+    assert results[1]["result"] == "ERROR"
+    assert results[1]["status"] == 500
+    assert results[1]["errors"][0]["code"] == "cannot-get-log"
+
+
+def test_replay_batch_csv(client: FlaskClient):
+    rv = client.post("/batch-csv", json=[UUID, "invalid-uuid", UUID])
+    row = (
+        "2021년 8월 7일,AI123123123,49300,ice_Mocha,33600,BlackSeed,30300,"
+        "MightyMoon,-13200,20481,1위 국사무쌍\r\n"
+    )
+    expected_data = row + ",,,,,,,,,,Error: (Cannot get game log data.)\r\n" + row
+    assert rv.data.decode("utf-8") == expected_data
+
+
+def test_replay_batch_size_limits(replay: None):
+    app = create_app({"BATCH_MAX_SIZE": 1, "BATCH_CSV_MAX_SIZE": 2})
+    with app.test_client() as client:
+        rv = client.post("/batch", json=[UUID, UUID])
+        assert rv.status_code == 400
+        assert rv.get_json()["message"].startswith("Too many uuids: 2.")
+        assert client.post("/batch-csv", json=[UUID, UUID]).status_code == 200
+        assert client.post("/batch-csv", json=[UUID] * 3).status_code == 400
+
+
+def test_replay_archives_summaries(
+    client: FlaskClient, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(apis, "game_archive", GameArchive(":memory:"))
+    assert client.get(f"/uuid/{UUID}").status_code == 200
+
+    rv = client.get("/games?account=75134334&from=1628300000")
+    assert rv.status_code == 200
+    assert rv.get_json()["games"] == [client.get(f"/uuid/{UUID}").get_json()]
+    assert client.get("/games?room=20496").get_json()["games"] == []
+    assert client.get("/games?room=abc").status_code == 400
+
+    rv = client.get("/players/75134334/stats")
+    assert rv.status_code == 200
+    assert rv.get_json()["games"] == 1
+    assert client.get("/players/1/stats").status_code == 404
+    assert client.get("/rooms/20496/stats").status_code == 404
+
+
+def test_replay_sends_summary_when_archive_fails(
+    client: FlaskClient, monkeypatch: pytest.MonkeyPatch
+):
+    archive = GameArchive(":memory:")
+
+    def add(summary: t.Any) -> bool:
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(archive, "add", add)
+    monkeypatch.setattr(apis, "game_archive", archive)
+    rv = client.get(f"/uuid/{UUID}")
+    assert rv.status_code == 200
+    assert rv.get_json()["result"] == "OK"
+    text = client.get("/metrics").get_data(as_text=True)
+    assert (
+        'majsoul_stage_errors_total{stage="archive",error="OperationalError"}' in text
+    )
+
+
+def test_replay_sends_record_when_caching_fails(
+    client: FlaskClient, tmp_path: t.Any, monkeypatch: pytest.MonkeyPatch
+):
+    cache = MemoryRecordCache(1 << 20)
+
+    def fail(*args: t.Any) -> None:
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(cache, "set", fail)
+    monkeypatch.setattr(ms_apis, "record_cache", cache)
+    store = FixtureStore(str(tmp_path / "recorded"))
+    monkeypatch.setattr(store, "save_game_record", fail)
+    monkeypatch.setattr(ms_apis, "record_store", store)
+    rv = client.get(f"/uuid/{UUID}")
+    assert rv.status_code == 200
+    assert rv.get_json()["result"] == "OK"
+
+
+def test_metrics(client: FlaskClient):
+    client.get(f"/uuid/{UUID}")
+    rv = client.get("/metrics")
+    assert rv.mimetype == "text/plain"
+    text = rv.get_data(as_text=True)
+    assert 'majsoul_stage_seconds_count{stage="fetch_game_record"}' in text
+    assert (
+        'majsoul_request_seconds_count{endpoint="api.route_uuid",status="200"}' in text
+    )
+
+
+def test_replay_missing_uuid(client: FlaskClient):
+    rv = client.get("/uuid/missing")
+    assert rv.status_code == 500
+    assert rv.get_json()["errors"][0]["code"] == "cannot-get-log"
+    assert rv.headers["Cache-Control"] == "no-store"
+    assert "ETag" not in rv.headers
+
+
+def test_replay_conditional_get(client: FlaskClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(ms_apis, "record_cache", MemoryRecordCache(1 << 20))
+    rv = client.get(f"/uuid/{UUID}")
+    assert rv.status_code == 200
+    assert rv.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+    etag = rv.headers["ETag"]
+
+    rv = client.get(f"/uuid/{UUID}", headers={"If-None-Match": etag})
+    assert rv.status_code == 304
+    assert rv.headers["ETag"] == etag
+    # answered from record cache without fetching
+    stages = [entry.split(";")[0] for entry in rv.headers["Server-Timing"].split(", ")]
+    assert stages == ["total"]
+
+    # proxies which compress responses weaken ETags sent back by clients
+    rv = client.get(f"/uuid/{UUID}", headers={"If-None-Match": "W/" + etag})
+    assert rv.status_code == 304
+
+    # args the view does not read share the tag
+    rv = client.get(f"/uuid/{UUID}?_=1628300996", headers={"If-None-Match": etag})
+    assert rv.status_code == 304
+
+    # other endpoints and query args are other variants
+    rv = client.get(f"/uuid-csv/{UUID}", headers={"If-None-Match": etag})
+    assert rv.status_code == 200
+    assert rv.headers["ETag"] != etag
+    rv = client.get(f"/uuid/{UUID}?ruleset=default", headers={"If-None-Match": etag})
+    assert rv.status_code == 200
+
+
+def test_replay_compressed_response(
+    client: FlaskClient, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(ms_apis, "record_cache", MemoryRecordCache(1 << 20))
+    response_cache = MemoryRecordCache(1 << 20)
+    monkeypatch.setattr(apis, "response_cache", response_cache)
+    body = client.get(f"/uuid-raw/{UUID}").data
+    # uncompressed streamed bodies are sent without being kept
+    assert response_cache.keys() == []
+
+    rv = client.get(f"/uuid-raw/{UUID}", headers={"Accept-Encoding": "gzip"})
+    assert rv.status_code == 200
+    assert rv.headers["Content-Encoding"] == "gzip"
+    assert rv.headers["Content-Type"] == "application/json"
+    assert rv.headers["Vary"] == "Accept, Accept-Encoding"
+    assert rv.headers["ETag"].endswith('-gzip"')
+    assert gzip.decompress(rv.data) == body
+
+    # stored body is sent without running the view
+    stored = client.get(f"/uuid-raw/{UUID}", headers={"Accept-Encoding": "gzip"})
+    assert stored.data == rv.data
+    assert stored.headers["ETag"] == rv.headers["ETag"]
+    stages = [
+        entry.split(";")[0] for entry in stored.headers["Server-Timing"].split(", ")
+    ]
+    assert stages == ["total"]
+    assert response_cache.stats()["hits"] == 1
+
+    rv = client.get(
+        f"/uuid-raw/{UUID}",
+        headers={"Accept-Encoding": "gzip", "If-None-Match": rv.headers["ETag"]},
+    )
+    assert rv.status_code == 304
+
+
+def test_replay_large_streamed_response_is_not_stored(
+    client: FlaskClient, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(ms_apis, "record_cache", MemoryRecordCache(1 << 20))
+    response_cache = MemoryRecordCache(1 << 20)
+    monkeypatch.setattr(apis, "response_cache", response_cache)
+    monkeypatch.setattr(apis, "STREAMED_BODY_MAX_BYTES", 16)
+    rv = client.get(f"/uuid-raw/{UUID}", headers={"Accept-Encoding": "gzip"})
+    assert rv.status_code == 200
+    assert b"AI123123123" in gzip.decompress(rv.data)
+    assert response_cache.keys() == []
+
+
+def test_replay_sends_response_when_storing_it_fails(
+    client: FlaskClient, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(ms_apis, "record_cache", MemoryRecordCache(1 << 20))
+
+    def fail(*args: t.Any) -> None:
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(apis.response_cache, "set", fail)
+    rv = client.get(f"/uuid/{UUID}", headers={"Accept-Encoding": "gzip"})
+    assert rv.status_code == 200
+    assert json.loads(gzip.decompress(rv.data))["result"] == "OK"
+    rv = client.get(f"/uuid-raw/{UUID}", headers={"Accept-Encoding": "gzip"})
+    assert rv.status_code == 200
+    assert b"AI123123123" in gzip.decompress(rv.data)
+    text = client.get("/metrics").get_data(as_text=True)
+    assert 'majsoul_stage_errors_total{stage="store_response",error="OSError"}' in text
+
+
+async def asgi_get(app: AsgiApp, path: str) -> t.List[t.Dict[str, t.Any]]:
+    messages = []  # type: t.List[t.Dict[str, t.Any]]
+
+    async def receive() -> t.Dict[str, t.Any]:
+        return {"type": "http.request", "body": b""}
+
+    async def send(message: t.Dict[str, t.Any]) -> None:
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "query_string": b"",
+        "http_version": "1.1",
+        "headers": [],
+        "server": ("localhost", 80),
+    }
+    await app(scope, receive, send)
+    return messages
+
+
+def test_replay_uuid_over_asgi(replay: None):
+    app = create_asgi_app()
+
+    async def main() -> t.Tuple[t.List, t.List, asyncio.AbstractEventLoop]:
+        first, second = await asyncio.gather(
+            asgi_get(app, f"/uuid/{UUID}"), asgi_get(app, f"/uuid-csv/{UUID}")
+        )
+        return first, second, ms_apis.session_loop.get_loop()
+
+    try:
+        first, second, session_loop = asyncio.run(main())
+    finally:
+        ms_apis.session_loop.detach()
+
+    assert first[0]["status"] == 200
+    assert b"AI123123123" in b"".join(message.get("body", b"") for message in first)
+    assert second[0]["status"] == 200
+    assert b"1\xec\x9c\x84" in b"".join(message.get("body", b"") for message in second)
+    # requests ran on the server loop, not on a loop thread of their own
+    assert session_loop.is_closed()
+
+
+def test_replay_more_requests_than_threads_over_asgi(
+    replay: None, monkeypatch: pytest.MonkeyPatch
+):
+    # fetched records are written to the cache in the default executor
+    record_cache = MemoryRecordCache(1 << 20)
+    monkeypatch.setattr(ms_apis, "record_cache", record_cache)
+    app = AsgiApp(create_app(), max_threads=2)
+
+    async def main() -> t.List[t.List[t.Dict[str, t.Any]]]:
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(2))
+        return await asyncio.wait_for(
+            asyncio.gather(*(asgi_get(app, f"/uuid/{UUID}") for _ in range(6))),
+            timeout=10,
+        )
+
+    try:
+        responses = asyncio.run(main())
+    finally:
+        ms_apis.session_loop.detach()
+        app.executor.shutdown(wait=False)
+
+    assert [messages[0]["status"] for messages in responses] == [200] * 6
+    assert record_cache.get(UUID) is not None
@@ -0,0 +1,199 @@
+import asyncio
+import contextvars
+import typing as t
+
+from src.sessions import BackgroundLoop, LobbyPool, LobbySession, SingleFlight
+
+
+class FakeSession(LobbySession):
+    def __init__(self):
+        super().__init__(lobby=None, channel=None, client_version="web-0.0.0")
+        self.closed = False
+
+    def is_connected(self) -> bool:
+        return not self.broken
+
+    async def close(self) -> None:
+        self.broken = True
+        self.closed = True
+
+
+def make_pool(**kwargs: t.Any) -> t.Tuple[LobbyPool, t.List[FakeSession]]:
+    sessions = []  # type: t.List[FakeSession]
+
+    async def factory() -> LobbySession:
+        session = FakeSession()
+        sessions.append(session)
+        return session
+
+    return LobbyPool(factory, **kwargs), sessions
+
+
+def test_pool_reuses_session():
+    pool, sessions = make_pool(size=1)
+
+    async def main():
+        for _ in range(3):
+            await pool.run(lambda session: asyncio.sleep(0, result=session))
+
+    asyncio.run(main())
+    assert len(sessions) == 1
+    assert pool.stats()["opened"] == 1
+    assert pool.stats()["idle"] == 1
+
+
+def test_pool_limits_concurrency():
+    pool, sessions = make_pool(size=2)
+    running = []  # type: t.List[int]
+    peak = [0]
+
+    async def call(session: LobbySession) -> None:
+        running.append(1)
+        peak[0] = max(peak[0], len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+
+    async def main():
+        await asyncio.gather(*(pool.run(call) for _ in range(6)))
+
+    asyncio.run(main())
+    assert peak[0] == 2
+    assert len(sessions) == 2
+
+
+def test_pool_shares_sessions_between_calls():
+    pool, sessions = make_pool(size=2, max_in_flight=3)
+    running = []  # type: t.List[int]
+    peak = [0]
+
+    async def call(session: LobbySession) -> None:
+        running.append(1)
+        peak[0] = max(peak[0], len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+
+    async def main():
+        await asyncio.gather(*(pool.run(call) for _ in range(3)))
+        assert len(sessions) == 1
+        await asyncio.gather(*(pool.run(call) for _ in range(9)))
+
+    asyncio.run(main())
+    assert peak[0] == 6
+    assert len(sessions) == 2
+    assert pool.stats()["idle"] == 2
+
+
+def test_pool_closes_dropped_shared_session_after_last_call():
+    pool, sessions = make_pool(size=1, max_in_flight=2)
+
+    async def drop(session: LobbySession) -> None:
+        await asyncio.sleep(0)
+        raise ConnectionResetError()
+
+    async def wait(session: LobbySession) -> None:
+        await asyncio.sleep(0.01)
+        assert not t.cast(FakeSession, session).closed
+
+    async def main():
+        return await asyncio.gather(
+            pool.run(drop, retries=0), pool.run(wait), return_exceptions=True
+        )
+
+    dropped, waited = asyncio.run(main())
+    assert isinstance(dropped, ConnectionResetError)
+    assert waited is None
+    assert sessions[0].closed
+    assert pool.stats()["sessions"] == 0
+    assert pool.stats()["discarded"] == 1
+
+
+def test_pool_replaces_dropped_session():
+    pool, sessions = make_pool(size=1)
+    calls = [0]
+
+    async def call(session: LobbySession) -> str:
+        calls[0] += 1
+        if calls[0] == 1:
+            raise ConnectionResetError()
+        return session.client_version
+
+    result = asyncio.run(pool.run(call))
+    assert result == "web-0.0.0"
+    assert len(sessions) == 2
+    assert sessions[0].closed
+    assert pool.stats()["failures"] == 1
+
+
+def test_pool_replaces_expired_session():
+    pool, sessions = make_pool(size=1, max_age=0)
+
+    async def main():
+        for _ in range(2):
+            await pool.run(lambda session: asyncio.sleep(0))
+
+    asyncio.run(main())
+    assert len(sessions) == 2
+
+
+def test_background_loop_runs_from_other_loops():
+    loop = BackgroundLoop()
+
+    async def current_loop() -> asyncio.AbstractEventLoop:
+        return asyncio.get_running_loop()
+
+    first = asyncio.run(loop.run(current_loop()))
+    second = asyncio.run(loop.run(current_loop()))
+    assert first is second is loop.get_loop()
+
+
+def test_background_loop_copies_context():
+    loop = BackgroundLoop()
+    var = contextvars.ContextVar("var", default="unset")
+
+    async def get_var() -> str:
+        return var.get()
+
+    var.set("caller")
+    assert loop.submit(get_var()).result() == "caller"
+    assert asyncio.run(loop.run(get_var())) == "caller"
+
+
+def test_single_flight_shares_concurrent_calls():
+    single_flight = SingleFlight()
+    calls = [0]
+
+    async def fetch() -> int:
+        calls[0] += 1
+        await asyncio.sleep(0.01)
+        return calls[0]
+
+    async def main():
+        return await asyncio.gather(
+            *(single_flight.run("uuid", fetch) for _ in range(5)),
+            single_flight.run("other-uuid", fetch),
+        )
+
+    results = asyncio.run(main())
+    assert calls[0] == 2
+    assert len(set(results[:5])) == 1
+    assert single_flight.stats() == {"in_flight": 0, "calls": 2, "shared": 4}
+
+
+def test_single_flight_shares_errors_and_forgets_them():
+    single_flight = SingleFlight()
+
+    async def fail() -> None:
+        await asyncio.sleep(0)
+        raise ValueError("upstream")
+
+    async def main():
+        results = await asyncio.gather(
+            single_flight.run("uuid", fail),
+            single_flight.run("uuid", fail),
+            return_exceptions=True,
+        )
+        assert all(isinstance(result, ValueError) for result in results)
+        assert await single_flight.run("uuid", lambda: asyncio.sleep(0, result=1)) == 1
+
+    asyncio.run(main())
+    assert single_flight.calls == 2
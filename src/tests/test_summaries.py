@@ -0,0 +1,102 @@
+from src.records import make_log as make_game_log
+from src.summaries import (
+    SUMMARY_RECORD_NAMES,
+    GameSummary,
+    SummaryError,
+    make_csv_row,
+    summarize_game_record,
+    summarize_log,
+)
+from src.tests.factories import make_game_record, make_log
+
+
+def test_summarize_log():
+    summary = summarize_log(make_log())
+    assert isinstance(summary, GameSummary)
+    assert summary.status_code == 200
+    assert [(rank.nickname, rank.rank) for rank in summary.ranks] == [
+        ("AI123123123", 1),
+        ("ice_Mocha", 2),
+        ("BlackSeed", 3),
+        ("MightyMoon", 4),
+    ]
+    assert [(yaku.yaku, yaku.player.rank) for yaku in summary.noted_yakus] == [
+        ("국사무쌍", 1),
+        ("헤아림역만", 4),
+    ]
+    result = summary.to_dict()
+    assert result["result"] == "OK"
+    assert result["roomId"] == 20481
+    assert result["ranks"][3] == {
+        "id": 124782781,
+        "seat": 0,
+        "nickname": "MightyMoon",
+        "finalPoint": -13200,
+        "rank": 4,
+    }
+
+
+def test_make_csv_row():
+    summary = summarize_log(make_log())
+    assert make_csv_row(summary) == [
+        "2021년 8월 7일",
+        "AI123123123",
+        49300,
+        "ice_Mocha",
+        33600,
+        "BlackSeed",
+        30300,
+        "MightyMoon",
+        -13200,
+        20481,
+        "1위 국사무쌍/4위 헤아림역만",
+    ]
+
+
+def test_summarize_invalid_log():
+    summary = summarize_log({"error": {"code": 1203}})
+    assert isinstance(summary, SummaryError)
+    assert summary.status_code == 500
+    assert summary.to_dict()["errors"][0]["code"] == "cannot-get-log"
+    assert make_csv_row(summary) == [""] * 10 + ["Error: (Cannot get game log data.)"]
+
+
+def test_summarize_broken_log():
+    summary = summarize_log({"head": {}})
+    assert isinstance(summary, SummaryError)
+    assert summary.errors == [
+        {"code": "unexpected-exception", "message": "Unexpected exception."}
+    ]
+
+
+def test_summarize_log_ignores_unknown_fans():
+    log = make_log()
+    log["records"][0]["data"]["hules"][0]["fans"].append({"id": 999})
+    summary = summarize_log(log)
+    assert isinstance(summary, GameSummary)
+    assert summary.noted_yakus[0].yaku == "국사무쌍"
+
+
+def test_summarize_game_record():
+    res = make_game_record()
+    summary = summarize_game_record(res)
+    assert isinstance(summary, GameSummary)
+    assert summary == summarize_log(make_game_log(res, SUMMARY_RECORD_NAMES))
+    assert summary.noted_yakus[0].yaku == "국사무쌍"
+
+    # invalid games keep errors and log of summarize_log
+    res.head.config.category = 2
+    summary = summarize_game_record(res)
+    assert isinstance(summary, SummaryError)
+    assert summary == summarize_log(make_game_log(res))
+    assert summary.errors[0]["code"] == "invalid-category"
+    assert [record["name"] for record in summary.data["records"]] == [
+        "RecordNewRound",
+        "RecordHule",
+    ]
+
+    res = make_game_record()
+    res.error.code = 1203
+    summary = summarize_game_record(res)
+    assert isinstance(summary, SummaryError)
+    assert summary.errors[0]["code"] == "cannot-get-log"
@@ -0,0 +1,95 @@
+import json
+import typing as t
+
+from src.tests.factories import make_log
+from src.validations import (
+    Rule,
+    Ruleset,
+    compile_ruleset,
+    load_rulesets,
+    validate_log,
+)
+
+
+def test_validate_log():
+    assert validate_log(make_log()) == (True, [])
+
+    data = make_log()
+    data["head"]["config"]["mode"] = {
+        "mode": 1,
+        "detailRule": {"fandian": 25000, "doraCount": 3, "timeFixed": 60},
+    }
+    data["head"]["accounts"].pop()
+    is_valid, errors = validate_log(data)
+    assert not is_valid
+    assert [error["code"] for error in errors] == [
+        "invalid-player-count",
+        "invalid-mode",
+        "invalid-min-points-to-win",
+        "invalid-thinking-time-fixed",
+    ]
+    assert errors[1] == {
+        "code": "invalid-mode",
+        "message": "Invalid mode: 1. It should be " "4-Player Two-Wind Match Mode(2).",
+        "data": 1,
+    }
+
+    data = make_log()
+    del data["head"]["config"]["meta"]["roomId"]
+    assert validate_log(data)[1][0]["code"] == "missing-room-id"
+
+
+def test_compile_ruleset():
+    validate = compile_ruleset(
+        Ruleset(
+            name="league",
+            player_count=None,
+            rules=(
+                Rule(
+                    code="invalid-min-points-to-win",
+                    name="min points to win",
+                    path=("mode", "detailRule", "fandian"),
+                    expected_value=25000,
+                ),
+                Rule(
+                    code="invalid-red-dora",
+                    name="red dora",
+                    path=("mode", "detailRule", "doraCount"),
+                    expected_value=0,
+                ),
+            ),
+        )
+    )
+    data = make_log()
+    data["head"]["accounts"].pop()
+    is_valid, errors = validate(data)
+    assert not is_valid
+    # missing optional fields and player count are not checked
+    assert [error["code"] for error in errors] == ["invalid-min-points-to-win"]
+
+
+def test_load_rulesets(tmp_path: t.Any):
+    path = tmp_path / "rulesets.json"
+    path.write_text(
+        json.dumps(
+            {
+                "league": {
+                    "player_count": 4,
+                    "rules": [
+                        {
+                            "code": "invalid-category",
+                            "name": "category",
+                            "path": "category",
+                            "expected_value": 2,
+                            "required": True,
+                        }
+                    ],
+                }
+            }
+        )
+    )
+    rulesets = load_rulesets(str(path))
+    assert rulesets["league"].rules[0].path == ("category",)
+    is_valid, errors = compile_ruleset(rulesets["league"])(make_log())
+    assert not is_valid
+    assert errors[0]["code"] == "invalid-category"
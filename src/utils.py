@@ -1,13 +1,13 @@
 from io import StringIO
 import csv
 import typing as t
-from flask import make_response
+from flask import Response, make_response
 
 if t.TYPE_CHECKING:
-    from flask.wrappers import Response
+    from flask.wrappers import Response as ResponseType
 
 
-def csv_response(rows: t.Iterable) -> "Response":
+def csv_response(rows: t.Iterable) -> "ResponseType":
     """Make rows to Flask Response
 
     Args:
@@ -23,3 +23,37 @@ def csv_response(rows: t.Iterable) -> "Response":
     res.headers["Content-Disposition"] = "attachment; filename=export.csv"
     res.headers["Content-type"] = "text/csv"
     return res
+
+
+def iter_csv_lines(table: t.Iterable[t.Iterable]) -> t.Iterator[str]:
+    """Write each row to csv line as soon as it is available
+
+    Args:
+        table (Iterable[Iterable]): rows to write csv file
+
+    Yields:
+        str: csv line of each row
+    """
+    si = StringIO()
+    cw = csv.writer(si)
+    for rows in table:
+        cw.writerow(rows)
+        yield si.getvalue()
+        si.seek(0)
+        si.truncate()
+
+
+def csv_stream_response(table: t.Iterable[t.Iterable]) -> "ResponseType":
+    """Make table of rows to streaming Flask Response
+
+    Rows are consumed lazily while the response is sent, one line per row.
+
+    Args:
+        table (Iterable[Iterable]): rows to write csv file
+
+    Returns:
+        Response: Flask Response
+    """
+    res = Response(iter_csv_lines(table), mimetype="text/csv")
+    res.headers["Content-Disposition"] = "attachment; filename=export.csv"
+    return res
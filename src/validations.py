@@ -1,3 +1,4 @@
+import json
 import typing as t
 
 ValidationError = t.NewType("ValidationError", t.Dict[str, t.Any])
@@ -30,7 +31,7 @@ def make_invalid_value_error(
     name: str,
     value: t.Any,
     expected_value: t.Any,
-    expected_value_hint: str = None,
+    expected_value_hint: t.Optional[str] = None,
 ) -> ValidationError:
     """Make error object for invalid value
 
@@ -61,7 +62,7 @@ def validate_value(
     name: str,
     value: t.Any,
     expected_value: t.Any,
-    expected_value_hint: str = None,
+    expected_value_hint: t.Optional[str] = None,
 ) -> None:
     """Validate value
 
@@ -87,151 +88,217 @@ def validate_value(
         )
 
 
-def validate_log(data: t.Dict) -> t.Tuple[bool, t.List[ValidationError]]:
-    """Validate log data
+class Rule(t.NamedTuple):
+    """Expected value of a field of game config
 
-    Args:
-        data (Dict): [description]
-
-    Returns:
-        List[ValidationError]: [description]
+    Fields with default values are omitted from log, so rules of missing
+    fields are skipped unless they are required.
     """
-    errors = []
-
-    if "error" in data:
-        errors.append(
-            make_validation_error(
-                code="cannot-get-log", message="Cannot get game log data."
-            )
-        )
-        return False, errors
-
-    head = data["head"]
 
-    accounts = head["accounts"]
+    code: str
+    name: str
+    # keys from head.config to field
+    path: t.Tuple[str, ...]
+    expected_value: t.Any
+    expected_value_hint: t.Optional[str] = None
+    required: bool = False
 
-    validate_value(
-        errors=errors,
-        code="invalid-player-count",
-        name="player count",
-        value=len(accounts),
-        expected_value=4,
-    )
 
-    if "roomId" not in head["config"]["meta"]:
-        errors.append(
-            make_validation_error(code="missing-room-id", message="roomId is missing.")
-        )
-        return False, errors
-
-    validate_value(
-        errors=errors,
-        code="invalid-category",
-        name="category",
-        value=head["config"]["category"],
-        expected_value=1,
-        expected_value_hint="Friendly Match",
-    )
+class Ruleset(t.NamedTuple):
+    """Rules a game should follow, such as rules of a league"""
 
-    validate_value(
-        errors=errors,
-        code="invalid-mode",
-        name="mode",
-        value=head["config"]["mode"]["mode"],
-        expected_value=2,
-        expected_value_hint="4-Player Two-Wind Match Mode",
-    )
+    name: str
+    player_count: t.Optional[int]
+    rules: t.Tuple[Rule, ...]
 
-    rule = head["config"]["mode"]["detailRule"]
 
-    if "bianjietishi" in rule:
-        validate_value(
-            errors=errors,
+DEFAULT_RULESET = Ruleset(
+    name="default",
+    player_count=4,
+    rules=(
+        Rule(
+            code="invalid-category",
+            name="category",
+            path=("category",),
+            expected_value=1,
+            expected_value_hint="Friendly Match",
+            required=True,
+        ),
+        Rule(
+            code="invalid-mode",
+            name="mode",
+            path=("mode", "mode"),
+            expected_value=2,
+            expected_value_hint="4-Player Two-Wind Match Mode",
+            required=True,
+        ),
+        Rule(
             code="invalid-tips",
             name="tips",
-            value=rule["bianjietishi"],
+            path=("mode", "detailRule", "bianjietishi"),
             expected_value=True,
-        )
-
-    if "doraCount" in rule:
-        validate_value(
-            errors=errors,
+        ),
+        Rule(
             code="invalid-red-dora",
             name="red dora",
-            value=rule["doraCount"],
+            path=("mode", "detailRule", "doraCount"),
             expected_value=3,
-        )
-
-    if "fandian" in rule:
-        validate_value(
-            errors=errors,
+        ),
+        Rule(
             code="invalid-min-points-to-win",
             name="min points to win",
-            value=rule["fandian"],
+            path=("mode", "detailRule", "fandian"),
             expected_value=30000,
-        )
-
-    if "fanfu" in rule:
-        validate_value(
-            errors=errors,
+        ),
+        Rule(
             code="invalid-min-han",
             name="min han",
-            value=rule["fanfu"],
+            path=("mode", "detailRule", "fanfu"),
             expected_value=1,
-        )
-
-    if "initPoint" in rule:
-        validate_value(
-            errors=errors,
+        ),
+        Rule(
             code="invalid-starting-points",
             name="starting points",
-            value=rule["initPoint"],
+            path=("mode", "detailRule", "initPoint"),
             expected_value=25000,
-        )
-
-    if "shiduan" in rule:
-        validate_value(
-            errors=errors,
+        ),
+        Rule(
             code="invalid-open-tanyao",
             name="open tanyao",
-            value=rule["shiduan"],
+            path=("mode", "detailRule", "shiduan"),
             expected_value=1,
-        )
-
-    if "guyiMode" in rule:
-        validate_value(
-            errors=errors,
+        ),
+        Rule(
             code="invalid-local-yaku",
             name="local yaku",
-            value=rule["guyiMode"],
+            path=("mode", "detailRule", "guyiMode"),
             expected_value=0,
-        )
-
-    if "openHand" in rule:
-        validate_value(
-            errors=errors,
+        ),
+        Rule(
             code="invalid-open-hand",
             name="open hand",
-            value=rule["openHand"],
+            path=("mode", "detailRule", "openHand"),
             expected_value=0,
-        )
-
-    if "timeAdd" in rule:
-        validate_value(
-            errors=errors,
+        ),
+        Rule(
             code="invalid-thinking-time-add",
             name="thinking time(add)",
-            value=rule["timeAdd"],
+            path=("mode", "detailRule", "timeAdd"),
             expected_value=20,
-        )
-
-    if "timeFixed" in rule:
-        validate_value(
-            errors=errors,
+        ),
+        Rule(
             code="invalid-thinking-time-fixed",
             name="thinking time(fixed)",
-            value=rule["timeFixed"],
+            path=("mode", "detailRule", "timeFixed"),
             expected_value=5,
+        ),
+    ),
+)
+
+Validator = t.Callable[[t.Dict], t.Tuple[bool, t.List[ValidationError]]]
+
+_MISSING = object()
+
+
+def compile_ruleset(ruleset: Ruleset) -> Validator:
+    """Compile ruleset into function validating log data
+
+    Rules are grouped by the object holding their fields, so each object of
+    config is looked up once per log however many rules read it. Errors keep
+    the order of rules.
+
+    Args:
+        ruleset (Ruleset): rules to validate
+
+    Returns:
+        Validator: function returning whether log is valid and its errors
+    """
+    groups = {}  # type: t.Dict[t.Tuple[str, ...], t.List[t.Tuple[str, Rule]]]
+    for rule in ruleset.rules:
+        groups.setdefault(rule.path[:-1], []).append((rule.path[-1], rule))
+    compiled_groups = tuple((parent, tuple(rules)) for parent, rules in groups.items())
+    player_count = ruleset.player_count
+
+    def validate(data: t.Dict) -> t.Tuple[bool, t.List[ValidationError]]:
+        errors = []  # type: t.List[ValidationError]
+
+        if "error" in data:
+            errors.append(
+                make_validation_error(
+                    code="cannot-get-log", message="Cannot get game log data."
+                )
+            )
+            return False, errors
+
+        head = data["head"]
+
+        if player_count is not None:
+            validate_value(
+                errors=errors,
+                code="invalid-player-count",
+                name="player count",
+                value=len(head["accounts"]),
+                expected_value=player_count,
+            )
+
+        config = head["config"]
+
+        if "roomId" not in config["meta"]:
+            errors.append(
+                make_validation_error(
+                    code="missing-room-id", message="roomId is missing."
+                )
+            )
+            return False, errors
+
+        for parent, rules in compiled_groups:
+            fields = config
+            for key in parent:
+                fields = fields[key]
+            for key, rule in rules:
+                value = fields[key] if rule.required else fields.get(key, _MISSING)
+                if value is not _MISSING and value != rule.expected_value:
+                    errors.append(
+                        make_invalid_value_error(
+                            code=rule.code,
+                            name=rule.name,
+                            value=value,
+                            expected_value=rule.expected_value,
+                            expected_value_hint=rule.expected_value_hint,
+                        )
+                    )
+
+        return not errors, errors
+
+    return validate
+
+
+def load_rulesets(path: str) -> t.Dict[str, Ruleset]:
+    """Load rulesets from json file
+
+    File maps ruleset names to objects with ``player_count`` (null to skip
+    the check) and ``rules``, a list of objects with fields of Rule whose
+    ``path`` is a dotted path like ``mode.detailRule.fandian``.
+
+    Args:
+        path (str): path of json file
+
+    Returns:
+        Dict[str, Ruleset]: ruleset of each name
+    """
+    with open(path, encoding="utf-8") as f:
+        definitions = json.load(f)
+    return {
+        name: Ruleset(
+            name=name,
+            player_count=definition.get("player_count"),
+            rules=tuple(
+                Rule(**dict(rule, path=tuple(rule["path"].split("."))))
+                for rule in definition["rules"]
+            ),
         )
+        for name, definition in definitions.items()
+    }
+
 
-    return not bool(errors), errors
+validate_log = compile_ruleset(DEFAULT_RULESET)